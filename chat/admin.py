@@ -5,7 +5,7 @@ class MessageInline(admin.TabularInline):
     model = Message
     extra = 0
     readonly_fields = ('created_at',)
-    fields = ('content', 'sender', 'sender_username', 'is_read', 'created_at')
+    fields = ('content', 'sender', 'sender_username', 'created_at')
     ordering = ('-created_at',)
 
 @admin.register(Conversation)
@@ -24,8 +24,8 @@ class ConversationAdmin(admin.ModelAdmin):
 
 @admin.register(Message)
 class MessageAdmin(admin.ModelAdmin):
-    list_display = ('id', 'get_user_id', 'content_preview', 'sender', 'is_read', 'created_at')
-    list_filter = ('sender', 'is_read', 'created_at')
+    list_display = ('id', 'get_user_id', 'content_preview', 'sender', 'created_at')
+    list_filter = ('sender', 'created_at')
     search_fields = ('content', 'sender_username', 'conversation__user_id')
     readonly_fields = ('id', 'created_at')
     list_select_related = ('conversation',)
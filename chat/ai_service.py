@@ -5,13 +5,19 @@ import logging
 from django.conf import settings
 from django.utils import timezone
 from scribble.memory_system import MemorySystem
+from scribble import llm_governor, retrieval
+from scribble.connections import release_connection
+from scribble.timing import stage
 
 # Set up logging
 logger = logging.getLogger(__name__)
 
+# Same location the ingest module writes the FAISS index to
+VECTOR_STORE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'vectorstore')
+
 class AIService:
     @staticmethod
-    def get_ai_response(user_message, conversation_history=None, session_id=None):
+    def get_ai_response(user_message, conversation_history=None, session_id=None, priority=llm_governor.NORMAL):
         """
         Get a response from the AI based on the user's message and conversation history
         using OpenRouter with document context and memory system.
@@ -20,15 +26,20 @@ class AIService:
             user_message (str): The user's message
             conversation_history (QuerySet, optional): QuerySet of previous messages
             session_id (str, optional): Session ID for memory management
+            priority (str, optional): llm_governor.HIGH for returning users
             
         Returns:
             dict: AI response containing message and timestamp
+        
+        Raises:
+            LLMOverloaded: No LLM call slot was available; answer with 503
         """
         # Initialize memory system
         memory_system = MemorySystem(session_id)
         
         # Add user message to memory
-        memory_system.add_user_message(user_message)
+        with stage('memory'):
+            memory_system.add_user_message(user_message)
         
         # Default response if AI service is not properly configured
         default_response = {
@@ -44,7 +55,7 @@ class AIService:
         
         # Check if OpenRouter API key is configured
         if not hasattr(settings, 'OPENROUTER_API_KEY') or not settings.OPENROUTER_API_KEY:
-            print("OpenRouter API key not configured")
+            logger.error("OpenRouter API key not configured")
             return default_response
         
         try:
@@ -69,13 +80,15 @@ class AIService:
             messages.append({"role": "system", "content": system_message})
             
             # Add conversation history from both database and memory system
-            if conversation_history:
-                for msg in conversation_history:
-                    role = "user" if msg.sender == 'user' else "assistant"
-                    messages.append({"role": role, "content": msg.content})
+            with stage('history'):
+                if conversation_history:
+                    for msg in conversation_history:
+                        role = "user" if msg.sender == 'user' else "assistant"
+                        messages.append({"role": role, "content": msg.content})
             
             # Add memory context
-            memory_context = memory_system.get_conversation_context()
+            with stage('memory'):
+                memory_context = memory_system.get_conversation_context()
             if memory_context:
                 # Add memory context after system message but before conversation history
                 messages.extend(memory_context[1:])  # Skip the system message as we have our own
@@ -84,33 +97,34 @@ class AIService:
             messages.append({"role": "user", "content": user_message})
             
             # Get relevant document context from local FAISS vector store
-            from langchain_huggingface import HuggingFaceEmbeddings
-            from langchain_community.vectorstores import FAISS
+            from scribble.embedding_cache import get_query_embeddings
+            from scribble.views import get_vector_store
             from django.conf import settings
             
             try:
                 # Load the local FAISS vector store
-                embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
-                
-                # Use the same path as the ingest module
-                from pathlib import Path
-                PROJECT_ROOT = Path(__file__).resolve().parent.parent
-                vectorstore_path = str(PROJECT_ROOT / "vectorstore")
-                
-                # Check if vector store exists and has required files
-                index_file = os.path.join(vectorstore_path, 'index.faiss')
-                pkl_file = os.path.join(vectorstore_path, 'index.pkl')
-                
-                if not os.path.exists(index_file) or not os.path.exists(pkl_file):
-                    raise ValueError(f"Vector store not found at {vectorstore_path}. Documents exist in database but haven't been processed into vector store yet. Please run document processing first.")
-                
-                try:
-                    vectorstore = FAISS.load_local(vectorstore_path, embeddings, allow_dangerous_deserialization=True)
-                except Exception as load_error:
-                    raise ValueError(f"Failed to load vector store: {str(load_error)}. The vector store may be corrupted. Please re-process the documents.")
+                with stage('vectorstore_load'):
+                    # Loaded once per process; repeated queries skip the model
+                    embeddings = get_query_embeddings()
+                    
+                    vectorstore_path = VECTOR_STORE_PATH
+                    
+                    # Check if vector store exists and has required files
+                    index_file = os.path.join(vectorstore_path, 'index.faiss')
+                    pkl_file = os.path.join(vectorstore_path, 'index.pkl')
+                    
+                    if not os.path.exists(index_file) or not os.path.exists(pkl_file):
+                        raise ValueError(f"Vector store not found at {vectorstore_path}. Documents exist in database but haven't been processed into vector store yet. Please run document processing first.")
+                    
+                    try:
+                        # Process-wide store, loaded at worker warm-up and
+                        # reloaded when the index on disk is rewritten
+                        vectorstore = get_vector_store()
+                    except Exception as load_error:
+                        raise ValueError(f"Failed to load vector store: {str(load_error)}. The vector store may be corrupted. Please re-process the documents.")
                 
                 # Get relevant document chunks with scores
-                relevant_docs = vectorstore.similarity_search_with_score(user_message, k=5)
+                relevant_docs = retrieval.search(vectorstore, user_message, 5, vectorstore_path, embeddings)
                 
                 # Filter out low relevance documents (score > 0.8)
                 relevant_docs = [doc for doc, score in relevant_docs if score < 0.8]
@@ -119,13 +133,14 @@ class AIService:
                     raise ValueError("No relevant documents found for the query.")
                 
                 # Prepare context from relevant documents with source information
-                context_parts = []
-                for i, doc in enumerate(relevant_docs, 1):
-                    # Clean up the content
-                    content = doc.page_content.strip()
-                    if not content:
-                        continue
-                    context_parts.append(f"--- DOCUMENT EXCERPT {i} ---\n{content}")
+                with stage('prompt_build'):
+                    context_parts = []
+                    for i, doc in enumerate(relevant_docs, 1):
+                        # Clean up the content
+                        content = doc.page_content.strip()
+                        if not content:
+                            continue
+                        context_parts.append(f"--- DOCUMENT EXCERPT {i} ---\n{content}")
                 
                 if not context_parts:
                     raise ValueError("No relevant content found in the documents.")
@@ -160,7 +175,7 @@ class AIService:
                 messages[-1]['content'] = enhanced_message
                 
             except Exception as e:
-                print(f"Error retrieving document context: {str(e)}")
+                logger.error(f"Error retrieving document context: {str(e)}")
                 return {
                     'message': "I'm having trouble accessing my business records right now. Please try again in a moment, and I'll be happy to help you with any questions about my services.",
                     'timestamp': timezone.now().isoformat(),
@@ -219,13 +234,15 @@ Respond as Uche, the business owner, using the information from your documents a
                     headers["X-Title"] = settings.OPENROUTER_HEADERS["X-Title"]
             
             # Call OpenRouter API with timeout and better error handling
+            release_connection()
             try:
-                response = requests.post(
-                    "https://openrouter.ai/api/v1/chat/completions",
-                    headers=headers,
-                    json=payload,
-                    timeout=60  # Increased timeout to 60 seconds
-                )
+                with llm_governor.llm_slot(priority), stage('llm'):
+                    response = requests.post(
+                        f"{getattr(settings, 'OPENROUTER_BASE_URL', 'https://openrouter.ai/api/v1')}/chat/completions",
+                        headers=headers,
+                        json=payload,
+                        timeout=60  # Increased timeout to 60 seconds
+                    )
                 response.raise_for_status()
             except requests.exceptions.Timeout:
                 raise Exception("The request to the AI service timed out. Please try again.")
@@ -271,10 +288,7 @@ Respond as Uche, the business owner, using the information from your documents a
                     documents_uploaded = True
                 
                 # Also check if vector store exists
-                from pathlib import Path
-                PROJECT_ROOT = Path(__file__).resolve().parent.parent
-                vectorstore_path = str(PROJECT_ROOT / "vectorstore")
-                vectorstore_exists = os.path.exists(vectorstore_path)
+                vectorstore_exists = os.path.exists(VECTOR_STORE_PATH)
                 
                 if not documents_uploaded or not vectorstore_exists:
                     return {
@@ -284,7 +298,7 @@ Respond as Uche, the business owner, using the information from your documents a
                         'needs_document': True
                     }
             except Exception as e:
-                print(f"Error checking document status: {str(e)}")
+                logger.error(f"Error checking document status: {str(e)}")
                 return {
                     'message': "I'm having trouble accessing my business records right now. Please try again in a moment, and I'll be happy to help you with any questions about my services.",
                     'timestamp': timezone.now().isoformat(),
@@ -293,7 +307,8 @@ Respond as Uche, the business owner, using the information from your documents a
                 }
                 
             # Add AI response to memory
-            memory_system.add_assistant_message(ai_message)
+            with stage('memory'):
+                memory_system.add_assistant_message(ai_message)
             
             return {
                 'message': ai_message,
@@ -313,18 +328,18 @@ Respond as Uche, the business owner, using the information from your documents a
                     error_msg += f"\nError Details: {error_details}"
                 except:
                     error_msg += f"\nResponse Text: {e.response.text}"
-            print(error_msg)
+            logger.error(error_msg)
             return {
                 'message': "I'm having trouble connecting to the AI service. Please try again in a moment.",
                 'timestamp': timezone.now().isoformat(),
                 'model': getattr(settings, 'OPENROUTER_MODEL', 'default-model'),
                 'error': error_msg[:200]  # Return first 200 chars of error for debugging
             }
+        except llm_governor.LLMOverloaded:
+            raise
         except Exception as e:
             error_msg = f"Unexpected error: {str(e)} (Type: {type(e).__name__})"
-            print(error_msg)
-            import traceback
-            traceback.print_exc()
+            logger.exception(error_msg)
             return {
                 'message': "I encountered an unexpected error. The developers have been notified.",
                 'timestamp': timezone.now().isoformat(),
@@ -1,4 +1,3 @@
-import time
 import logging
 from rest_framework.views import APIView
 
@@ -12,7 +11,9 @@ from django.conf import settings
 from .ai_service import AIService
 from .models import Message, Conversation, KnowledgeDocument
 from .serializers import MessageSerializer, DocumentSerializer
-from .document_processor import DocumentProcessor
+from scribble.persistence import persist_turn
+from scribble import anonymous, llm_governor
+from scribble.throttling import HistoryThrottle, LLMThrottle
 from rest_framework.parsers import MultiPartParser, FormParser
 
 class ChatAPIHome(APIView):
@@ -68,6 +69,7 @@ class DocumentUploadView(APIView):
             
             # Process document in background
             import threading
+            from .document_processor import DocumentProcessor
             processor = DocumentProcessor()
             thread = threading.Thread(
                 target=processor.process_document,
@@ -116,6 +118,7 @@ class DocumentUploadView(APIView):
 class SendMessageView(APIView):
     authentication_classes = []  # Disable authentication
     permission_classes = [AllowAny]  # Explicitly allow any access
+    throttle_classes = [LLMThrottle]
 
     def options(self, request, *args, **kwargs):
         # Handle preflight requests
@@ -136,7 +139,9 @@ class SendMessageView(APIView):
         response['Access-Control-Allow-Methods'] = 'GET, POST, PUT, PATCH, DELETE, OPTIONS'
         response['Access-Control-Allow-Headers'] = 'Content-Type, Authorization, X-CSRFToken'
         
-        user_id = request.data.get('user_id') or f'anonymous_{int(time.time())}'
+        # Without a user_id, the visitor's anonymous id keeps their turns in
+        # one conversation (a timestamp used to merge and split visitors)
+        user_id = request.data.get('user_id') or f'anonymous_{anonymous.get_anonymous_id(request)}'
         message_content = request.data.get('message')
         
         if not message_content:
@@ -146,33 +151,44 @@ class SendMessageView(APIView):
         
         try:
             # Get or create conversation without any authentication
-            conversation, _ = Conversation.objects.get_or_create(
+            conversation, created = Conversation.objects.get_or_create(
                 user_id=user_id,
                 defaults={'status': 'active'}
             )
             
-            # Save user message
-            message = Message.objects.create(
+            # Build the user message now so its timestamp reflects when it was
+            # received; it is saved together with the AI reply below
+            message = Message(
                 conversation=conversation,
                 content=message_content,
                 sender='user',
                 sender_username=user_id
             )
             
-            # Get AI response - let the AIService handle document checking
+            # Get AI response - let the AIService handle document checking.
+            # The current message is appended by the service itself.
+            conversation_history = Message.objects.none() if created else (
+                Message.objects.filter(conversation=conversation)
+                .only('sender', 'content')
+                .order_by('created_at')
+            )
+            # Returning users are served first when the LLM is at capacity
             ai_response = AIService.get_ai_response(
                 message_content,
-                conversation_history=Message.objects.filter(conversation=conversation).order_by('created_at')
+                conversation_history=conversation_history,
+                priority=llm_governor.NORMAL if created else llm_governor.HIGH
             )
             
-            # Save AI response to the database
-            ai_message = Message.objects.create(
+            ai_message = Message(
                 conversation=conversation,
                 content=ai_response['message'],
                 sender='ai',
                 sender_username='ai_assistant'
             )
             
+            # Save both messages and touch the conversation in one transaction
+            message, ai_message = persist_turn(conversation, [message, ai_message])
+            
             response_data = {
                     'status': 'success',
                     'message': 'Message sent successfully',
@@ -191,6 +207,11 @@ class SendMessageView(APIView):
             response.status_code = status.HTTP_201_CREATED
             return response
             
+        except llm_governor.LLMOverloaded as e:
+            response.data = {'error': str(e), 'retry_after': e.retry_after}
+            response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+            response['Retry-After'] = str(e.retry_after)
+            return response
         except Exception as e:
             response.data = {'error': str(e)}
             response.status_code = status.HTTP_500_INTERNAL_SERVER_ERROR
@@ -252,6 +273,7 @@ class AdminMessageAPI(APIView):
 class GetMessagesView(APIView):
     authentication_classes = []  # Disable authentication
     permission_classes = []  # No permissions required
+    throttle_classes = [HistoryThrottle]
 
     def options(self, request, *args, **kwargs):
         # Handle preflight requests
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.5 on 2026-10-19 03:31
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def backfill_watermarks(apps, schema_editor):
+    # Each side's watermark starts at the newest message of the other side it
+    # had read; is_read is dropped afterwards
+    Message = apps.get_model('chat', 'Message')
+    ReadWatermark = apps.get_model('chat', 'ReadWatermark')
+    for role, read_messages in (
+        ('admin', Message.objects.filter(is_read=True, sender='user')),
+        ('user', Message.objects.filter(is_read=True).exclude(sender='user')),
+    ):
+        newest = read_messages.order_by().values('conversation_id').annotate(newest=models.Max('id'))
+        ReadWatermark.objects.bulk_create(
+            [ReadWatermark(conversation_id=row['conversation_id'], role=role, last_read_message_id=row['newest'])
+             for row in newest.iterator()],
+            batch_size=1000,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0002_knowledgedocument'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReadWatermark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('role', models.CharField(choices=[('admin', 'Admin'), ('user', 'User')], max_length=10)),
+                ('last_read_message_id', models.BigIntegerField(default=0)),
+                ('read_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('conversation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='read_watermarks', to='chat.conversation')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('conversation', 'role'), name='chat_readwatermark_unique_role')],
+            },
+        ),
+        migrations.RunPython(backfill_watermarks, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='message',
+            name='is_read',
+        ),
+    ]
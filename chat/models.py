@@ -64,7 +64,6 @@ class Message(models.Model):
     content = models.TextField(validators=[MinLengthValidator(1)])
     sender = models.CharField(max_length=10, choices=SENDER_CHOICES)
     sender_username = models.CharField(max_length=255, blank=True, null=True)
-    is_read = models.BooleanField(default=False)
     created_at = models.DateTimeField(default=timezone.now)
     
     class Meta:
@@ -77,9 +76,10 @@ class Message(models.Model):
         return f"{self.get_sender_display()}: {self.content[:50]}"
     
     def mark_as_read(self):
-        if not self.is_read:
-            self.is_read = True
-            self.save(update_fields=['is_read'])
+        """Mark this message, and everything before it, read by the other participant"""
+        from scribble import read_state
+        read_state.mark_read(self.conversation_id, read_state.reader_of(self.sender), up_to=self.pk,
+                             model=ReadWatermark)
     
     @classmethod
     def get_conversation_messages(cls, user_id):
@@ -89,3 +89,21 @@ class Message(models.Model):
             return cls.objects.filter(conversation=conversation)
         except Conversation.DoesNotExist:
             return cls.objects.none()
+
+
+class ReadWatermark(models.Model):
+    """Newest message a participant role has read in a conversation (see scribble/read_state.py)"""
+    ROLE_CHOICES = [('admin', 'Admin'), ('user', 'User')]
+
+    conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE, related_name='read_watermarks')
+    role = models.CharField(max_length=10, choices=ROLE_CHOICES)
+    last_read_message_id = models.BigIntegerField(default=0)
+    read_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['conversation', 'role'], name='chat_readwatermark_unique_role'),
+        ]
+
+    def __str__(self):
+        return f"{self.role} read conversation {self.conversation_id} up to message {self.last_read_message_id}"
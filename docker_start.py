@@ -1,24 +1,27 @@
 #!/usr/bin/env python3
 """
 Docker-specific startup script for Railway deployment
+
+Waits for the database, applies migrations and collects static files only
+when something changed (see scribble/startup.py), then replaces itself with
+gunicorn configured by gunicorn.conf.py. Workers warm up before accepting
+requests and /api/health/ready/ reports when they have.
 """
 import os
 import sys
-import subprocess
 import time
+from pathlib import Path
 
 def main():
     # Set Django settings module
     os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'scribbleintimeai.settings')
-    
-    # Get port from Railway environment
-    port = os.environ.get('PORT', '8080')
-    
+
+    started = time.perf_counter()
     print("Starting Docker deployment...")
-    
+
     # Create static directory if it doesn't exist
-    from pathlib import Path
-    static_dir = Path(__file__).resolve().parent / "static"
+    base_dir = Path(__file__).resolve().parent
+    static_dir = base_dir / "static"
     if not static_dir.exists():
         print("Creating static directory...")
         static_dir.mkdir(exist_ok=True)
@@ -26,102 +29,36 @@ def main():
         placeholder_file = static_dir / "placeholder.css"
         placeholder_file.write_text("/* Static files placeholder */")
         print("✓ Static directory created")
-    
-    # Wait for database to be ready (for Railway)
-    print("Waiting for database to be ready...")
-    time.sleep(5)  # Give database time to initialize
-    
-    # Run migrations with retry logic
-    print("Running database migrations...")
-    max_retries = 3
-    for attempt in range(max_retries):
-        try:
-            # First, try to make migrations to ensure all migration files are detected
-            print(f"Migration attempt {attempt + 1}: Making migrations...")
-            makemigrations_result = subprocess.run(
-                [sys.executable, 'manage.py', 'makemigrations'], 
-                capture_output=True, 
-                text=True,
-                timeout=30
-            )
-            if makemigrations_result.returncode == 0:
-                print("✓ Makemigrations completed")
-            else:
-                print(f"⚠ Makemigrations output: {makemigrations_result.stdout}")
-                print(f"⚠ Makemigrations errors: {makemigrations_result.stderr}")
-            
-            # Then run migrations
-            print(f"Migration attempt {attempt + 1}: Running migrations...")
-            result = subprocess.run(
-                [sys.executable, 'manage.py', 'migrate'], 
-                capture_output=True, 
-                text=True,
-                timeout=60
-            )
-            if result.returncode == 0:
-                print("✓ Migrations completed successfully")
-                print(f"Migration output: {result.stdout}")
-                break
-            else:
-                print(f"⚠ Migration attempt {attempt + 1} failed:")
-                print(f"  STDOUT: {result.stdout}")
-                print(f"  STDERR: {result.stderr}")
-                if attempt < max_retries - 1:
-                    print("Retrying in 10 seconds...")
-                    time.sleep(10)
-                else:
-                    print("⚠ Migrations failed, continuing anyway...")
-        except subprocess.TimeoutExpired:
-            print(f"⚠ Migration attempt {attempt + 1} timed out")
-            if attempt < max_retries - 1:
-                print("Retrying in 10 seconds...")
-                time.sleep(10)
-            else:
-                print("⚠ Migrations timed out, continuing anyway...")
-        except Exception as e:
-            print(f"⚠ Migration error: {e}")
-            if attempt < max_retries - 1:
-                print("Retrying in 10 seconds...")
-                time.sleep(10)
-            else:
-                print("⚠ Migrations failed, continuing anyway...")
-    
-    # Collect static files
-    print("Collecting static files...")
+
+    import django
+    django.setup()
+    from django.db import connections
+    from scribble.startup import prepare
+
     try:
-        result = subprocess.run(
-            [sys.executable, 'manage.py', 'collectstatic', '--noinput'], 
-            capture_output=True, 
-            text=True,
-            timeout=60
-        )
-        if result.returncode == 0:
-            print("✓ Static files collected successfully")
-        else:
-            print(f"⚠ Static files warning: {result.stderr}")
+        report = prepare()
     except Exception as e:
-        print(f"⚠ Static files error: {e}")
-    
-    # Start gunicorn
-    print(f"Starting server on port {port}...")
-    cmd = [
-        'gunicorn',
-        '--bind', f'0.0.0.0:{port}',
-        '--workers', '3',
-        '--timeout', '30',
-        '--access-logfile', '-',
-        '--error-logfile', '-',
-        '--log-level', 'info',
-        'scribbleintimeai.wsgi:application'
-    ]
-    
-    try:
-        subprocess.run(cmd, check=True)
-    except KeyboardInterrupt:
-        print("\nServer stopped by user")
-    except subprocess.CalledProcessError as e:
-        print(f"Error starting server: {e}")
+        # Exit non-zero so the platform restarts the container instead of
+        # serving against a missing or outdated schema
+        print(f"✗ Startup failed: {e}")
         sys.exit(1)
+    finally:
+        connections.close_all()
+
+    print(f"✓ Database ready after {report['database_attempts']} attempt(s) ({report['database_seconds']}s)")
+    if report['migrations_applied']:
+        print(f"✓ Applied {report['migrations_applied']} migrations ({report['migrate_seconds']}s)")
+    else:
+        print("✓ No pending migrations")
+    print(f"✓ Static files {report['collectstatic']} ({report['collectstatic_seconds']}s)")
+    print(f"Prepared in {time.perf_counter() - started:.2f}s, starting gunicorn...")
+    sys.stdout.flush()
+
+    # Replace this process so gunicorn receives the platform's signals directly.
+    # The metrics directory has to exist before gunicorn imports the app.
+    os.makedirs(os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', '/tmp/scribble-prometheus'), exist_ok=True)
+    os.chdir(base_dir)
+    os.execvp('gunicorn', ['gunicorn', '--config', 'gunicorn.conf.py', 'scribbleintimeai.wsgi:application'])
 
 if __name__ == '__main__':
-    main() 
\ No newline at end of file
+    main()
@@ -8,9 +8,38 @@ bind = f"0.0.0.0:{port}"
 backlog = 2048
 
 # Worker processes - use fewer workers for Railway
-workers = min(multiprocessing.cpu_count() * 2 + 1, 4)  # Max 4 workers for Railway
-worker_class = "sync"
+workers = int(os.environ.get('GUNICORN_WORKERS', min(multiprocessing.cpu_count() * 2 + 1, 4)))  # Max 4 workers for Railway
+# Threaded workers: a chat spends seconds waiting on the LLM, and with sync
+# workers each one blocked a whole process. gthread runs GUNICORN_THREADS
+# requests per worker, all sharing its embedding model and FAISS index.
+# GUNICORN_WORKER_CLASS=sync restores one request per worker.
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+
+def default_threads():
+    """
+    Threads per worker when GUNICORN_THREADS isn't set.
+
+    Without a connection pool (settings.py DB_POOL) every request thread keeps
+    its own persistent PostgreSQL connection, so workers * threads has to stay
+    within DB_MAX_CONNECTIONS, this instance's share of the server's
+    max_connections (100 by default on PostgreSQL).
+    """
+    if worker_class != 'gthread':
+        return 1
+    if not os.environ.get('DATABASE_URL'):
+        return 32
+    from importlib.util import find_spec
+    pool = os.environ.get('DB_POOL', 'auto').lower()
+    if pool == 'true' or (pool == 'auto' and find_spec('psycopg') and find_spec('psycopg_pool')):
+        # The pool caps connections per worker at DB_POOL_MAX_SIZE
+        return 32
+    budget = int(os.environ.get('DB_MAX_CONNECTIONS', '80'))
+    return max(1, min(32, budget // workers))
+
+# (gunicorn switches sync to gthread when threads > 1)
+threads = int(os.environ.get('GUNICORN_THREADS') or default_threads())
 worker_connections = 1000
+# With gthread this only bounds a stuck worker, not a slow request
 timeout = 30
 keepalive = 2
 
@@ -28,7 +57,7 @@ proc_name = "scribble-in-time-backend"
 
 # Server mechanics
 daemon = False
-pidfile = "/tmp/gunicorn.pid"
+pidfile = os.environ.get('GUNICORN_PIDFILE', '/tmp/gunicorn.pid')
 user = None
 group = None
 tmp_upload_dir = None
@@ -36,6 +65,16 @@ tmp_upload_dir = None
 # Preload app for better performance
 preload_app = True
 
+# Prometheus multiprocess mode: each worker writes its metrics to files in this
+# directory and /metrics merges them. Must be set before the app is imported.
+prometheus_multiproc_dir = os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', '/tmp/scribble-prometheus')
+# Reset it here, at config load: with preload_app the master imports the app
+# (and unlabelled metrics open their files) before on_starting runs. Dropping
+# files left by a previous run makes counters start from zero.
+import shutil
+shutil.rmtree(prometheus_multiproc_dir, ignore_errors=True)
+os.makedirs(prometheus_multiproc_dir, exist_ok=True)
+
 def when_ready(server):
     server.log.info(f"Server is ready. Spawning workers on port {port}")
 
@@ -49,7 +88,24 @@ def post_fork(server, worker):
     server.log.info("Worker spawned (pid: %s)", worker.pid)
 
 def post_worker_init(worker):
+    # Load the embedding model and FAISS index before this worker accepts
+    # requests. Done per worker rather than before forking: torch and FAISS
+    # thread pools don't survive fork. notify() keeps the arbiter from killing
+    # the worker for a slow load.
+    from django.conf import settings
+    if settings.STARTUP_WARMUP:
+        from scribble.startup import warm_up
+        state = warm_up(heartbeat=worker.notify)
+        worker.log.info("Worker warm-up %s in %ss (pid: %s)", state['state'], state['seconds'], worker.pid)
     worker.log.info("Worker initialized (pid: %s)", worker.pid)
 
+def child_exit(server, worker):
+    # Stop reporting live gauges for the dead worker; its counters are kept
+    try:
+        from prometheus_client import multiprocess
+    except ImportError:
+        return
+    multiprocess.mark_process_dead(worker.pid)
+
 def worker_abort(worker):
     worker.log.info("Worker aborted (pid: %s)", worker.pid) 
\ No newline at end of file
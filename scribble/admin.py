@@ -1,3 +1,4 @@
+from django import forms
 from django.contrib import admin
 from django.contrib.auth import get_user_model
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
@@ -15,7 +16,7 @@ class MessageInline(admin.TabularInline):
     model = Message
     extra = 1
     readonly_fields = ('created_at',)
-    fields = ('content', 'sender', 'is_read', 'created_at')
+    fields = ('content', 'sender', 'created_at')
     show_change_link = True
 
 @admin.register(Conversation)
@@ -29,8 +30,8 @@ class ConversationAdmin(admin.ModelAdmin):
 
 @admin.register(Message)
 class MessageAdmin(admin.ModelAdmin):
-    list_display = ('id', 'get_user_email', 'sender', 'is_read', 'created_at')
-    list_filter = ('sender', 'is_read', 'created_at')
+    list_display = ('id', 'get_user_email', 'sender', 'created_at')
+    list_filter = ('sender', 'created_at')
     search_fields = ('content', 'conversation__user__email')
     list_select_related = ('conversation__user',)
     date_hierarchy = 'created_at'
@@ -65,10 +66,28 @@ class AdminSettingsAdmin(admin.ModelAdmin):
         # Only allow one settings object per user
         return not AdminSettings.objects.exists()
 
+class KnowledgeDocumentForm(forms.ModelForm):
+    class Meta:
+        model = KnowledgeDocument
+        fields = '__all__'
+
+    def clean_file(self):
+        """Reject a file whose exact bytes are already in the knowledge base"""
+        uploaded_file = self.cleaned_data.get('file')
+        if uploaded_file and 'file' in self.changed_data:
+            _, existing = KnowledgeDocument.find_duplicate(uploaded_file, exclude_pk=self.instance.pk)
+            if existing:
+                raise forms.ValidationError(
+                    f"This file is identical to '{existing.title}' (uploaded "
+                    f"{existing.uploaded_at:%Y-%m-%d}), which is already in the knowledge base."
+                )
+        return uploaded_file
+
 @admin.register(KnowledgeDocument)
 class KnowledgeDocumentAdmin(admin.ModelAdmin):
+    form = KnowledgeDocumentForm
     list_display = ('file', 'uploaded_at', 'is_processed')
-    readonly_fields = ('uploaded_at', 'is_processed')
+    readonly_fields = ('uploaded_at', 'is_processed', 'content_hash')
     date_hierarchy = 'uploaded_at'
     actions = ['reprocess_documents']
     
@@ -1,5 +1,6 @@
 from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
+from django.http import StreamingHttpResponse
 from django.shortcuts import render
 from django.utils import timezone
 from django.utils.decorators import method_decorator
@@ -9,12 +10,19 @@ from rest_framework import viewsets, status, generics
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny, IsAdminUser
+from rest_framework.authentication import SessionAuthentication
+from rest_framework.views import APIView
 from django.db.models import Count, Q, F
 import json
 from datetime import timedelta
 
-from .models import Conversation, Message, Document
-from .serializers import ConversationSerializer, MessageSerializer, DocumentSerializer
+from .models import ArchivedConversation, Conversation, Message, Document
+from .serializers import (
+    ArchivedConversationSerializer, ConversationSerializer, MessageSerializer, DocumentSerializer,
+    MessageSearchResultSerializer,
+)
+from . import archive, exports, read_state, search as search_index
+from .stats import get_dashboard_stats
 
 
 class AdminDashboardView(TemplateView):
@@ -28,17 +36,14 @@ class AdminDashboardView(TemplateView):
         # Get the first 5 recent conversations
         recent_conversations = Conversation.objects.order_by('-updated_at')[:5]
         
-        # Get message statistics
-        total_messages = Message.objects.count()
-        messages_today = Message.objects.filter(
-            created_at__date=timezone.now().date()
-        ).count()
+        # Get message statistics from the daily rollups
+        dashboard_stats = get_dashboard_stats()
         
         context.update({
             'page_title': 'Dashboard',
             'recent_conversations': recent_conversations,
-            'total_messages': total_messages,
-            'messages_today': messages_today,
+            'total_messages': dashboard_stats['totals']['messages'],
+            'messages_today': dashboard_stats['today']['messages'],
             'active_tab': 'dashboard',
         })
         
@@ -49,41 +54,25 @@ class DashboardStatsView(generics.RetrieveAPIView):
     permission_classes = [IsAdminUser]
 
     def get(self, request, *args, **kwargs):
-        from django.db.models import Count, Q, F
-        from django.utils import timezone
-        from datetime import timedelta
-
-        # Get conversation statistics
-        total_conversations = Conversation.objects.count()
+        # Counters come from the precomputed daily rollups (see scribble/stats.py)
+        dashboard_stats = get_dashboard_stats()
+        totals, today = dashboard_stats['totals'], dashboard_stats['today']
         active_conversations = Conversation.objects.filter(is_active=True).count()
-        conversations_today = Conversation.objects.filter(
-            created_at__date=timezone.now().date()
-        ).count()
-
-        # Get message statistics
-        total_messages = Message.objects.count()
-        messages_today = Message.objects.filter(
-            created_at__date=timezone.now().date()
-        ).count()
-        ai_responses = Message.objects.filter(sender='ai').count()
 
         # Get recent conversations
-        recent_conversations = Conversation.objects.order_by('-updated_at')[:5]
-        
-        # Calculate AI response rate
-        ai_response_rate = (ai_responses / total_messages) * 100 if total_messages > 0 else 0
+        recent_conversations = Conversation.objects.with_summary().order_by('-updated_at')[:5]
 
         data = {
             'conversations': {
-                'total': total_conversations,
+                'total': totals['conversations'],
                 'active': active_conversations,
-                'today': conversations_today,
+                'today': today['conversations'],
             },
             'messages': {
-                'total': total_messages,
-                'today': messages_today,
-                'ai_responses': ai_responses,
-                'ai_response_rate': round(ai_response_rate, 1)
+                'total': totals['messages'],
+                'today': today['messages'],
+                'ai_responses': totals['ai_messages'],
+                'ai_response_rate': dashboard_stats['ai_response_rate']
             },
             'recent_conversations': ConversationSerializer(recent_conversations, many=True).data
         }
@@ -96,7 +85,7 @@ class ConversationListView(generics.ListAPIView):
     permission_classes = [IsAdminUser]
     
     def get_queryset(self):
-        queryset = Conversation.objects.all().order_by('-updated_at')
+        queryset = Conversation.objects.with_summary().order_by('-updated_at')
         
         # Apply filters
         search = self.request.query_params.get('search', '')
@@ -105,10 +94,13 @@ class ConversationListView(generics.ListAPIView):
         date_to = self.request.query_params.get('date_to')
         
         if search:
+            # Match messages through the full-text index in a subquery so the
+            # unread count annotation isn't multiplied by a join
+            matching_conversations = search_index.matching_messages(search).values('conversation_id')
             queryset = queryset.filter(
                 Q(user__email__icontains=search) |
-                Q(messages__content__icontains=search)
-            ).distinct()
+                Q(id__in=matching_conversations)
+            )
         
         if status_filter == 'active':
             queryset = queryset.filter(is_active=True)
@@ -125,7 +117,7 @@ class ConversationListView(generics.ListAPIView):
 
 
 class ConversationDetailView(generics.RetrieveAPIView):
-    queryset = Conversation.objects.all()
+    queryset = Conversation.objects.with_summary()
     serializer_class = ConversationSerializer
     permission_classes = [IsAdminUser]
     lookup_field = 'id'
@@ -153,7 +145,8 @@ class ToggleAIResponseView(generics.UpdateAPIView):
         conversation = self.get_object()
         enable = request.data.get('enable', not conversation.ai_enabled)
         conversation.ai_enabled = enable
-        conversation.save()
+        # Only this column: a full save would write back a stale message summary
+        conversation.save(update_fields=['ai_enabled', 'updated_at'])
         
         # Create a system message about the change
         Message.objects.create(
@@ -196,10 +189,7 @@ class MarkMessagesAsReadView(generics.UpdateAPIView):
     
     def patch(self, request, *args, **kwargs):
         conversation_id = kwargs.get('conversation_id')
-        Message.objects.filter(
-            conversation_id=conversation_id,
-            is_read=False
-        ).update(is_read=True)
+        read_state.mark_read(conversation_id, read_state.ADMIN)
         
         return Response({'status': 'success'})
 
@@ -209,20 +199,21 @@ class AdminConversationViewSet(viewsets.ModelViewSet):
     permission_classes = [AllowAny]
     
     def get_queryset(self):
-        # Get all conversations with their messages
-        return Conversation.objects.prefetch_related('messages').order_by('-updated_at')
+        # Get all conversations with their message summaries
+        return Conversation.objects.with_summary().order_by('-updated_at')
     
     @action(detail=True, methods=['get'])
     def messages(self, request, pk=None):
         conversation = self.get_object()
-        messages = conversation.messages.all().order_by('created_at')
-        serializer = MessageSerializer(messages, many=True)
+        messages = conversation.messages.select_related('conversation__user').order_by('created_at')
+        page = self.paginate_queryset(messages)
+        serializer = MessageSerializer(page, many=True)
         
-        # Mark user messages as read when admin views them
-        if not request.query_params.get('no_read'):
-            conversation.messages.filter(sender='user', is_read=False).update(is_read=True)
+        # Mark the messages shown as read by the admin
+        if page and not request.query_params.get('no_read'):
+            read_state.mark_read(conversation.pk, read_state.ADMIN, up_to=max(message.pk for message in page))
         
-        return Response(serializer.data)
+        return self.get_paginated_response(serializer.data)
     
     @action(detail=True, methods=['post'])
     def send_message(self, request, pk=None):
@@ -235,18 +226,15 @@ class AdminConversationViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Create the message
+        # Create the message; this also updates the conversation's summary
+        # and updated_at (summaries.record_messages)
         message = Message.objects.create(
             conversation=conversation,
             content=content,
             sender='admin',
-            is_read=False,
             sender_username=request.user.email if request.user.is_authenticated else 'Admin'
         )
         
-        # Update conversation's updated_at
-        conversation.save()
-        
         # Notify WebSocket group
         channel_layer = get_channel_layer()
         async_to_sync(channel_layer.group_send)(
@@ -259,7 +247,7 @@ class AdminConversationViewSet(viewsets.ModelViewSet):
                     'sender': message.sender,
                     'conversation': str(message.conversation.id),
                     'created_at': message.created_at.isoformat(),
-                    'is_read': message.is_read,
+                    'is_read': False,
                     'sender_name': message.sender_username or 'Admin'
                 }
             }
@@ -274,12 +262,77 @@ class AdminMessageViewSet(viewsets.ModelViewSet):
     
     def get_queryset(self):
         # Get all messages across all conversations
-        return Message.objects.select_related('conversation').order_by('-created_at')
+        return Message.objects.select_related('conversation__user').order_by('-created_at')
     
     def get_serializer_context(self):
         return {'request': self.request}
 
 
+class AdminExportView(APIView):
+    """
+    Stream a whole dataset as a file download, e.g.
+    /api/admin/export/messages.csv?compression=gzip&date_from=2025-01-01
+
+    Datasets: conversations, messages, submissions; formats: jsonl, csv.
+    Query parameters: compression (gzip, zstd), date_from and date_to
+    (YYYY-MM-DD, inclusive) and status (a conversation status, or processed /
+    unprocessed for submissions). See exports.py.
+
+    The API has no authentication configured by default; exports include
+    personal data, so this one requires a staff member logged in to the site.
+    """
+    authentication_classes = [SessionAuthentication]
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, dataset, fmt):
+        compression = request.query_params.get('compression', '').strip()
+        try:
+            content = exports.stream(
+                dataset, fmt=fmt, compression=compression,
+                date_from=request.query_params.get('date_from', '').strip() or None,
+                date_to=request.query_params.get('date_to', '').strip() or None,
+                status=request.query_params.get('status', '').strip() or None,
+            )
+        except exports.ExportError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        response = StreamingHttpResponse(content, content_type=exports.content_type(fmt, compression))
+        response['Content-Disposition'] = f'attachment; filename="{exports.filename(dataset, fmt, compression)}"'
+        response['Cache-Control'] = 'no-store'
+        return response
+
+
+class AdminArchiveListView(generics.ListAPIView):
+    """
+    Conversations in the cold archive, most recently active first. Filter
+    with ?source=scribble|chat and ?owner=<user id>.
+    """
+    serializer_class = ArchivedConversationSerializer
+    authentication_classes = [SessionAuthentication]
+    permission_classes = [IsAdminUser]
+
+    def get_queryset(self):
+        queryset = ArchivedConversation.objects.defer('payload')
+        for param in ('source', 'owner'):
+            value = self.request.query_params.get(param, '').strip()
+            if value:
+                queryset = queryset.filter(**{param: value})
+        return queryset
+
+
+class AdminArchivedConversationView(APIView):
+    """One archived conversation with its messages, decompressed on demand"""
+    authentication_classes = [SessionAuthentication]
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, source, conversation_id):
+        try:
+            data = archive.load(source, conversation_id)
+        except ArchivedConversation.DoesNotExist:
+            return Response({'error': 'Archived conversation not found'}, status=status.HTTP_404_NOT_FOUND)
+        return Response({'source': source, **data})
+
+
 class AdminSearchViewSet(viewsets.ViewSet):
     permission_classes = [AllowAny]
     
@@ -292,20 +345,33 @@ class AdminSearchViewSet(viewsets.ViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Search in messages
-        messages = Message.objects.filter(
-            Q(content__icontains=query)
-        ).select_related('conversation').order_by('-created_at')
+        try:
+            page = max(int(request.query_params.get('page', 1)), 1)
+            page_size = min(max(int(request.query_params.get('page_size', 20)), 1), 100)
+        except ValueError:
+            return Response(
+                {'error': 'page and page_size must be integers'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        # Search in messages using the full-text index (ranked and highlighted)
+        messages, has_next = search_index.search_messages(query, page=page, page_size=page_size)
         
         # Search in conversations (by user email)
-        conversations = Conversation.objects.filter(
+        offset = (page - 1) * page_size
+        conversations = list(Conversation.objects.with_summary().filter(
             Q(user__email__icontains=query)
-        ).prefetch_related('messages').order_by('-updated_at')
+        ).order_by('-updated_at')[offset:offset + page_size + 1])
         
-        message_serializer = MessageSerializer(messages, many=True)
-        conversation_serializer = ConversationSerializer(conversations, many=True)
+        message_serializer = MessageSearchResultSerializer(messages, many=True)
+        conversation_serializer = ConversationSerializer(conversations[:page_size], many=True)
         
         return Response({
             'messages': message_serializer.data,
-            'conversations': conversation_serializer.data
+            'conversations': conversation_serializer.data,
+            'pagination': {
+                'page': page,
+                'page_size': page_size,
+                'has_next': has_next or len(conversations) > page_size,
+            }
         })
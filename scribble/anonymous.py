@@ -0,0 +1,65 @@
+"""
+Anonymous client identity for the chat, without server-side sessions.
+
+Chat visitors aren't signed in, so creating a Django session for each of
+them would write a django_session row per visitor (and per turn with
+SESSION_SAVE_EVERY_REQUEST) that nothing reads back. Instead a visitor is
+given a random id in a signed cookie (ANONYMOUS_ID_COOKIE). The signature
+stops clients from picking someone else's id; nothing is stored on the
+server, so reading or handing out an id never touches the database. The id
+keys the conversation memory, new conversations' ``session_key`` and the
+throttling buckets.
+"""
+import uuid
+
+from django.conf import settings
+
+SALT = 'scribble.anonymous-id'
+
+
+def _cookie_name():
+    return getattr(settings, 'ANONYMOUS_ID_COOKIE', 'scribble_anon')
+
+
+def _http_request(request):
+    # DRF wraps the HttpRequest; keep state on the one middleware sees
+    return getattr(request, '_request', request)
+
+
+def get_anonymous_id(request, create=True):
+    """
+    The visitor's anonymous id, from the signed cookie.
+
+    Args:
+        create: Hand out a new id when the request has no valid cookie.
+            AnonymousIdMiddleware then sets the cookie on the response.
+
+    Returns:
+        str or None: 32 hex characters; None if there is none and ``create`` is off
+    """
+    request = _http_request(request)
+    anonymous_id = getattr(request, '_anonymous_id', None)
+    if anonymous_id:
+        return anonymous_id
+    anonymous_id = request.get_signed_cookie(_cookie_name(), default=None, salt=SALT)
+    if anonymous_id is None:
+        if not create:
+            return None
+        anonymous_id = uuid.uuid4().hex
+        request._anonymous_id_new = True
+    request._anonymous_id = anonymous_id
+    return anonymous_id
+
+
+def set_cookie(request, response):
+    """Send the cookie for an id handed out while serving ``request``"""
+    request = _http_request(request)
+    if not getattr(request, '_anonymous_id_new', False):
+        return
+    response.set_signed_cookie(
+        _cookie_name(), request._anonymous_id, salt=SALT,
+        max_age=getattr(settings, 'ANONYMOUS_ID_MAX_AGE', 31536000),
+        secure=settings.SESSION_COOKIE_SECURE,
+        samesite=settings.SESSION_COOKIE_SAMESITE,
+        httponly=True,
+    )
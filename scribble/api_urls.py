@@ -19,6 +19,12 @@ urlpatterns = [
     # Admin dashboard stats
     path('dashboard/stats/', api_views.DashboardStatsView.as_view(), name='dashboard-stats'),
     
+    # Database connection / pool statistics
+    path('health/db/', api_views.DatabaseStatsView.as_view(), name='database-stats'),
+    
+    # Readiness: 503 until the database answers and the model and index are loaded
+    path('health/ready/', api_views.ReadinessView.as_view(), name='readiness'),
+    
     # Toggle AI responses
     path('conversations/<int:pk>/toggle-ai/', api_views.ToggleAIResponseView.as_view(), name='toggle-ai'),
     
@@ -40,6 +46,16 @@ urlpatterns = [
     
     # Document management
     path('documents/delete/', DocumentDeleteView.as_view(), name='delete-document'),
+    # Delete (DELETE) or replace (PUT) one knowledge base document
+    path('knowledge/<int:pk>/', api_views.KnowledgeDocumentView.as_view(), name='knowledge-document'),
+    
+    # Streaming bulk exports, e.g. admin/export/messages.jsonl?compression=gzip
+    path('admin/export/<str:dataset>.<str:fmt>', admin_views.AdminExportView.as_view(), name='admin-export'),
+    
+    # Cold archive of closed conversations
+    path('admin/archive/', admin_views.AdminArchiveListView.as_view(), name='admin-archive'),
+    path('admin/archive/<str:source>/<int:conversation_id>/', admin_views.AdminArchivedConversationView.as_view(),
+         name='admin-archived-conversation'),
     
     # Memoir form endpoints
     path('memoir/submit/', api_views.submit_memoir_form, name='submit-memoir-form'),
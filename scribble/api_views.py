@@ -1,15 +1,17 @@
 import os
 import logging
-from rest_framework import viewsets, status, permissions
+import time
+from rest_framework import generics, viewsets, status, permissions
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound
 from rest_framework.permissions import AllowAny, IsAdminUser
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.http import HttpResponse
 from django.db.models import Count, Q
-from django.utils import timezone
 from datetime import timedelta
-from django.core.paginator import Paginator, EmptyPage, InvalidPage
 from rest_framework.decorators import api_view
 
 from .models import Conversation, Message, Document, AdminSettings, KnowledgeDocument, MemoirFormSubmission
@@ -18,6 +20,11 @@ from .serializers import (
     MessageSerializer, DocumentSerializer, AdminSettingsSerializer,
     MessageCreateSerializer, MemoirFormSubmissionSerializer, MemoirFormSubmissionResponseSerializer
 )
+from .stats import get_dashboard_stats
+from .connections import connection_stats
+from . import metrics, startup, vector_index
+from .pagination import CursorPagination
+from .throttling import HistoryThrottle
 
 User = get_user_model()
 
@@ -29,51 +36,71 @@ class DashboardStatsView(APIView):
     permission_classes = [AllowAny]
     
     def get(self, request):
-        # Get conversation statistics
-        total_conversations = Conversation.objects.count()
+        # Counters come from the precomputed daily rollups (see scribble/stats.py)
+        dashboard_stats = get_dashboard_stats()
+        totals, today = dashboard_stats['totals'], dashboard_stats['today']
         active_conversations = Conversation.objects.filter(is_active=True).count()
-        conversations_today = Conversation.objects.filter(
-            created_at__date=timezone.now().date()
-        ).count()
-        
-        # Get message statistics
-        total_messages = Message.objects.count()
-        messages_today = Message.objects.filter(
-            created_at__date=timezone.now().date()
-        ).count()
-        
-        # Get user statistics
-        total_users = User.objects.count()
-        new_users_today = User.objects.filter(
-            date_joined__date=timezone.now().date()
-        ).count()
         
         # Get recent conversations
-        recent_conversations = Conversation.objects.order_by('-updated_at')[:5]
+        recent_conversations = Conversation.objects.with_summary().order_by('-updated_at')[:5]
         
         data = {
             'conversations': {
-                'total': total_conversations,
+                'total': totals['conversations'],
                 'active': active_conversations,
-                'today': conversations_today,
+                'today': today['conversations'],
             },
             'messages': {
-                'total': total_messages,
-                'today': messages_today,
+                'total': totals['messages'],
+                'today': today['messages'],
             },
             'users': {
-                'total': total_users,
-                'new_today': new_users_today,
+                'total': totals['new_users'],
+                'new_today': today['new_users'],
             },
             'recent_conversations': ConversationSerializer(recent_conversations, many=True).data
         }
         
         return Response(data)
 
+class DatabaseStatsView(APIView):
+    """Connection reuse settings and pool utilisation for this worker"""
+    permission_classes = [AllowAny]
+    
+    def get(self, request):
+        return Response(connection_stats())
+
+class ReadinessView(APIView):
+    """503 until this worker can reach the database and has its model and index loaded"""
+    authentication_classes = []
+    permission_classes = [AllowAny]
+    
+    def get(self, request):
+        ready, details = startup.readiness()
+        details['ready'] = ready
+        return Response(details, status=status.HTTP_200_OK if ready else status.HTTP_503_SERVICE_UNAVAILABLE)
+
+class MetricsView(APIView):
+    """Prometheus metrics, merged across all gunicorn workers"""
+    authentication_classes = []
+    permission_classes = [AllowAny]
+    
+    def get(self, request):
+        token = getattr(settings, 'METRICS_TOKEN', '')
+        if token and request.headers.get('Authorization') != f'Bearer {token}':
+            return HttpResponse(status=401)
+        
+        rendered = metrics.render()
+        if rendered is None:
+            return HttpResponse('prometheus_client is not installed\n', status=503, content_type='text/plain')
+        body, content_type = rendered
+        return HttpResponse(body, content_type=content_type)
+
 class ConversationViewSet(viewsets.ModelViewSet):
-    queryset = Conversation.objects.all()
+    queryset = Conversation.objects.with_summary()
     serializer_class = ConversationSerializer
     permission_classes = [AllowAny]  # Changed from IsAdminUser to AllowAny
+    throttle_classes = [HistoryThrottle]
     
     def get_queryset(self):
         queryset = super().get_queryset()
@@ -101,14 +128,16 @@ class ConversationViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=['get'])
     def messages(self, request, pk=None):
         conversation = self.get_object()
-        messages = conversation.messages.all().order_by('created_at')
-        serializer = MessageSerializer(messages, many=True)
-        return Response(serializer.data)
+        messages = conversation.messages.select_related('conversation__user').order_by('created_at')
+        page = self.paginate_queryset(messages)
+        serializer = MessageSerializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
 
 class MessageViewSet(viewsets.ModelViewSet):
-    queryset = Message.objects.all()
+    queryset = Message.objects.select_related('conversation__user')
     serializer_class = MessageSerializer
     permission_classes = [AllowAny]
+    throttle_classes = [HistoryThrottle]
     
     def get_queryset(self):
         queryset = super().get_queryset()
@@ -137,7 +166,6 @@ class DocumentViewSet(viewsets.ModelViewSet):
     queryset = Document.objects.all().order_by('-uploaded_at')
     serializer_class = DocumentSerializer
     permission_classes = [AllowAny]
-    pagination_class = None  # Disable pagination for now to avoid ordering warning
     
     def create(self, request, *args, **kwargs):
         try:
@@ -185,7 +213,8 @@ class ToggleAIResponseView(APIView):
         try:
             conversation = Conversation.objects.get(pk=pk)
             conversation.ai_enabled = not conversation.ai_enabled
-            conversation.save()
+            # Only this column: a full save would write back a stale message summary
+            conversation.save(update_fields=['ai_enabled', 'updated_at'])
             
             # Add a system message about the change
             Message.objects.create(
@@ -218,18 +247,14 @@ class AdminReplyView(APIView):
         try:
             conversation = Conversation.objects.get(pk=conversation_id)
             
-            # Create admin message
+            # Create admin message; saving it also updates the conversation's
+            # summary and timestamp (summaries.record_messages)
             message = Message.objects.create(
                 conversation=conversation,
                 sender='admin',
-                content=content,
-                is_read=True
+                content=content
             )
             
-            # Update conversation timestamp
-            conversation.updated_at = timezone.now()
-            conversation.save()
-            
             # TODO: Send notification to user
             
             return Response(MessageSerializer(message).data)
@@ -274,6 +299,23 @@ class DocumentUploadView(APIView):
                     status=status.HTTP_400_BAD_REQUEST
                 )
             
+            # Re-uploading identical bytes is a no-op
+            _, existing = KnowledgeDocument.find_duplicate(uploaded_file)
+            if existing:
+                logger.info(f"Upload of {uploaded_file.name} matches document {existing.id}, skipping ingestion")
+                return Response({
+                    'status': 'success',
+                    'message': 'Document is already in the knowledge base',
+                    'duplicate': True,
+                    'document': {
+                        'id': existing.id,
+                        'file': existing.file.name,
+                        'uploaded_at': existing.uploaded_at.isoformat(),
+                        'is_processed': existing.is_processed,
+                        'file_size': existing.file_size or 0
+                    }
+                }, status=status.HTTP_200_OK)
+
             # Create document record first (in unprocessed state)
             doc = KnowledgeDocument(
                 file=uploaded_file,
@@ -427,13 +469,10 @@ class DocumentUploadView(APIView):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
-class UserListView(APIView):
+class UserListView(generics.ListAPIView):
+    queryset = User.objects.order_by('-date_joined')
+    serializer_class = UserSerializer
     permission_classes = [AllowAny]
-    
-    def get(self, request):
-        users = User.objects.all()
-        serializer = UserSerializer(users, many=True)
-        return Response(serializer.data)
 
 class UserDetailView(APIView):
     permission_classes = [AllowAny]
@@ -505,6 +544,122 @@ class DocumentDeleteView(APIView):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+def _forget_knowledge_document(document):
+    """
+    Hide a document's chunks from search and remove its files, leaving the
+    rest of the index untouched. Returns the number of deleted documents
+    waiting for compaction, or None if nothing was tombstoned (the document
+    was never fingerprinted, or another document has the same content).
+    """
+    from .fingerprints import file_sha256
+    from .ingest import PROJECT_ROOT, VECTOR_STORE_PATH
+
+    pending = None
+    # Byte-identical uploads share one hash, and their chunks; the other
+    # copies keep them in search
+    shared_file = KnowledgeDocument.objects.filter(
+        content_hash=document.content_hash,
+    ).exclude(pk=document.pk).exists()
+    if document.content_hash and not shared_file:
+        # Chunks other documents also contain were indexed under this one
+        vector_index.rehome(VECTOR_STORE_PATH, document.content_hash)
+        pending = vector_index.mark_deleted(VECTOR_STORE_PATH, document.content_hash)
+
+    # The copy ingest reads from; left behind it would be indexed again
+    if document.file:
+        copy_path = PROJECT_ROOT / 'knowledge_base' / os.path.basename(document.file.name)
+        try:
+            if copy_path.exists() and file_sha256(copy_path) == document.content_hash:
+                copy_path.unlink()
+        except OSError as e:
+            logger.error(f"Error deleting knowledge base copy {copy_path}: {str(e)}")
+        document.file.delete(save=False)
+    return pending
+
+def _compact_if_needed(pending):
+    from .ingest import VECTOR_STORE_PATH, get_embeddings
+
+    return bool(pending) and vector_index.maybe_compact(VECTOR_STORE_PATH, pending, get_embeddings)
+
+class KnowledgeDocumentView(APIView):
+    """
+    Delete or replace one knowledge base document.
+
+    Deleting only tombstones the document's vectors (see vector_index), so it
+    returns in milliseconds; a background compaction reclaims the space once
+    enough documents have been deleted. Replacing tombstones the old content
+    and indexes just the new file.
+    """
+    permission_classes = [AllowAny]
+
+    def delete(self, request, pk):
+        started = time.perf_counter()
+        try:
+            document = KnowledgeDocument.objects.get(pk=pk)
+        except KnowledgeDocument.DoesNotExist:
+            return Response({'error': 'Document not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        pending = _forget_knowledge_document(document)
+        document.delete()
+        return Response({
+            'status': 'success',
+            'message': 'Document deleted',
+            'id': pk,
+            'pending_compaction': pending,
+            'compaction_started': _compact_if_needed(pending),
+            'duration_ms': round((time.perf_counter() - started) * 1000, 1),
+        })
+
+    def put(self, request, pk):
+        from .ingest import PROJECT_ROOT, main
+
+        try:
+            document = KnowledgeDocument.objects.get(pk=pk)
+        except KnowledgeDocument.DoesNotExist:
+            return Response({'error': 'Document not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        uploaded_file = request.FILES.get('file')
+        if not uploaded_file:
+            return Response({'error': 'No file was submitted'}, status=status.HTTP_400_BAD_REQUEST)
+        if not uploaded_file.name.lower().endswith(('.pdf', '.txt', '.md')):
+            return Response({'error': 'Only PDF, TXT, and MD files are allowed'}, status=status.HTTP_400_BAD_REQUEST)
+
+        content_hash, existing = KnowledgeDocument.find_duplicate(uploaded_file, exclude_pk=pk)
+        if existing:
+            return Response(
+                {'error': f'This file is already in the knowledge base as document {existing.id}'},
+                status=status.HTTP_409_CONFLICT
+            )
+        if content_hash == document.content_hash:
+            return Response({'status': 'success', 'message': 'Document is unchanged', 'id': pk})
+
+        _forget_knowledge_document(document)
+        document.file = uploaded_file
+        document.title = ''
+        document.is_processed = False
+        document.processing_error = None
+        document.save()
+
+        docs_dir = PROJECT_ROOT / 'knowledge_base'
+        os.makedirs(docs_dir, exist_ok=True)
+        with open(docs_dir / os.path.basename(document.file.name), 'wb') as destination:
+            for chunk in document.file.chunks():
+                destination.write(chunk)
+
+        # Only the new file is parsed and embedded, everything else is already
+        # fingerprinted in the index; the rewrite also drops the old vectors
+        if main():
+            KnowledgeDocument.objects.filter(pk=pk).update(is_processed=True)
+            document.is_processed = True
+        else:
+            KnowledgeDocument.objects.filter(pk=pk).update(processing_error='Indexing failed')
+
+        return Response({
+            'status': 'success' if document.is_processed else 'error',
+            'message': 'Document replaced' if document.is_processed else 'Document saved but indexing failed',
+            'id': pk,
+        }, status=status.HTTP_200_OK if document.is_processed else status.HTTP_500_INTERNAL_SERVER_ERROR)
+
 class AdminSettingsView(APIView):
     permission_classes = [AllowAny]
     
@@ -589,8 +744,9 @@ def get_memoir_form_submissions(request):
     Get all memoir form submissions (admin endpoint)
     
     Query parameters:
-    - page: Page number for pagination
-    - page_size: Number of items per page (default: 20)
+    - cursor: Opaque position from pagination.next / pagination.previous
+    - page_size: Number of items per page (default: 20, max 100)
+    - count: Set to 1 to include an estimated total_count
     - search: Search term for filtering by name, email, or theme
     - audience: Filter by audience type
     - is_processed: Filter by processing status (true/false)
@@ -599,8 +755,6 @@ def get_memoir_form_submissions(request):
     """
     try:
         # Get query parameters
-        page = int(request.GET.get('page', 1))
-        page_size = min(int(request.GET.get('page_size', 20)), 100)  # Max 100 per page
         search = request.GET.get('search', '').strip()
         audience = request.GET.get('audience', '').strip()
         is_processed = request.GET.get('is_processed', '').strip()
@@ -645,12 +799,9 @@ def get_memoir_form_submissions(request):
             except ValueError:
                 pass
         
-        # Paginate results
-        paginator = Paginator(queryset, page_size)
-        try:
-            submissions_page = paginator.page(page)
-        except (EmptyPage, InvalidPage):
-            submissions_page = paginator.page(paginator.num_pages)
+        # Paginate results by cursor (newest first), without counting them all
+        paginator = CursorPagination()
+        submissions_page = paginator.paginate_queryset(queryset.order_by('-submitted_at', '-id'), request)
         
         # Serialize the data
         serializer = MemoirFormSubmissionResponseSerializer(submissions_page, many=True)
@@ -660,12 +811,12 @@ def get_memoir_form_submissions(request):
             'success': True,
             'data': serializer.data,
             'pagination': {
-                'current_page': submissions_page.number,
-                'total_pages': paginator.num_pages,
+                'next': paginator.get_next_link(),
+                'previous': paginator.get_previous_link(),
                 'total_count': paginator.count,
-                'has_next': submissions_page.has_next(),
-                'has_previous': submissions_page.has_previous(),
-                'page_size': page_size
+                'has_next': paginator.has_next,
+                'has_previous': paginator.has_previous,
+                'page_size': paginator.page_size
             },
             'filters': {
                 'search': search,
@@ -678,6 +829,12 @@ def get_memoir_form_submissions(request):
         
         return Response(response_data, status=status.HTTP_200_OK)
         
+    except NotFound as e:
+        return Response({
+            'success': False,
+            'message': 'Invalid or expired page link.',
+            'error': str(e.detail)
+        }, status=status.HTTP_404_NOT_FOUND)
     except Exception as e:
         logger.error(f"Error fetching memoir form submissions: {str(e)}")
         
@@ -1,5 +1,6 @@
 from django.apps import AppConfig
 from django.conf import settings
+from django.db.models.signals import post_migrate
 
 
 class ScribbleConfig(AppConfig):
@@ -15,6 +16,7 @@ class ScribbleConfig(AppConfig):
         # Import signals after the app is ready
         try:
             import scribble.signals  # noqa F401
+            post_migrate.connect(scribble.signals.repair_search_index, sender=self)
         except ImportError:
             # Don't fail if signals can't be imported
             pass
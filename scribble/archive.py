@@ -0,0 +1,225 @@
+"""
+Cold archive for closed conversations.
+
+Closed conversations (resolved or inactive scribble conversations, closed
+chat ones) are rarely read again but stay in the message tables that the
+dashboards, search and history queries scan. ``archive_closed()`` moves the
+ones untouched for ARCHIVE_AFTER_MONTHS into ArchivedConversation rows, one
+per conversation, holding its messages and read watermarks as gzip-compressed
+JSON. Rows are walked by primary key, ARCHIVE_BATCH_SIZE conversations per
+short transaction, as in retention.py.
+
+Archived conversations stay retrievable: ``load()`` decompresses one (the
+admin archive endpoint serves it), and ``restore()`` puts it back in the hot
+tables with its original ids and timestamps. On PostgreSQL with partitioned
+message tables (partitions.py), archiving is what empties old monthly
+partitions so they can be detached; restoring messages into a month whose
+partition was detached needs the partition recreated first
+(partition_messages --from).
+"""
+import gzip
+import json
+import logging
+import time
+from datetime import datetime
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models, transaction
+from django.utils import timezone
+
+from .metrics import ARCHIVED_CONVERSATIONS
+from .partitions import add_months
+
+logger = logging.getLogger(__name__)
+
+
+class ArchiveError(Exception):
+    """An archived conversation can't be restored"""
+
+
+def sources():
+    """
+    Conversation tables the archive handles.
+
+    Returns:
+        dict: label -> (conversation model, message model, watermark model,
+        Q matching closed conversations, owner field)
+    """
+    from chat.models import (
+        Conversation as ChatConversation, Message as ChatMessage, ReadWatermark as ChatReadWatermark,
+    )
+
+    from .models import Conversation, Message, ReadWatermark
+
+    return {
+        'scribble': (Conversation, Message, ReadWatermark,
+                     models.Q(status='resolved') | models.Q(is_active=False), 'user_id'),
+        'chat': (ChatConversation, ChatMessage, ChatReadWatermark, models.Q(status='closed'), 'user_id'),
+    }
+
+
+class _ArchiveEncoder(DjangoJSONEncoder):
+    def default(self, o):
+        # DjangoJSONEncoder drops microseconds past milliseconds; keep timestamps exact for restore()
+        if isinstance(o, datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+def _compress(data):
+    return gzip.compress(json.dumps(data, cls=_ArchiveEncoder).encode('utf-8'))
+
+
+def _group(rows):
+    grouped = {}
+    for row in rows:
+        grouped.setdefault(row['conversation_id'], []).append(row)
+    return grouped
+
+
+def archive_closed(months=None, batch_size=None, sleep=0.0, dry_run=False):
+    """
+    Move closed conversations untouched for ``months`` months to the archive.
+
+    Args:
+        months: Default ARCHIVE_AFTER_MONTHS; 0 or less archives nothing
+        batch_size: Conversations per transaction (default ARCHIVE_BATCH_SIZE)
+        sleep: Seconds to pause between batches
+        dry_run: Only count what would be archived
+
+    Returns:
+        dict: Conversations and messages archived per source, and the time taken
+    """
+    from .models import ArchivedConversation
+
+    if months is None:
+        months = getattr(settings, 'ARCHIVE_AFTER_MONTHS', 6)
+    if batch_size is None:
+        batch_size = getattr(settings, 'ARCHIVE_BATCH_SIZE', 100)
+
+    started = time.perf_counter()
+    report = {'months': months, 'dry_run': dry_run, 'sources': {}}
+    if months <= 0:
+        report['seconds'] = 0.0
+        return report
+
+    cutoff = add_months(timezone.now(), -months)
+    for label, (conversation_model, message_model, watermark_model, closed, owner_field) in sources().items():
+        counts = report['sources'][label] = {'conversations': 0, 'messages': 0, 'batches': 0}
+        conversations = conversation_model.objects.filter(closed, updated_at__lt=cutoff)
+        last_pk = 0
+        while True:
+            ids = list(conversations.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)[:batch_size])
+            if not ids:
+                break
+            last_pk = ids[-1]
+            if dry_run:
+                counts['conversations'] += len(ids)
+                counts['messages'] += message_model.objects.filter(conversation_id__in=ids).count()
+                continue
+
+            with transaction.atomic():
+                # Lock the batch and re-check it: a conversation may have been reopened
+                rows = list(conversations.filter(pk__in=ids).select_for_update().order_by('pk').values())
+                ids = [row['id'] for row in rows]
+                messages = _group(message_model.objects.filter(conversation_id__in=ids).order_by('pk').values())
+                watermarks = _group(watermark_model.objects.filter(conversation_id__in=ids).values())
+                ArchivedConversation.objects.bulk_create([
+                    ArchivedConversation(
+                        source=label,
+                        conversation_id=row['id'],
+                        owner=str(row[owner_field] or ''),
+                        status=row['status'],
+                        message_count=len(messages.get(row['id'], [])),
+                        conversation_created_at=row['created_at'],
+                        conversation_updated_at=row['updated_at'],
+                        payload=_compress({
+                            'conversation': row,
+                            'messages': messages.get(row['id'], []),
+                            'read_watermarks': watermarks.get(row['id'], []),
+                        }),
+                    )
+                    for row in rows
+                ])
+                deleted = message_model.objects.filter(conversation_id__in=ids).delete()[0]
+                conversation_model.objects.filter(pk__in=ids).delete()
+            counts['conversations'] += len(ids)
+            counts['messages'] += deleted
+            counts['batches'] += 1
+            ARCHIVED_CONVERSATIONS.labels(source=label).inc(len(ids))
+            if sleep:
+                time.sleep(sleep)
+
+    report['seconds'] = round(time.perf_counter() - started, 3)
+    logger.info(f"Archived closed conversations older than {months} months: {report}")
+    return report
+
+
+def load(source, conversation_id):
+    """
+    An archived conversation, decompressed.
+
+    Returns:
+        dict: 'conversation', 'messages' and 'read_watermarks' as stored, plus
+        'archived_at'
+
+    Raises:
+        ArchivedConversation.DoesNotExist
+    """
+    from .models import ArchivedConversation
+
+    archived = ArchivedConversation.objects.get(source=source, conversation_id=conversation_id)
+    data = json.loads(gzip.decompress(bytes(archived.payload)))
+    data['archived_at'] = archived.archived_at
+    return data
+
+
+def _recreate(model, rows):
+    """Insert ``rows`` (as from values()) keeping their ids and timestamps"""
+    fields = model._meta.concrete_fields
+    instances = [
+        model(**{field.attname: field.to_python(row[field.attname]) for field in fields if field.attname in row})
+        for row in rows
+    ]
+    model.objects.bulk_create(instances)
+    # bulk_create() stamps auto_now(_add) fields with the current time; put the originals back
+    stamped = [field for field in fields if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)]
+    if stamped and instances:
+        for instance, row in zip(instances, rows):
+            for field in stamped:
+                setattr(instance, field.attname, field.to_python(row[field.attname]))
+        model.objects.bulk_update(instances, [field.name for field in stamped], batch_size=500)
+    return instances
+
+
+def restore(source, conversation_id):
+    """
+    Move an archived conversation back into the hot tables.
+
+    Returns:
+        The restored conversation
+
+    Raises:
+        ArchivedConversation.DoesNotExist
+        ArchiveError: The conversation (or, for chat, its user's conversation)
+            exists again
+    """
+    from .models import ArchivedConversation
+
+    conversation_model, message_model, watermark_model, _, _ = sources()[source]
+    with transaction.atomic():
+        archived = ArchivedConversation.objects.select_for_update().get(source=source, conversation_id=conversation_id)
+        data = json.loads(gzip.decompress(bytes(archived.payload)))
+        if conversation_model.objects.filter(pk=conversation_id).exists():
+            raise ArchiveError(f"{source} conversation {conversation_id} already exists")
+        if source == 'chat' and conversation_model.objects.filter(user_id=data['conversation']['user_id']).exists():
+            # Chat users have a single conversation
+            raise ArchiveError(f"User {data['conversation']['user_id']} has started a new conversation")
+
+        conversation = _recreate(conversation_model, [data['conversation']])[0]
+        _recreate(message_model, data['messages'])
+        _recreate(watermark_model, data['read_watermarks'])
+        archived.delete()
+    logger.info(f"Restored archived {source} conversation {conversation_id} ({len(data['messages'])} messages)")
+    return conversation
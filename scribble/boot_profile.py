@@ -0,0 +1,111 @@
+"""
+Import-time profile of a Django process boot.
+
+Every gunicorn worker, and every ``manage.py migrate`` or ``collectstatic``
+run (the system checks import the URLconf), pays for what URL routing
+imports. The heavy ML stack (torch, transformers, LangChain, FAISS, OpenAI)
+must only load when a request or ingest actually needs it. This runs a fresh
+interpreter with ``-X importtime`` so the numbers aren't skewed by modules
+already imported here.
+"""
+import json
+import os
+import subprocess
+import sys
+
+from django.conf import settings
+
+BOOT_TARGET = 'scribbleintimeai.urls'
+
+HEAVY_MODULES = (
+    'torch', 'transformers', 'sentence_transformers', 'langchain', 'langchain_core',
+    'langchain_community', 'langchain_huggingface', 'faiss', 'numpy', 'openai',
+)
+
+# ru_maxrss survives exec on Linux, so a child forked from a process that
+# already has the ML stack loaded would report the parent's peak. VmHWM
+# belongs to the new address space.
+_BOOT_SCRIPT = """
+import json, resource, sys, time
+started = time.perf_counter()
+import django
+django.setup()
+import {target}
+try:
+    with open('/proc/self/status') as f:
+        rss_kb = next(int(line.split()[1]) for line in f if line.startswith('VmHWM:'))
+except (OSError, StopIteration):
+    rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({{
+    'seconds': time.perf_counter() - started,
+    'rss_mb': rss_kb / 1024,
+    'modules': sorted(sys.modules),
+}}))
+"""
+
+
+def parse_importtime(stderr):
+    """
+    Parse ``-X importtime`` output.
+
+    Returns:
+        list: (module, self_us, cumulative_us) for every imported module
+    """
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|', 2)
+        modules.append((name.strip(), int(self_us), int(cumulative_us)))
+    return modules
+
+
+def profile_boot(target=BOOT_TARGET, top=15):
+    """
+    Boot Django and import ``target`` in a new interpreter.
+
+    Returns:
+        dict: Wall seconds (with importtime overhead), peak RSS, the heavy
+        modules that got imported and the ``top`` slowest imports
+    """
+    env = dict(os.environ, DJANGO_SETTINGS_MODULE=os.environ.get(
+        'DJANGO_SETTINGS_MODULE', 'scribbleintimeai.settings'
+    ))
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', _BOOT_SCRIPT.format(target=target)],
+        capture_output=True, text=True, cwd=settings.BASE_DIR, env=env, timeout=300,
+    )
+    if result.returncode:
+        raise RuntimeError(f'Boot failed:\n{result.stderr[-2000:]}')
+
+    boot = json.loads(result.stdout.strip().splitlines()[-1])
+    imports = parse_importtime(result.stderr)
+    loaded = set(boot['modules'])
+    return {
+        'target': target,
+        'seconds': round(boot['seconds'], 3),
+        'rss_mb': round(boot['rss_mb'], 1),
+        'modules': len(loaded),
+        'heavy_modules': [name for name in HEAVY_MODULES if name in loaded],
+        'slowest_imports_ms': [
+            {'module': name, 'self': round(self_us / 1000, 1), 'cumulative': round(cumulative_us / 1000, 1)}
+            for name, self_us, cumulative_us in sorted(imports, key=lambda item: item[1], reverse=True)[:top]
+        ],
+        'budget': {
+            'seconds': getattr(settings, 'BOOT_TIME_BUDGET_SECONDS', None),
+            'rss_mb': getattr(settings, 'BOOT_RSS_BUDGET_MB', None),
+        },
+    }
+
+
+def budget_violations(profile):
+    """Human readable reasons a boot profile breaks the budget, if any"""
+    problems = []
+    if profile['heavy_modules']:
+        problems.append(f"heavy modules imported at boot: {', '.join(profile['heavy_modules'])}")
+    seconds, rss_mb = profile['budget']['seconds'], profile['budget']['rss_mb']
+    if seconds and profile['seconds'] > seconds:
+        problems.append(f"boot took {profile['seconds']}s, budget {seconds}s")
+    if rss_mb and profile['rss_mb'] > rss_mb:
+        problems.append(f"boot RSS {profile['rss_mb']} MB, budget {rss_mb} MB")
+    return problems
@@ -0,0 +1,64 @@
+"""
+Database connection reuse statistics.
+
+Reports how the default database connection is being reused: persistent
+connections (CONN_MAX_AGE) or a psycopg_pool connection pool, with pool
+utilisation figures when pooling is enabled.
+"""
+from django.db import connections
+
+
+def connection_stats(alias='default'):
+    """
+    Return connection reuse settings and, if pooled, pool utilisation.
+
+    Pool figures come from psycopg_pool's get_stats() and are per worker
+    process, since every gunicorn worker owns its own pool.
+    """
+    connection = connections[alias]
+    settings_dict = connection.settings_dict
+    stats = {
+        'alias': alias,
+        'vendor': connection.vendor,
+        'conn_max_age': settings_dict.get('CONN_MAX_AGE', 0),
+        'health_checks': settings_dict.get('CONN_HEALTH_CHECKS', False),
+        'pooled': False,
+    }
+
+    pool = getattr(connection, 'pool', None)
+    if pool is not None:
+        pool_stats = pool.get_stats()
+        in_use = pool_stats.get('pool_size', 0) - pool_stats.get('pool_available', 0)
+        stats['pooled'] = True
+        stats['pool'] = {
+            'min_size': pool.min_size,
+            'max_size': pool.max_size,
+            'size': pool_stats.get('pool_size', 0),
+            'available': pool_stats.get('pool_available', 0),
+            'in_use': in_use,
+            'requests_waiting': pool_stats.get('requests_waiting', 0),
+            'utilisation': round(in_use / pool.max_size, 3) if pool.max_size else 0,
+            'requests_total': pool_stats.get('requests_num', 0),
+            'requests_queued': pool_stats.get('requests_queued', 0),
+            'requests_wait_ms': pool_stats.get('requests_wait_ms', 0),
+            'connections_total': pool_stats.get('connections_num', 0),
+            'connections_errors': pool_stats.get('connections_errors', 0),
+        }
+    return stats
+
+
+def release_connection(alias='default'):
+    """
+    Return this thread's connection to the pool before a long wait on
+    something else, such as the LLM call.
+
+    Django hands a pooled connection back only when the request ends, so
+    every thread waiting on the LLM would hold one and a threaded worker
+    would run out long before it runs out of threads. The next query checks
+    out a connection again. Persistent unpooled connections are kept, since
+    closing them means reconnecting. Nothing is released inside a
+    transaction.
+    """
+    connection = connections[alias]
+    if getattr(connection, 'pool', None) is not None and not connection.in_atomic_block:
+        connection.close()
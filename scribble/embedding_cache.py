@@ -0,0 +1,139 @@
+"""
+Query embedding cache.
+
+Greetings and the usual service and pricing questions repeat constantly, and
+each costs a MiniLM forward pass on CPU. Every retrieval path embeds queries
+through ``get_query_embeddings()``, which keeps recent query vectors in a
+per-process LRU capped by bytes (float32 NumPy arrays, about 1.5 KB each for
+MiniLM) and, when QUERY_EMBEDDING_SHARED_CACHE names a cache alias, in that
+shared cache as well so workers benefit from each other's misses.
+"""
+import logging
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import caches
+from langchain_core.embeddings import Embeddings
+
+from .fingerprints import normalize_text
+from .metrics import EMBEDDING_CACHE_REQUESTS
+
+logger = logging.getLogger(__name__)
+
+
+class QueryEmbeddingCache:
+    """Thread-safe LRU of text -> float32 vector, bounded by total bytes"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _size(key, vector):
+        return vector.nbytes + len(key)
+
+    def get(self, key):
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is not None:
+                self._entries.move_to_end(key)
+            return vector
+
+    def put(self, key, vector):
+        size = self._size(key, vector)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= self._size(key, previous)
+            self._entries[key] = vector
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                old_key, old_vector = self._entries.popitem(last=False)
+                self._bytes -= self._size(old_key, old_vector)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self._bytes, 'max_bytes': self.max_bytes}
+
+
+class CachedQueryEmbeddings(Embeddings):
+    """
+    Wrap an embeddings model so ``embed_query`` is served from the cache for
+    normalized-identical text. Document embedding is passed straight through.
+    """
+
+    def __init__(self, embeddings, cache, namespace='', shared_alias=None):
+        self.embeddings = embeddings
+        self.cache = cache
+        self.namespace = namespace
+        self.shared_alias = shared_alias
+
+    def embed_documents(self, texts):
+        return self.embeddings.embed_documents(texts)
+
+    def _shared_key(self, key):
+        return f'query-embedding:{self.namespace}:{key}'
+
+    def _shared_get(self, key):
+        try:
+            data = caches[self.shared_alias].get(self._shared_key(key))
+        except Exception as e:
+            logger.warning(f"Shared embedding cache unavailable: {str(e)}")
+            return None
+        return np.frombuffer(data, dtype=np.float32) if data else None
+
+    def _shared_set(self, key, vector):
+        try:
+            caches[self.shared_alias].set(self._shared_key(key), vector.tobytes())
+        except Exception as e:
+            logger.warning(f"Shared embedding cache unavailable: {str(e)}")
+
+    def embed_query(self, text):
+        key = normalize_text(text) or text
+        vector = self.cache.get(key)
+        if vector is not None:
+            EMBEDDING_CACHE_REQUESTS.labels(tier='local', result='hit').inc()
+            return vector.tolist()
+        EMBEDDING_CACHE_REQUESTS.labels(tier='local', result='miss').inc()
+
+        if self.shared_alias:
+            vector = self._shared_get(key)
+            EMBEDDING_CACHE_REQUESTS.labels(tier='shared', result='miss' if vector is None else 'hit').inc()
+
+        if vector is None:
+            vector = np.asarray(self.embeddings.embed_query(text), dtype=np.float32)
+            if self.shared_alias:
+                self._shared_set(key, vector)
+        self.cache.put(key, vector)
+        return vector.tolist()
+
+
+_query_embeddings = None
+_query_embeddings_lock = threading.Lock()
+
+
+def get_query_embeddings():
+    """The process-wide embeddings model with the query cache in front of it"""
+    global _query_embeddings
+    if _query_embeddings is None:
+        with _query_embeddings_lock:
+            if _query_embeddings is None:
+                from .ingest import MODEL_NAME, get_embeddings
+                _query_embeddings = CachedQueryEmbeddings(
+                    get_embeddings(),
+                    QueryEmbeddingCache(getattr(settings, 'QUERY_EMBEDDING_CACHE_BYTES', 16 * 1024 * 1024)),
+                    namespace=MODEL_NAME,
+                    shared_alias=getattr(settings, 'QUERY_EMBEDDING_SHARED_CACHE', '') or None,
+                )
+    return _query_embeddings
@@ -0,0 +1,203 @@
+"""
+Streaming bulk exports of conversations, messages and memoir form submissions.
+
+Rows are read through a server-side cursor (``QuerySet.iterator()``),
+EXPORT_CHUNK_SIZE at a time, as plain value tuples, and encoded and
+compressed as they go. Nothing holds more than a chunk of rows and one output
+buffer, so memory stays flat however many rows are exported. ``stream()``
+feeds both the admin export endpoint (a StreamingHttpResponse) and the
+export_data command.
+
+Output is JSON lines or CSV, optionally gzip or zstd compressed (zstd needs
+the zstandard package). Rows can be filtered by date (inclusive calendar days
+in the project time zone) and by status.
+"""
+import csv
+import io
+import json
+import zlib
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+
+from .metrics import EXPORT_ROWS
+
+FORMATS = {'jsonl': 'application/x-ndjson', 'csv': 'text/csv'}
+COMPRESSIONS = {'gzip': ('.gz', 'application/gzip'), 'zstd': ('.zst', 'application/zstd')}
+# Encoded output is yielded in pieces of about this many bytes
+BUFFER_BYTES = 64 * 1024
+
+
+class ExportError(ValueError):
+    """An export was requested with invalid options"""
+
+
+def _conversations(status):
+    from .models import Conversation
+    queryset = Conversation.objects.all()
+    if status:
+        if status not in dict(Conversation.STATUS_CHOICES):
+            raise ExportError(f"Unknown conversation status '{status}'")
+        queryset = queryset.filter(status=status)
+    return queryset
+
+
+def _messages(status):
+    from .models import Conversation, Message
+    queryset = Message.objects.all()
+    if status:
+        # Messages are filtered by the status of their conversation
+        if status not in dict(Conversation.STATUS_CHOICES):
+            raise ExportError(f"Unknown conversation status '{status}'")
+        queryset = queryset.filter(conversation__status=status)
+    return queryset
+
+
+def _submissions(status):
+    from .models import MemoirFormSubmission
+    queryset = MemoirFormSubmission.objects.all()
+    if status:
+        if status not in ('processed', 'unprocessed'):
+            raise ExportError("Submission status must be 'processed' or 'unprocessed'")
+        queryset = queryset.filter(is_processed=status == 'processed')
+    return queryset
+
+
+# Dataset name: (queryset for a status, exported fields, field the dates filter)
+DATASETS = {
+    'conversations': (_conversations, [
+        'id', 'user_id', 'session_key', 'status', 'is_active', 'ai_enabled', 'created_at', 'updated_at',
+        'message_count', 'unread_count', 'last_message_at',
+    ], 'created_at'),
+    'messages': (_messages, ['id', 'conversation_id', 'sender', 'content', 'created_at'], 'created_at'),
+    'submissions': (_submissions, [
+        'id', 'first_name', 'last_name', 'email', 'phone_number', 'gender', 'theme', 'subject', 'main_themes',
+        'key_life_events', 'audience', 'submitted_at', 'is_processed', 'processing_notes',
+    ], 'submitted_at'),
+}
+
+
+def _day_start(value, name):
+    try:
+        day = value if hasattr(value, 'year') else datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        raise ExportError(f"{name} must be a date in YYYY-MM-DD format")
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def export_queryset(dataset, date_from=None, date_to=None, status=None):
+    """
+    The rows of ``dataset`` to export, as a values_list queryset in primary
+    key order, and its field names.
+
+    Raises:
+        ExportError: Unknown dataset, status or malformed date
+    """
+    if dataset not in DATASETS:
+        raise ExportError(f"Unknown dataset '{dataset}'; choose from {', '.join(DATASETS)}")
+    build, fields, date_field = DATASETS[dataset]
+    queryset = build(status)
+    # Ranges rather than __date lookups, so an index on the column can be used
+    if date_from:
+        queryset = queryset.filter(**{f'{date_field}__gte': _day_start(date_from, 'date_from')})
+    if date_to:
+        queryset = queryset.filter(**{f'{date_field}__lt': _day_start(date_to, 'date_to') + timedelta(days=1)})
+    return queryset.order_by('pk').values_list(*fields), fields
+
+
+def _compressor(compression):
+    if not compression:
+        return None
+    if compression == 'gzip':
+        # wbits=31: zlib stream with a gzip header and trailer
+        return zlib.compressobj(6, zlib.DEFLATED, 31)
+    if compression == 'zstd':
+        try:
+            import zstandard
+        except ImportError:
+            raise ExportError('zstd compression needs the zstandard package')
+        return zstandard.ZstdCompressor().compressobj()
+    raise ExportError(f"Unknown compression '{compression}'; choose from {', '.join(COMPRESSIONS)}")
+
+
+def _encode(rows, fields, fmt):
+    """Yield the encoded export in pieces of about BUFFER_BYTES"""
+    buffer = io.StringIO()
+    if fmt == 'csv':
+        writer = csv.writer(buffer)
+        writer.writerow(fields)
+        write = writer.writerow
+    else:
+        encoder = DjangoJSONEncoder(ensure_ascii=False)
+
+        def write(row):
+            buffer.write(encoder.encode(dict(zip(fields, row))))
+            buffer.write('\n')
+
+    for row in rows:
+        write(row)
+        if buffer.tell() >= BUFFER_BYTES:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+def stream(dataset, fmt='jsonl', compression='', date_from=None, date_to=None, status=None, chunk_size=None):
+    """
+    Export ``dataset`` as an iterator of bytes.
+
+    Options are checked before anything is read, so errors surface here
+    rather than halfway through a response.
+
+    Args:
+        dataset: 'conversations', 'messages' or 'submissions'
+        fmt: 'jsonl' or 'csv'
+        compression: '', 'gzip' or 'zstd'
+        date_from, date_to: First and last day to include (YYYY-MM-DD or date)
+        status: Conversation status; for submissions 'processed' or 'unprocessed'
+        chunk_size: Rows fetched from the cursor at a time (default EXPORT_CHUNK_SIZE)
+
+    Raises:
+        ExportError: Invalid options
+    """
+    if fmt not in FORMATS:
+        raise ExportError(f"Unknown format '{fmt}'; choose from {', '.join(FORMATS)}")
+    queryset, fields = export_queryset(dataset, date_from=date_from, date_to=date_to, status=status)
+    compressor = _compressor(compression)
+    chunk_size = chunk_size or getattr(settings, 'EXPORT_CHUNK_SIZE', 2000)
+
+    def counted(rows):
+        exported = 0
+        try:
+            for row in rows:
+                exported += 1
+                yield row
+        finally:
+            EXPORT_ROWS.labels(dataset=dataset).inc(exported)
+
+    def generate():
+        for piece in _encode(counted(queryset.iterator(chunk_size=chunk_size)), fields, fmt):
+            if compressor is None:
+                yield piece
+            else:
+                piece = compressor.compress(piece)
+                if piece:
+                    yield piece
+        if compressor is not None:
+            yield compressor.flush()
+
+    return generate()
+
+
+def filename(dataset, fmt, compression=''):
+    """Download file name for an export, e.g. messages-20250101T120000.jsonl.gz"""
+    suffix = COMPRESSIONS[compression][0] if compression else ''
+    return f"{dataset}-{timezone.now().strftime('%Y%m%dT%H%M%S')}.{fmt}{suffix}"
+
+
+def content_type(fmt, compression=''):
+    return COMPRESSIONS[compression][1] if compression else f'{FORMATS[fmt]}; charset=utf-8'
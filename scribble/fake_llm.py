@@ -0,0 +1,219 @@
+"""
+Local stand-in for the OpenRouter chat completions API.
+
+Speaks enough of the OpenAI-compatible protocol for llm_utils (openai client)
+and chat.ai_service (plain requests) to work against it: POST
+/api/v1/chat/completions, with or without ``stream``, and GET /api/v1/models.
+Latency, token rate and failures are configurable so chat endpoints can be
+load-tested without spending OpenRouter credits. Point OPENROUTER_BASE_URL at
+``server.base_url`` to use it.
+"""
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+FILLER_WORDS = (
+    'I would be happy to help you capture your story. We start with a relaxed '
+    'interview, then I draft each chapter and share it with you for review. '
+    'Most memoir projects take a few months and every package includes editing '
+    'and a printed copy.'
+).split()
+
+
+class FakeLLMServer(ThreadingHTTPServer):
+    """
+    Threaded HTTP server answering chat completion requests.
+
+    Args:
+        host, port: Address to bind; port 0 picks a free port
+        latency_ms: Time to first token
+        jitter_ms: Uniform random extra latency, 0..jitter_ms
+        tokens_per_second: Generation rate applied to ``completion_tokens``
+        completion_tokens: Words in each reply (one word counts as a token)
+        error_rate: Fraction of requests answered with ``error_status``
+        error_status: HTTP status used for injected errors (429, 500, 502...)
+        hang_rate: Fraction of requests that hang for ``hang_seconds`` to
+            exercise client timeouts
+        seed: Seed for the random generator, for reproducible runs
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+    # Load tests open dozens of connections at once; the default backlog is 5
+    request_queue_size = 256
+
+    def __init__(self, host='127.0.0.1', port=0, latency_ms=300, jitter_ms=0, tokens_per_second=50,
+                 completion_tokens=60, error_rate=0.0, error_status=500, hang_rate=0.0,
+                 hang_seconds=30, seed=None):
+        super().__init__((host, port), FakeLLMHandler)
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.tokens_per_second = tokens_per_second
+        self.completion_tokens = completion_tokens
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.hang_rate = hang_rate
+        self.hang_seconds = hang_seconds
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._thread = None
+        self.stats = {
+            'requests': 0, 'completed': 0, 'errors': 0, 'hangs': 0, 'in_flight': 0,
+            'max_in_flight': 0, 'prompt_tokens': 0, 'completion_tokens': 0,
+        }
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}/api/v1'
+
+    def start(self):
+        """Serve from a daemon thread and return self"""
+        self._thread = threading.Thread(target=self.serve_forever, name='fake-llm', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def next_outcome(self):
+        """Pick 'error', 'hang' or 'ok' for a request and its extra latency"""
+        with self._lock:
+            roll = self._random.random()
+            jitter = self._random.uniform(0, self.jitter_ms) if self.jitter_ms else 0
+        if roll < self.error_rate:
+            return 'error', jitter
+        if roll < self.error_rate + self.hang_rate:
+            return 'hang', jitter
+        return 'ok', jitter
+
+    def count(self, **deltas):
+        with self._lock:
+            for key, delta in deltas.items():
+                self.stats[key] += delta
+            self.stats['max_in_flight'] = max(self.stats['max_in_flight'], self.stats['in_flight'])
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.stats)
+
+
+class FakeLLMHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        # Keep benchmark output clean
+        pass
+
+    def _send_json(self, status, data):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.rstrip('/').endswith('/models'):
+            self._send_json(200, {'object': 'list', 'data': [{'id': 'fake/llm', 'object': 'model'}]})
+        else:
+            self._send_json(404, {'error': {'message': 'Not found'}})
+
+    def do_POST(self):
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            self._send_json(404, {'error': {'message': 'Not found'}})
+            return
+
+        length = int(self.headers.get('Content-Length') or 0)
+        try:
+            payload = json.loads(self.rfile.read(length) or b'{}')
+        except json.JSONDecodeError:
+            self._send_json(400, {'error': {'message': 'Invalid JSON'}})
+            return
+
+        server = self.server
+        server.count(requests=1, in_flight=1)
+        try:
+            outcome, jitter_ms = server.next_outcome()
+            if outcome == 'hang':
+                server.count(hangs=1)
+                time.sleep(server.hang_seconds)
+            time.sleep((server.latency_ms + jitter_ms) / 1000)
+
+            if outcome == 'error':
+                server.count(errors=1)
+                self._send_json(server.error_status, {
+                    'error': {'code': server.error_status, 'message': 'Injected failure from fake LLM server'}
+                })
+                return
+
+            messages = payload.get('messages') or []
+            prompt_tokens = sum(len(str(message.get('content', '')).split()) for message in messages)
+            words = [FILLER_WORDS[i % len(FILLER_WORDS)] for i in range(server.completion_tokens)]
+            model = payload.get('model') or 'fake/llm'
+
+            if payload.get('stream'):
+                self._stream(words, model)
+            else:
+                time.sleep(len(words) / server.tokens_per_second if server.tokens_per_second else 0)
+                self._send_json(200, {
+                    'id': f'chatcmpl-{uuid.uuid4().hex}',
+                    'object': 'chat.completion',
+                    'created': int(time.time()),
+                    'model': model,
+                    'choices': [{
+                        'index': 0,
+                        'message': {'role': 'assistant', 'content': self._content(words, messages)},
+                        'finish_reason': 'stop',
+                    }],
+                    'usage': {
+                        'prompt_tokens': prompt_tokens,
+                        'completion_tokens': len(words),
+                        'total_tokens': prompt_tokens + len(words),
+                    },
+                })
+            server.count(completed=1, prompt_tokens=prompt_tokens, completion_tokens=len(words))
+        finally:
+            server.count(in_flight=-1)
+
+    @staticmethod
+    def _content(words, messages):
+        text = ' '.join(words)
+        # ChatView asks for a JSON object with response/needs_admin_review/confidence
+        if any('JSON object' in str(message.get('content', '')) for message in messages):
+            return json.dumps({'response': text, 'needs_admin_review': False, 'confidence': 0.9})
+        return text
+
+    def _stream(self, words, model):
+        """Server-sent events, one word per chunk at the configured token rate"""
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+        completion_id = f'chatcmpl-{uuid.uuid4().hex}'
+        delay = 1 / self.server.tokens_per_second if self.server.tokens_per_second else 0
+        for index, word in enumerate(words):
+            chunk = {
+                'id': completion_id,
+                'object': 'chat.completion.chunk',
+                'created': int(time.time()),
+                'model': model,
+                'choices': [{'index': 0, 'delta': {'content': word if index == 0 else f' {word}'},
+                             'finish_reason': None}],
+            }
+            self.wfile.write(f'data: {json.dumps(chunk)}\n\n'.encode())
+            self.wfile.flush()
+            time.sleep(delay)
+        self.wfile.write(b'data: [DONE]\n\n')
+        self.wfile.flush()
@@ -0,0 +1,125 @@
+"""
+Content fingerprints for knowledge base deduplication.
+
+Files are identified by the SHA-256 of their bytes, stored on
+``KnowledgeDocument.content_hash`` at upload and on every indexed chunk's
+metadata as ``file_hash``. Chunks are identified by a short hash of their
+normalized text (case folded, punctuation and whitespace collapsed), so the
+same passage extracted from two copies of a PDF, or with different line
+wrapping, maps to one vector.
+"""
+import hashlib
+import os
+import pickle
+import re
+
+FILE_HASH_BLOCK = 1024 * 1024
+
+_NON_WORD = re.compile(r'[\W_]+')
+
+
+def file_sha256(source):
+    """
+    SHA-256 hex digest of a file, read in blocks.
+
+    Args:
+        source: A filesystem path or a Django File/UploadedFile. File objects
+            are rewound afterwards so they can still be saved.
+    """
+    digest = hashlib.sha256()
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, 'rb') as f:
+            for block in iter(lambda: f.read(FILE_HASH_BLOCK), b''):
+                digest.update(block)
+        return digest.hexdigest()
+
+    source.seek(0)
+    for block in source.chunks(FILE_HASH_BLOCK):
+        digest.update(block)
+    source.seek(0)
+    return digest.hexdigest()
+
+
+def normalize_text(text):
+    return _NON_WORD.sub(' ', text.casefold()).strip()
+
+
+def chunk_fingerprint(text):
+    """Hash of a chunk's normalized text; empty for chunks with no words"""
+    normalized = normalize_text(text)
+    if not normalized:
+        return ''
+    return hashlib.blake2b(normalized.encode('utf-8'), digest_size=16).hexdigest()
+
+
+class Fingerprints:
+    """
+    File and chunk hashes already in an index (or seen earlier in a run).
+
+    A chunk is indexed once, under the first file it came from; ``shared``
+    maps the hash of each dropped repeat to the other files that contain it,
+    so deleting the first file can hand the chunk on (vector_index.rehome).
+    """
+
+    def __init__(self, files=None, chunks=None):
+        self.files = set(files or ())
+        self.chunks = set(chunks or ())
+        self.shared = {}
+
+    def add_document(self, document, exclude_files=()):
+        file_hash = document.metadata.get('file_hash')
+        if file_hash in exclude_files:
+            return
+        if file_hash:
+            self.files.add(file_hash)
+        chunk_hash = document.metadata.get('chunk_hash') or chunk_fingerprint(document.page_content)
+        if chunk_hash:
+            self.chunks.add(chunk_hash)
+
+    @classmethod
+    def from_vectorstore(cls, vectorstore):
+        fingerprints = cls()
+        if vectorstore is not None:
+            for document in vectorstore.docstore._dict.values():
+                fingerprints.add_document(document)
+        return fingerprints
+
+    @classmethod
+    def from_store_path(cls, store_path, exclude_files=()):
+        """
+        Read the fingerprints of a saved FAISS store without loading it.
+
+        FAISS.load_local needs an embeddings instance, which means loading the
+        embedding model; the docstore pickle alone is enough here. Stores
+        written before fingerprints were added have no ``file_hash``
+        metadata, so only their chunk hashes are recovered. Chunks of
+        ``exclude_files`` (deleted documents awaiting compaction) are left out.
+        """
+        docstore_file = os.path.join(store_path, 'index.pkl')
+        if not os.path.exists(docstore_file):
+            return cls()
+        # Same trust as FAISS.load_local(allow_dangerous_deserialization=True):
+        # this is the store ingest itself wrote
+        with open(docstore_file, 'rb') as f:
+            docstore, _ = pickle.load(f)
+        fingerprints = cls()
+        for document in docstore._dict.values():
+            fingerprints.add_document(document, exclude_files)
+        return fingerprints
+
+    def iter_new(self, chunks):
+        """Yield the chunks whose text isn't indexed yet, recording them as seen"""
+        for chunk in chunks:
+            chunk_hash = chunk.metadata.get('chunk_hash') or chunk_fingerprint(chunk.page_content)
+            if not chunk_hash:
+                continue
+            if chunk_hash in self.chunks:
+                if chunk.metadata.get('file_hash'):
+                    self.shared.setdefault(chunk_hash, set()).add(chunk.metadata['file_hash'])
+                continue
+            self.chunks.add(chunk_hash)
+            chunk.metadata['chunk_hash'] = chunk_hash
+            yield chunk
+
+    def filter_new(self, chunks):
+        return list(self.iter_new(chunks))
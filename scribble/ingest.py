@@ -1,14 +1,21 @@
 import os
+import logging
+import time
+import threading
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, as_completed, wait
 from pathlib import Path
-from langchain_community.document_loaders import PyPDFLoader, TextLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_community.vectorstores import FAISS
 from dotenv import load_dotenv
 
+from . import vector_index
+from .fingerprints import Fingerprints, chunk_fingerprint, file_sha256
+
 # Load environment variables
 load_dotenv()
 
+# LangChain loaders, splitters, FAISS and the HuggingFace stack (torch,
+# transformers) are imported inside the functions that use them. Importing
+# this module, e.g. through URL routing in `manage.py migrate`, stays cheap.
+
 # Configuration
 import os
 from pathlib import Path
@@ -21,22 +28,332 @@ CHUNK_OVERLAP = 50
 MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
 VECTOR_STORE_PATH = str(PROJECT_ROOT / "vectorstore")
 
+# Chunks per embed_documents() call in ingest_directory()
+EMBED_BATCH_SIZE = 256
+# Text files are streamed in blocks of about this many characters
+TEXT_BLOCK_CHARS = 64 * 1024
+
+logger = logging.getLogger(__name__)
+
 # Initialize embeddings as None - will be loaded when needed
 _embeddings = None
+_embeddings_lock = threading.Lock()
 
 def get_embeddings():
-    """Lazily load and return the embeddings model"""
+    """Lazily load and return the embeddings model (once, even with concurrent callers)"""
     global _embeddings
     if _embeddings is None:
-        _embeddings = HuggingFaceEmbeddings(model_name=MODEL_NAME)
+        with _embeddings_lock:
+            if _embeddings is None:
+                from langchain_huggingface import HuggingFaceEmbeddings
+                _embeddings = HuggingFaceEmbeddings(model_name=MODEL_NAME)
     return _embeddings
 
-def load_documents(docs_dir: str = "knowledge_base"):
+def _load_file(file_path):
+    """
+    Load one knowledge base file into page documents.
+
+    Module level so it can run in a worker process. Returns an empty list for
+    missing, empty, unsupported or unreadable files.
+    """
+    from langchain_community.document_loaders import PyPDFLoader, TextLoader
+    
+    file_name = file_path.name
+    try:
+        logger.info(f"Processing file: {file_name}")
+
+        # Check file exists and has content
+        if not file_path.exists():
+            logger.warning(f"File not found: {file_path}")
+            return []
+
+        file_size = file_path.stat().st_size
+        logger.debug(f"File size: {file_size} bytes")
+
+        if file_size == 0:
+            logger.warning(f"Skipping empty file: {file_path}")
+            return []
+
+        # Load document based on file type
+        loader = None
+        try:
+            if file_path.suffix.lower() == ".pdf":
+                logger.info("Initializing PDF loader...")
+                loader = PyPDFLoader(str(file_path))
+                logger.info("PDF loader initialized")
+            elif file_path.suffix.lower() in [".txt", ".md"]:
+                logger.info("Initializing text loader...")
+                loader = TextLoader(str(file_path), autodetect_encoding=True)
+                logger.info("Text loader initialized")
+            else:
+                logger.warning(f"Unsupported file format: {file_path.suffix}")
+                return []
+
+            # Load and validate documents
+            logger.info("Loading document content...")
+            loaded_docs = loader.load()
+            logger.info(f"Loaded {len(loaded_docs) if loaded_docs else 0} pages")
+
+            if not loaded_docs:
+                logger.warning(f"No content loaded from {file_name}")
+                # Try reading raw content as fallback
+                try:
+                    with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
+                        content = f.read()
+                        if content.strip():
+                            from langchain.schema import Document
+                            loaded_docs = [Document(page_content=content, metadata={"source": str(file_path)})]
+                            logger.info("Successfully loaded content using fallback method")
+                except Exception as read_error:
+                    logger.error(f"Fallback content reading failed: {str(read_error)}")
+
+                if not loaded_docs:
+                    return []
+
+            # Log first 100 chars of content for verification
+            file_hash = file_sha256(file_path)
+            for i, doc in enumerate(loaded_docs):
+                doc.metadata["file_hash"] = file_hash
+                logger.debug(f"Page {i+1} preview: {doc.page_content[:100]}...")
+
+            logger.info(f"Successfully added {len(loaded_docs)} pages from {file_name}")
+            return loaded_docs
+
+        except Exception as loader_error:
+            logger.error(f"Error in document loader for {file_name}: {str(loader_error)}", exc_info=True)
+            return []
+
+    except Exception as e:
+        logger.error(f"Unexpected error processing {file_name}: {str(e)}", exc_info=True)
+        return []
+
+def _load_file_timed(file_path):
+    started = time.perf_counter()
+    pages = _load_file(file_path)
+    return file_path, pages, time.perf_counter() - started
+
+def iter_pages(file_path):
+    """
+    Yield the pages of one file lazily.
+    
+    PDFs are read page by page. Text files are read in blocks of about
+    TEXT_BLOCK_CHARS cut at line breaks, so a large file is never held in
+    memory whole; a file smaller than one block gives the same single page
+    TextLoader would.
+    """
+    file_path = Path(file_path)
+    suffix = file_path.suffix.lower()
+    if suffix == ".pdf":
+        from langchain_community.document_loaders import PyPDFLoader
+        yield from PyPDFLoader(str(file_path)).lazy_load()
+        return
+    if suffix not in (".txt", ".md"):
+        logger.warning(f"Unsupported file format: {file_path.suffix}")
+        return
+    
+    from langchain.schema import Document
+    
+    metadata = {"source": str(file_path)}
+    buffer = ""
+    with open(file_path, "r", encoding="utf-8", errors="ignore") as f:
+        for block in iter(lambda: f.read(TEXT_BLOCK_CHARS), ""):
+            buffer += block
+            cut = buffer.rfind("\n")
+            if cut == -1:
+                # No line break yet; only cut mid-line once the buffer is large
+                if len(buffer) < 4 * TEXT_BLOCK_CHARS:
+                    continue
+                cut = len(buffer) - 1
+            if buffer[:cut + 1].strip():
+                yield Document(page_content=buffer[:cut + 1], metadata=dict(metadata))
+            buffer = buffer[cut + 1:]
+    if buffer.strip():
+        yield Document(page_content=buffer, metadata=dict(metadata))
+
+def iter_chunks(pages):
+    """Split pages into chunks one page at a time, fingerprinting each chunk"""
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+    
+    splitter = RecursiveCharacterTextSplitter(
+        chunk_size=CHUNK_SIZE,
+        chunk_overlap=CHUNK_OVERLAP,
+        length_function=len,
+    )
+    for page in pages:
+        if page.page_content and page.page_content.strip():
+            for chunk in splitter.split_documents([page]):
+                chunk.metadata["chunk_hash"] = chunk_fingerprint(chunk.page_content)
+                yield chunk
+
+def iter_batches(items, batch_size):
+    """Group an iterable into lists of ``batch_size`` (the last may be shorter)"""
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+class _Counter:
+    """Pass items through while counting them"""
+    def __init__(self, items):
+        self.items = items
+        self.count = 0
+    
+    def __iter__(self):
+        for item in self.items:
+            self.count += 1
+            yield item
+
+def _chunk_file(file_path):
+    """Worker for iter_file_chunks(): returns (path, pages, chunks, seconds, error)"""
+    started = time.perf_counter()
+    pages = _Counter(iter_pages(file_path))
+    try:
+        chunks = list(iter_chunks(pages))
+        error = None
+    except Exception as e:
+        logger.error(f"Error processing {file_path.name}: {str(e)}", exc_info=True)
+        chunks, error = [], str(e)
+    return file_path, pages.count, chunks, time.perf_counter() - started, error
+
+def iter_file_chunks(files, workers=1, report=None, fingerprints=None):
+    """
+    Yield the chunks of every file, streaming.
+    
+    Files are hashed first; a file whose bytes are already in
+    ``fingerprints`` (indexed before, or an earlier copy in this run) is
+    skipped without being parsed. Chunks carry ``file_hash`` and
+    ``chunk_hash`` metadata.
+    
+    With one worker each file is read page by page and chunked as it is
+    pulled, so only one page is in memory at a time. With more, files are
+    chunked in a process pool with at most ``2 * workers`` files in flight;
+    new files are only handed out as the consumer catches up, which keeps
+    memory bounded when embedding is slower than parsing.
+    
+    Per-file results (pages, chunks, seconds, error, duplicate) are appended
+    to ``report['files']`` as each file finishes.
+    """
+    report = report if report is not None else {}
+    report.setdefault('files', [])
+    fingerprints = fingerprints if fingerprints is not None else Fingerprints()
+    
+    def record(file_path, pages, chunks, seconds, error, duplicate=False):
+        report['files'].append({
+            'file': file_path.name,
+            'file_hash': file_hashes.get(file_path),
+            'pages': pages,
+            'chunks': chunks,
+            'seconds': round(seconds, 3),
+            'error': error,
+            'duplicate': duplicate,
+        })
+        if duplicate:
+            logger.info(f"{file_path.name}: already indexed, skipped")
+        else:
+            logger.info(f"{file_path.name}: {pages} pages, {chunks} chunks in {seconds:.2f}s")
+    
+    def tagged(chunks, file_path):
+        for chunk in chunks:
+            chunk.metadata["file_hash"] = file_hashes[file_path]
+            yield chunk
+    
+    # Hashing reads each file once sequentially, far cheaper than parsing it
+    file_hashes = {}
+    new_files = []
+    for file_path in files:
+        try:
+            file_hash = file_sha256(file_path)
+        except OSError as e:
+            record(file_path, 0, 0, 0, str(e))
+            continue
+        file_hashes[file_path] = file_hash
+        if file_hash in fingerprints.files:
+            record(file_path, 0, 0, 0, None, duplicate=True)
+            continue
+        fingerprints.files.add(file_hash)
+        new_files.append(file_path)
+    files = new_files
+    
+    if workers <= 1 or len(files) <= 1:
+        for file_path in files:
+            started = time.perf_counter()
+            pages = _Counter(iter_pages(file_path))
+            chunk_count, error = 0, None
+            try:
+                for chunk in tagged(iter_chunks(pages), file_path):
+                    chunk_count += 1
+                    yield chunk
+            except Exception as e:
+                logger.error(f"Error processing {file_path.name}: {str(e)}", exc_info=True)
+                error = str(e)
+            record(file_path, pages.count, chunk_count, time.perf_counter() - started, error)
+        return
+    
+    # Largest files first so a big PDF doesn't start last and hold up the run
+    pending_files = iter(sorted(files, key=lambda file_path: file_path.stat().st_size, reverse=True))
+    max_in_flight = 2 * workers
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        in_flight = set()
+        
+        def submit_more():
+            while len(in_flight) < max_in_flight:
+                file_path = next(pending_files, None)
+                if file_path is None:
+                    return
+                in_flight.add(executor.submit(_chunk_file, file_path))
+        
+        submit_more()
+        while in_flight:
+            done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                file_path, pages, chunks, seconds, error = future.result()
+                record(file_path, pages, len(chunks), seconds, error)
+                yield from tagged(chunks, file_path)
+            submit_more()
+
+def default_workers(file_count):
+    """
+    Number of parser processes for ``file_count`` files.
+
+    One per available CPU (respecting container CPU affinity), minus one left
+    for the embedding stage, and never more than there are files.
+    """
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    return max(1, min(file_count, cpus - 1))
+
+def _map_files(func, files, workers=None):
+    """
+    Run ``func(path)`` for every file in a process pool, yielding results as
+    they finish. Runs inline for a single file or worker, where a pool would
+    only add start-up cost.
+    """
+    workers = workers or default_workers(len(files))
+    if workers <= 1 or len(files) <= 1:
+        for file_path in files:
+            yield func(file_path)
+        return
+    
+    # Largest files first so a big PDF doesn't start last and hold up the run
+    ordered = sorted(files, key=lambda file_path: file_path.stat().st_size, reverse=True)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(func, file_path) for file_path in ordered]
+        for future in as_completed(futures):
+            yield future.result()
+
+def load_documents(docs_dir: str = "knowledge_base", workers: int = None):
     """
     Load documents from the knowledge base directory with detailed logging.
     
     Args:
         docs_dir: Directory containing the documents to load
+        workers: Parser processes to use; defaults to default_workers()
         
     Returns:
         List of loaded document objects
@@ -76,73 +393,28 @@ def load_documents(docs_dir: str = "knowledge_base"):
         logger.warning(f"No files found in {docs_dir}")
         return []
     
+    started = time.perf_counter()
+    pages_by_file = {}
+    for file_path, pages, seconds in _map_files(_load_file_timed, files, workers):
+        pages_by_file[file_path] = pages
+        logger.info(f"{file_path.name}: {len(pages)} pages in {seconds:.2f}s")
+    
+    # Keep directory order regardless of which worker finished first, and
+    # only take the first of several byte-identical copies of a file
+    seen_hashes = set()
     for file_path in files:
-        file_name = file_path.name
-        try:
-            logger.info(f"Processing file: {file_name}")
-            
-            # Check file exists and has content
-            if not file_path.exists():
-                logger.warning(f"File not found: {file_path}")
-                continue
-                
-            file_size = file_path.stat().st_size
-            logger.debug(f"File size: {file_size} bytes")
-                
-            if file_size == 0:
-                logger.warning(f"Skipping empty file: {file_path}")
-                continue
-                
-            # Load document based on file type
-            loader = None
-            try:
-                if file_path.suffix.lower() == ".pdf":
-                    logger.info("Initializing PDF loader...")
-                    loader = PyPDFLoader(str(file_path))
-                    logger.info("PDF loader initialized")
-                elif file_path.suffix.lower() in [".txt", ".md"]:
-                    logger.info("Initializing text loader...")
-                    loader = TextLoader(str(file_path), autodetect_encoding=True)
-                    logger.info("Text loader initialized")
-                else:
-                    logger.warning(f"Unsupported file format: {file_path.suffix}")
-                    continue
-                    
-                # Load and validate documents
-                logger.info("Loading document content...")
-                loaded_docs = loader.load()
-                logger.info(f"Loaded {len(loaded_docs) if loaded_docs else 0} pages")
-                
-                if not loaded_docs:
-                    logger.warning(f"No content loaded from {file_name}")
-                    # Try reading raw content as fallback
-                    try:
-                        with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-                            content = f.read()
-                            if content.strip():
-                                from langchain.schema import Document
-                                loaded_docs = [Document(page_content=content, metadata={"source": str(file_path)})]
-                                logger.info("Successfully loaded content using fallback method")
-                    except Exception as read_error:
-                        logger.error(f"Fallback content reading failed: {str(read_error)}")
-                    
-                    if not loaded_docs:
-                        continue
-                
-                # Log first 100 chars of content for verification
-                for i, doc in enumerate(loaded_docs):
-                    logger.debug(f"Page {i+1} preview: {doc.page_content[:100]}...")
-                    
-                documents.extend(loaded_docs)
-                logger.info(f"Successfully added {len(loaded_docs)} pages from {file_name}")
-                
-            except Exception as loader_error:
-                logger.error(f"Error in document loader for {file_name}: {str(loader_error)}", exc_info=True)
-                continue
-                
-        except Exception as e:
-            logger.error(f"Unexpected error processing {file_name}: {str(e)}", exc_info=True)
+        pages = pages_by_file.get(file_path, [])
+        file_hash = pages[0].metadata.get("file_hash") if pages else None
+        if file_hash and file_hash in seen_hashes:
+            logger.info(f"Skipping {file_path.name}: same content as an earlier file")
             continue
+        seen_hashes.add(file_hash)
+        documents.extend(pages)
+    
+    elapsed = time.perf_counter() - started
+    if elapsed > 0:
+        logger.info(f"Loaded {len(documents)} pages from {len(files)} files in {elapsed:.2f}s "
+                    f"({len(documents) / elapsed:.1f} pages/s)")
     
     logger.info(f"Completed loading. Total documents loaded: {len(documents)}")
     return documents
@@ -158,6 +430,7 @@ def chunk_documents(documents):
         List of document chunks
     """
     import logging
+    from langchain.text_splitter import CharacterTextSplitter, RecursiveCharacterTextSplitter
     logger = logging.getLogger(__name__)
     
     if not documents:
@@ -264,13 +537,18 @@ def chunk_documents(documents):
 
 def create_vector_store(chunks):
     """Create and save FAISS vector store."""
+    from langchain_community.vectorstores import FAISS
+    
     # Get embeddings (will be loaded if not already)
     embeddings = get_embeddings()
     
-    # Create and save vector store
+    # Create and save vector store, one vector per distinct chunk
+    fingerprints = Fingerprints()
+    chunks = fingerprints.filter_new(chunks)
     vectorstore = FAISS.from_documents(chunks, embeddings)
     os.makedirs(VECTOR_STORE_PATH, exist_ok=True)
     vectorstore.save_local(VECTOR_STORE_PATH)
+    vector_index.record_shared(VECTOR_STORE_PATH, fingerprints.shared)
     return vectorstore
 
 def create_or_update_vector_store(chunks):
@@ -283,7 +561,13 @@ def create_or_update_vector_store(chunks):
     Returns:
         FAISS vector store instance or None if failed
     """
+    # One writer at a time, or concurrent uploads would save over each other
+    with vector_index.store_lock(VECTOR_STORE_PATH):
+        return _create_or_update_vector_store(chunks)
+
+def _create_or_update_vector_store(chunks):
     import logging
+    from langchain_community.vectorstores import FAISS
     logger = logging.getLogger(__name__)
     
     if not chunks:
@@ -292,6 +576,12 @@ def create_or_update_vector_store(chunks):
         
     logger.info(f"Starting vector store creation/update with {len(chunks)} chunks")
     
+    # Collapse repeated passages (e.g. several copies of the same PDF) first
+    seen = Fingerprints()
+    chunks = seen.filter_new(chunks)
+    shared = seen.shared
+    logger.info(f"{len(chunks)} distinct chunks after deduplication")
+    
     try:
         # Get embeddings (will be loaded if not already)
         logger.info(f"Initializing embeddings with model: {MODEL_NAME}")
@@ -302,6 +592,7 @@ def create_or_update_vector_store(chunks):
         index_file = os.path.join(VECTOR_STORE_PATH, "index.faiss")
         
         # Try to load existing vector store if it exists
+        purged = set()
         if os.path.exists(index_file):
             try:
                 logger.info("Loading existing vector store...")
@@ -312,11 +603,21 @@ def create_or_update_vector_store(chunks):
                 )
                 logger.info("Successfully loaded existing vector store")
                 
-                # Add new chunks
-                logger.info(f"Adding {len(chunks)} new chunks to existing vector store")
+                # Drop deleted documents' vectors while the index is rewritten anyway
+                purged = vector_index.purge_deleted(vectorstore, VECTOR_STORE_PATH)
+                
+                # Add only chunks that aren't indexed already
+                indexed = Fingerprints.from_vectorstore(vectorstore)
+                new_chunks = indexed.filter_new(chunks)
+                for chunk_hash, file_hashes in indexed.shared.items():
+                    shared.setdefault(chunk_hash, set()).update(file_hashes)
+                logger.info(f"Adding {len(new_chunks)} new chunks to existing vector store "
+                            f"({len(chunks) - len(new_chunks)} already indexed)")
                 try:
-                    if hasattr(vectorstore, 'add_documents') and callable(vectorstore.add_documents):
-                        vectorstore.add_documents(chunks)
+                    if not new_chunks:
+                        pass
+                    elif hasattr(vectorstore, 'add_documents') and callable(vectorstore.add_documents):
+                        vectorstore.add_documents(new_chunks)
                         logger.info("Successfully added documents to existing vector store")
                     else:
                         logger.warning("add_documents not available, creating new vector store")
@@ -337,7 +638,9 @@ def create_or_update_vector_store(chunks):
         # Save the vector store
         logger.info("Saving vector store...")
         try:
-            vectorstore.save_local(VECTOR_STORE_PATH)
+            vector_index.save_atomic(vectorstore, VECTOR_STORE_PATH)
+            vector_index.clear_tombstones(VECTOR_STORE_PATH, purged)
+            vector_index.record_shared(VECTOR_STORE_PATH, shared)
             logger.info(f"Vector store saved to {VECTOR_STORE_PATH}")
             
             # Verify the save
@@ -362,55 +665,166 @@ def create_or_update_vector_store(chunks):
         logger.error(f"Critical error in create_or_update_vector_store: {str(e)}", exc_info=True)
         return None
 
-def main():
+def ingest_directory(docs_dir="knowledge_base", workers=None, batch_size=EMBED_BATCH_SIZE, vectorstore=None,
+                     fingerprints=None):
+    """
+    Parse, chunk, embed and index every document in a directory as a pipeline.
+    
+    The stages are generators: pages -> chunks (iter_file_chunks) -> fixed
+    size batches (iter_batches) -> embedding and incremental index add. Each
+    stage pulls from the previous one, so apart from the index itself memory
+    is bounded by one embedding batch plus the files in flight, whatever the
+    size of the corpus.
+    
+    Files already indexed (same bytes) are skipped before parsing, and chunks
+    whose normalized text is already indexed are dropped before embedding.
+    
+    Args:
+        docs_dir: Directory containing the documents
+        workers: Parser processes; defaults to default_workers(). With one
+            worker everything streams in this process.
+        batch_size: Chunks per embedding call
+        vectorstore: Existing FAISS store to add to; a new one is created if None
+        fingerprints: Fingerprints of what is already indexed; read from
+            ``vectorstore`` if not given
+        
+    Returns:
+        tuple: (vectorstore or None if nothing was indexed, report). The report
+        has per-file page/chunk counts and seconds, totals, duplicate file and
+        chunk counts, and pages/s and chunks/s over the whole run.
+    """
+    from langchain_community.vectorstores import FAISS
+    
+    docs_path = Path(docs_dir).resolve()
+    files = sorted(f for f in docs_path.glob("*") if f.is_file()) if docs_path.exists() else []
+    workers = workers or default_workers(len(files))
+    if fingerprints is None:
+        fingerprints = Fingerprints.from_vectorstore(vectorstore)
+    report = {
+        'workers': workers,
+        'batch_size': batch_size,
+        'files': [],
+        'indexed_chunks': 0,
+        'embed_seconds': 0.0,
+    }
+    started = time.perf_counter()
+    
+    chunks = fingerprints.iter_new(iter_file_chunks(files, workers, report, fingerprints))
+    for batch in iter_batches(chunks, batch_size):
+        batch_started = time.perf_counter()
+        # Loaded on first use, after any worker processes have been forked
+        embeddings = get_embeddings()
+        texts = [chunk.page_content for chunk in batch]
+        text_embeddings = list(zip(texts, embeddings.embed_documents(texts)))
+        metadatas = [chunk.metadata for chunk in batch]
+        if vectorstore is None:
+            vectorstore = FAISS.from_embeddings(text_embeddings, embeddings, metadatas=metadatas)
+        else:
+            vectorstore.add_embeddings(text_embeddings, metadatas=metadatas)
+        report['indexed_chunks'] += len(batch)
+        report['embed_seconds'] += time.perf_counter() - batch_started
+    
+    elapsed = time.perf_counter() - started
+    report['pages'] = sum(file_report['pages'] for file_report in report['files'])
+    report['chunks'] = sum(file_report['chunks'] for file_report in report['files'])
+    report['duplicate_files'] = sum(file_report['duplicate'] for file_report in report['files'])
+    report['duplicate_chunks'] = report['chunks'] - report['indexed_chunks']
+    report['embed_seconds'] = round(report['embed_seconds'], 3)
+    report['wall_seconds'] = round(elapsed, 3)
+    report['pages_per_second'] = round(report['pages'] / elapsed, 1) if elapsed else 0
+    report['chunks_per_second'] = round(report['chunks'] / elapsed, 1) if elapsed else 0
+    logger.info(
+        f"Indexed {report['chunks']} chunks from {report['pages']} pages in {elapsed:.2f}s with "
+        f"{workers} workers ({report['pages_per_second']} pages/s, {report['chunks_per_second']} chunks/s); "
+        f"skipped {report['duplicate_files']} duplicate files and {report['duplicate_chunks']} duplicate chunks"
+    )
+    return vectorstore, report
+
+def main(workers=None, batch_size=EMBED_BATCH_SIZE):
     """
     Main function to load, chunk, and index documents with comprehensive error handling.
+    
+    Files are parsed and chunked in parallel and embedded in batches by
+    ingest_directory(); the new chunks are merged into the existing vector store.
     """
+    from langchain_community.vectorstores import FAISS
+    
     try:
         print("=" * 50)
         print("Starting document processing...")
         print("-" * 50)
         
-        # Step 1: Load documents
-        print("\n[1/3] Loading documents...")
-        documents = load_documents()
+        # Step 1: Parse, chunk and embed documents. The existing store is only
+        # loaded afterwards so the embedding model isn't in memory while the
+        # parser processes are forked; its fingerprints come from the docstore.
+        # Deleted documents don't count as indexed, so re-adding one works.
+        print("\n[1/3] Parsing, chunking and embedding documents...")
+        fingerprints = Fingerprints.from_store_path(
+            VECTOR_STORE_PATH, exclude_files=vector_index.deleted_hashes(VECTOR_STORE_PATH)
+        )
+        vector_store, report = ingest_directory(
+            workers=workers, batch_size=batch_size, fingerprints=fingerprints
+        )
         
-        if not documents:
+        if vector_store is None and (report['duplicate_files'] or report['duplicate_chunks']):
+            vector_index.record_shared(VECTOR_STORE_PATH, fingerprints.shared)
+            print(f"\n✓ Nothing new to index: {report['duplicate_files']} files and "
+                  f"{report['duplicate_chunks']} chunks are already in the vector store")
+            return True
+        
+        if not report['chunks']:
             print("\nError: No valid documents found to process.")
             print("Please add documents to the knowledge_base/ directory.")
             return False
         
-        print(f"\n✓ Successfully loaded {len(documents)} documents")
-        
-        # Step 2: Chunk documents
-        print("\n[2/3] Chunking documents...")
-        chunks = chunk_documents(documents)
-        
-        if not chunks:
-            print("\nError: Failed to create chunks from documents.")
-            print("This might be due to empty documents or unsupported content.")
-            return False
-        
-        print(f"\n✓ Created {len(chunks)} chunks from documents")
+        for file_report in report['files']:
+            if file_report['duplicate']:
+                print(f"  {file_report['file']}: already indexed, skipped")
+                continue
+            print(f"  {file_report['file']}: {file_report['pages']} pages, "
+                  f"{file_report['chunks']} chunks in {file_report['seconds']}s")
+        print(f"\n✓ Created {report['chunks']} chunks from {report['pages']} pages with {report['workers']} workers "
+              f"in {report['wall_seconds']}s ({report['pages_per_second']} pages/s, "
+              f"{report['chunks_per_second']} chunks/s, {report['embed_seconds']}s embedding)")
+        print(f"  Indexed {report['indexed_chunks']} new chunks, skipped {report['duplicate_files']} duplicate "
+              f"files and {report['duplicate_chunks']} duplicate chunks")
         
-        # Step 3: Create/update vector store
-        print("\n[3/3] Creating/updating vector store...")
-        try:
-            vector_store = create_or_update_vector_store(chunks)
-            if vector_store is None:
-                raise Exception("Vector store creation returned None")
-                
-            print("\n✓ Vector store created/updated successfully!")
-            print("\nDocument processing completed successfully!")
-            print("=" * 50)
-            return True
+        with vector_index.store_lock(VECTOR_STORE_PATH):
+            # Step 2: Add the new chunks to the existing vector store, if any,
+            # dropping the vectors of deleted documents while it is rewritten
+            print("\n[2/3] Merging into existing vector store...")
+            purged = set()
+            if os.path.exists(os.path.join(VECTOR_STORE_PATH, "index.faiss")):
+                try:
+                    existing = FAISS.load_local(
+                        VECTOR_STORE_PATH,
+                        get_embeddings(),
+                        allow_dangerous_deserialization=True
+                    )
+                    purged = vector_index.purge_deleted(existing, VECTOR_STORE_PATH)
+                    existing.merge_from(vector_store)
+                    vector_store = existing
+                    print("✓ Merged into existing vector store")
+                except Exception as e:
+                    print(f"Could not load existing vector store, replacing it: {str(e)}")
             
-        except Exception as e:
-            print("\nError: Failed to create/update vector store")
-            print(f"Details: {str(e)}")
-            import traceback
-            traceback.print_exc()
-            return False
+            # Step 3: Save the vector store
+            print("\n[3/3] Saving vector store...")
+            try:
+                vector_index.save_atomic(vector_store, VECTOR_STORE_PATH)
+                vector_index.clear_tombstones(VECTOR_STORE_PATH, purged)
+                vector_index.record_shared(VECTOR_STORE_PATH, fingerprints.shared)
+            except Exception as e:
+                print("\nError: Failed to create/update vector store")
+                print(f"Details: {str(e)}")
+                import traceback
+                traceback.print_exc()
+                return False
+        
+        print("\n✓ Vector store created/updated successfully!")
+        print("\nDocument processing completed successfully!")
+        print("=" * 50)
+        return True
             
     except Exception as e:
         print("\nAn unexpected error occurred during document processing:")
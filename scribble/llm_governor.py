@@ -0,0 +1,188 @@
+"""
+Admission control for outbound LLM calls.
+
+At most LLM_MAX_CONCURRENCY calls to OpenRouter are in flight at once. Each
+call holds a slot: a key in the LLM_GOVERNOR_CACHE cache, taken with
+``add()`` (atomic in Redis and the local-memory cache). The key expires
+after LLM_SLOT_LEASE seconds, so slots held by a killed worker come back.
+With Redis (REDIS_URL) the limit covers the whole cluster. With the
+local-memory cache it applies per worker process.
+
+A caller that finds every slot taken waits in a bounded queue and polls for
+a free slot until its deadline (LLM_QUEUE_TIMEOUT). High priority callers go
+first: normal priority callers don't take a slot while a high priority one
+is waiting. High priority means signed-in users and returning conversations.
+Once LLM_QUEUE_MAX callers are waiting, new ones are turned away at once
+with LLMOverloaded, which the chat views answer with 503 and Retry-After,
+rather than piling more requests onto OpenRouter and getting 429s.
+"""
+import logging
+import math
+import random
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .metrics import LLM_ADMISSIONS, LLM_QUEUE_DEPTH, LLM_QUEUE_WAIT_SECONDS, LLM_SLOTS_IN_USE
+from .timing import stage
+
+logger = logging.getLogger(__name__)
+
+HIGH, NORMAL = 'high', 'normal'
+POLL_SECONDS = 0.05
+KEY_PREFIX = 'llm-governor'
+
+# Moving average of how long a slot is held, for Retry-After estimates
+_hold_seconds = 3.0
+_hold_lock = threading.Lock()
+
+
+class LLMOverloaded(Exception):
+    """No LLM call slot could be had; try again after ``retry_after`` seconds"""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class Slot:
+    def __init__(self, key, token, priority):
+        self.key = key
+        self.token = token
+        self.priority = priority
+        self.acquired_at = time.monotonic()
+
+
+def _cache():
+    return caches[getattr(settings, 'LLM_GOVERNOR_CACHE', 'default')]
+
+
+def _limit():
+    return getattr(settings, 'LLM_MAX_CONCURRENCY', 64)
+
+
+def _waiting_key(priority):
+    return f'{KEY_PREFIX}:waiting:{priority}'
+
+
+def _add_waiting(priority, delta):
+    """Adjust the shared count of waiters; returns the new total over all priorities"""
+    cache = _cache()
+    key = _waiting_key(priority)
+    # A count leaked by a killed worker resets once the queue sits idle
+    timeout = max(getattr(settings, 'LLM_QUEUE_TIMEOUT', 15) * 4, 60)
+    cache.add(key, 0, timeout)
+    try:
+        cache.incr(key, delta)
+    except ValueError:  # expired between add() and incr()
+        cache.add(key, max(delta, 0), timeout)
+    cache.touch(key, timeout)
+    return queue_depth()
+
+
+def queue_depth():
+    counts = _cache().get_many([_waiting_key(HIGH), _waiting_key(NORMAL)])
+    return sum(max(count, 0) for count in counts.values())
+
+
+def retry_after():
+    """Seconds until a slot is likely free, from queue depth and typical hold time"""
+    limit = _limit() or 1
+    with _hold_lock:
+        hold = _hold_seconds
+    return max(1, math.ceil((queue_depth() / limit + 1) * hold))
+
+
+def try_acquire(priority=NORMAL):
+    """
+    Take a free slot without waiting.
+
+    Returns:
+        Slot or None: None when all slots are taken, or when ``priority`` is
+        normal and a high priority caller is waiting
+    """
+    limit = _limit()
+    cache = _cache()
+    if priority != HIGH and (cache.get(_waiting_key(HIGH)) or 0) > 0:
+        return None
+    token = uuid.uuid4().hex
+    lease = getattr(settings, 'LLM_SLOT_LEASE', 120)
+    start = random.randrange(limit)
+    for offset in range(limit):
+        key = f'{KEY_PREFIX}:slot:{(start + offset) % limit}'
+        if cache.add(key, token, lease):
+            LLM_SLOTS_IN_USE.inc()
+            return Slot(key, token, priority)
+    return None
+
+
+def acquire(priority=NORMAL, timeout=None):
+    """
+    Take a slot, waiting in the queue if none is free.
+
+    Returns:
+        Slot or None: None when the governor is off (LLM_MAX_CONCURRENCY=0)
+
+    Raises:
+        LLMOverloaded: The queue is full, or no slot came free within
+            ``timeout`` (default LLM_QUEUE_TIMEOUT) seconds
+    """
+    if _limit() <= 0:
+        return None
+    slot = try_acquire(priority)
+    if slot is not None:
+        LLM_ADMISSIONS.labels(priority=priority, outcome='admitted').inc()
+        LLM_QUEUE_WAIT_SECONDS.labels(priority=priority).observe(0)
+        return slot
+
+    if timeout is None:
+        timeout = getattr(settings, 'LLM_QUEUE_TIMEOUT', 15)
+    started = time.monotonic()
+    with stage('llm_queue'):
+        depth = _add_waiting(priority, 1)
+        LLM_QUEUE_DEPTH.labels(priority=priority).inc()
+        try:
+            if depth > getattr(settings, 'LLM_QUEUE_MAX', 128):
+                LLM_ADMISSIONS.labels(priority=priority, outcome='shed').inc()
+                raise LLMOverloaded('Too many requests are waiting for the AI service', retry_after())
+            while True:
+                slot = try_acquire(priority)
+                if slot is not None:
+                    LLM_ADMISSIONS.labels(priority=priority, outcome='admitted').inc()
+                    LLM_QUEUE_WAIT_SECONDS.labels(priority=priority).observe(time.monotonic() - started)
+                    return slot
+                if time.monotonic() - started >= timeout:
+                    LLM_ADMISSIONS.labels(priority=priority, outcome='timeout').inc()
+                    LLM_QUEUE_WAIT_SECONDS.labels(priority=priority).observe(time.monotonic() - started)
+                    raise LLMOverloaded(f'No AI service capacity within {timeout:g}s', retry_after())
+                time.sleep(POLL_SECONDS)
+        finally:
+            LLM_QUEUE_DEPTH.labels(priority=priority).dec()
+            _add_waiting(priority, -1)
+
+
+def release(slot):
+    global _hold_seconds
+    if slot is None:
+        return
+    cache = _cache()
+    # The lease may have expired and the slot gone to someone else
+    if cache.get(slot.key) == slot.token:
+        cache.delete(slot.key)
+    LLM_SLOTS_IN_USE.dec()
+    with _hold_lock:
+        _hold_seconds = 0.8 * _hold_seconds + 0.2 * (time.monotonic() - slot.acquired_at)
+
+
+@contextmanager
+def llm_slot(priority=NORMAL):
+    """Hold an LLM call slot for the duration of the block"""
+    slot = acquire(priority)
+    try:
+        yield slot
+    finally:
+        release(slot)
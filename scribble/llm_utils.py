@@ -2,9 +2,14 @@ from openai import OpenAI
 from django.conf import settings
 import logging
 import json
+import threading
 import time
 from concurrent.futures import ThreadPoolExecutor, as_completed
 import asyncio
+import contextvars
+
+from . import llm_governor
+from .metrics import LLM_REQUESTS, LLM_SECONDS
 
 logger = logging.getLogger(__name__)
 
@@ -53,12 +58,26 @@ MODEL_PRIORITY = [
     }
 ]
 
+_clients = {}
+_clients_lock = threading.Lock()
+
 def get_openrouter_client():
-    """Initialize and return an OpenAI client configured for OpenRouter."""
-    return OpenAI(
-        base_url="https://openrouter.ai/api/v1",
-        api_key=settings.OPENROUTER_API_KEY,
-    )
+    """
+    Return the OpenAI client configured for OpenRouter.
+    
+    One client per base URL and key is shared by every request thread (the
+    client is thread-safe), so its HTTP connection pool is reused rather
+    than a new client and TLS handshake being made for every call.
+    """
+    base_url = getattr(settings, 'OPENROUTER_BASE_URL', "https://openrouter.ai/api/v1")
+    key = (base_url, settings.OPENROUTER_API_KEY)
+    client = _clients.get(key)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(key)
+            if client is None:
+                client = _clients[key] = OpenAI(base_url=base_url, api_key=settings.OPENROUTER_API_KEY)
+    return client
 
 def is_payment_required_error(error):
     """Check if the error is related to payment requirements."""
@@ -70,55 +89,117 @@ def is_rate_limit_error(error):
     error_str = str(error).lower()
     return any(term in error_str for term in ['429', 'rate limit', 'too many requests'])
 
-async def get_chat_completion_async(messages, model_config, timeout=30, response_format=None):
-    """Make an async request to a single model with timeout."""
+_executor = None
+_executor_lock = threading.Lock()
+
+def _call_executor():
+    """Threads for the blocking OpenAI client calls, shared by every request"""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                # The governor keeps calls in flight within LLM_MAX_CONCURRENCY
+                workers = max(getattr(settings, 'LLM_MAX_CONCURRENCY', 64), 64)
+                _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='llm-call')
+    return _executor
+
+def _start_call(messages, model_config, slot=None):
+    """
+    Submit a request to one model and return its concurrent future.
+    
+    ``slot`` is released when the call itself ends, from a done-callback on
+    its future, not when the caller stops waiting for it: a call that lost a
+    race or timed out keeps running in its thread until the client's own
+    timeout, and holds its slot until then.
+    """
     try:
         client = get_openrouter_client()
-        
+        call = _call_executor().submit(
+            client.chat.completions.create,
+            model=model_config['name'],
+            messages=messages,
+            temperature=model_config['config']['temperature'],
+            max_tokens=model_config['config']['max_tokens'],
+            extra_headers=settings.OPENROUTER_HEADERS,
+            extra_body={},
+            # Ends the HTTP request too, not just our wait for it
+            timeout=model_config['config']['timeout'],
+        )
+    except BaseException:
+        llm_governor.release(slot)
+        raise
+    if slot is not None:
+        call.add_done_callback(lambda _: llm_governor.release(slot))
+    return call
+
+async def _await_call(call, model_config):
+    """Wait for a started model call with its timeout and return the result dict"""
+    started = time.perf_counter()
+    outcome = 'error'
+    try:
         # Use asyncio.wait_for to implement timeout
         try:
-            response = await asyncio.wait_for(
-                asyncio.get_event_loop().run_in_executor(
-                    None,
-                    lambda: client.chat.completions.create(
-                        model=model_config['name'],
-                        messages=messages,
-                        temperature=model_config['config']['temperature'],
-                        max_tokens=model_config['config']['max_tokens'],
-                        extra_headers=settings.OPENROUTER_HEADERS,
-                        extra_body={}
-                    )
-                ),
-                timeout=model_config['config']['timeout']
-            )
+            response = await asyncio.wait_for(asyncio.wrap_future(call), timeout=model_config['config']['timeout'])
+            outcome = 'success'
             return {
                 'success': True,
                 'model': model_config['name'],
                 'content': response.choices[0].message.content
             }
         except asyncio.TimeoutError:
+            outcome = 'timeout'
             logger.warning(f"Model {model_config['name']} timed out after {model_config['config']['timeout']}s")
             return {
                 'success': False,
                 'model': model_config['name'],
                 'error': 'Request timed out'
             }
+    except (asyncio.CancelledError, GeneratorExit):
+        # Another model answered first and this attempt was dropped
+        outcome = 'abandoned'
+        raise
     except Exception as e:
+        if is_rate_limit_error(e):
+            outcome = 'rate_limited'
         logger.warning(f"Error with model {model_config['name']}: {str(e)}")
         return {
             'success': False,
             'model': model_config['name'],
             'error': str(e)
         }
+    finally:
+        LLM_REQUESTS.labels(model=model_config['name'], outcome=outcome).inc()
+        LLM_SECONDS.labels(model=model_config['name']).observe(time.perf_counter() - started)
 
-async def get_chat_completion(messages, model_name=None, max_attempts=3, response_format=None):
+async def get_chat_completion_async(messages, model_config, timeout=30, response_format=None, slot=None):
+    """Make an async request to a single model with timeout, holding ``slot`` until the call ends."""
+    try:
+        call = _start_call(messages, model_config, slot)
+    except Exception as e:
+        logger.warning(f"Error with model {model_config['name']}: {str(e)}")
+        return {
+            'success': False,
+            'model': model_config['name'],
+            'error': str(e)
+        }
+    return await _await_call(call, model_config)
+
+async def get_chat_completion(messages, model_name=None, max_attempts=3, response_format=None,
+                              priority=llm_governor.NORMAL):
     """
     Get chat completion with fast failover between models.
     
+    The first model waits for an LLM call slot (see llm_governor). The other
+    models are raced against it only if slots are free for them too; under
+    load they are tried one after another instead, each waiting for a slot,
+    so failover doesn't multiply outbound calls when capacity is short.
+    Every slot stays held until its call has actually ended.
+    
     Args:
         messages (list): List of message dictionaries with 'role' and 'content'
         model_name (str, optional): Specific model to try first. Defaults to None
         max_attempts (int, optional): Maximum number of models to try. Defaults to 3
+        priority (str, optional): llm_governor.HIGH or NORMAL
         
     Returns:
         dict: {
@@ -127,6 +208,9 @@ async def get_chat_completion(messages, model_name=None, max_attempts=3, respons
             'model': str or None,
             'error': str or None
         }
+    
+    Raises:
+        LLMOverloaded: No call slot was available
     """
     # If a specific model is requested, try it first
     models_to_try = []
@@ -143,20 +227,60 @@ async def get_chat_completion(messages, model_name=None, max_attempts=3, respons
                 if remaining_slots <= 0:
                     break
     
-    # Create tasks for all models we want to try
-    tasks = [get_chat_completion_async(messages, model) for model in models_to_try]
+    # Waiting for a slot blocks, so it runs off the event loop (with the
+    # request's context, for stage timings)
+    loop = asyncio.get_running_loop()
+
+    async def wait_for_slot():
+        return await loop.run_in_executor(None, contextvars.copy_context().run, llm_governor.acquire, priority)
+
+    first_slot = await wait_for_slot()
+    launched, deferred = [(models_to_try[0], first_slot)], []
+    for model in models_to_try[1:]:
+        if first_slot is None:  # governor off
+            launched.append((model, None))
+            continue
+        slot = llm_governor.try_acquire(priority)
+        if slot is None:
+            deferred.append(model)
+        else:
+            launched.append((model, slot))
+    
+    # Start every call before waiting on any, so each slot is handed to its
+    # call (which releases it when it ends) even if we return early
+    calls = []
+    try:
+        for model, slot in launched:
+            calls.append((_start_call(messages, model, slot), model))
+    except Exception as e:
+        logger.warning(f"Error starting model calls: {str(e)}")
+        for _, slot in launched[len(calls) + 1:]:
+            llm_governor.release(slot)
     
     # Wait for the first successful response
-    for future in asyncio.as_completed(tasks):
-        result = await future
+    tasks = [asyncio.ensure_future(_await_call(call, model)) for call, model in calls]
+    try:
+        for future in asyncio.as_completed(tasks):
+            result = await future
+            if result['success']:
+                return _completion(result)
+    finally:
+        # Stop waiting on the losers (their calls run on, holding their slots)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    
+    # Models that didn't get a slot of their own, one at a time. Calls above
+    # that timed out may still be running on their slots, so each of these
+    # waits for a slot of its own.
+    for model in deferred:
+        try:
+            slot = await wait_for_slot() if first_slot is not None else None
+        except llm_governor.LLMOverloaded:
+            break
+        result = await get_chat_completion_async(messages, model, slot=slot)
         if result['success']:
-            logger.info(f"Successfully got response from {result['model']}")
-            return {
-                'success': True,
-                'content': result['content'],
-                'model': result['model'],
-                'error': None
-            }
+            return _completion(result)
     
     # If we get here, all attempts failed
     return {
@@ -166,7 +290,17 @@ async def get_chat_completion(messages, model_name=None, max_attempts=3, respons
         'error': 'All model attempts failed. Please try again later.'
     }
 
-def get_chat_completion_sync(messages, model_name=None, max_attempts=3, response_format=None):
+def _completion(result):
+    logger.info(f"Successfully got response from {result['model']}")
+    return {
+        'success': True,
+        'content': result['content'],
+        'model': result['model'],
+        'error': None
+    }
+
+def get_chat_completion_sync(messages, model_name=None, max_attempts=3, response_format=None,
+                             priority=llm_governor.NORMAL):
     """Synchronous wrapper for the async get_chat_completion function.
     
     Args:
@@ -174,9 +308,13 @@ def get_chat_completion_sync(messages, model_name=None, max_attempts=3, response
         model_name: Optional specific model to try first
         max_attempts: Maximum number of models to try
         response_format: Optional format for the response (e.g., {'type': 'json_object'})
+        priority: llm_governor.HIGH or NORMAL
         
     Returns:
         dict: Response with 'success', 'content', 'model', and 'error' keys
+    
+    Raises:
+        LLMOverloaded: No call slot was available
     """
     loop = asyncio.new_event_loop()
     asyncio.set_event_loop(loop)
@@ -186,7 +324,8 @@ def get_chat_completion_sync(messages, model_name=None, max_attempts=3, response
                 messages=messages,
                 model_name=model_name,
                 max_attempts=max_attempts,
-                response_format=response_format
+                response_format=response_format,
+                priority=priority
             )
         )
     finally:
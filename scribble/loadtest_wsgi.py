@@ -0,0 +1,28 @@
+"""
+WSGI entry point for the ``benchmark_concurrency`` load test.
+
+Serves the real application, with the knowledge base read from
+LOADTEST_VECTOR_STORE and, when LOADTEST_FAKE_EMBEDDINGS is set to a vector
+size, a deterministic fake embedding model in place of sentence-transformers,
+so serving concurrency can be measured without downloading the model. The LLM
+is replaced by pointing OPENROUTER_BASE_URL at a FakeLLMServer.
+"""
+import os
+
+from scribbleintimeai.wsgi import application  # noqa: F401 (sets up Django)
+
+from chat import ai_service
+from scribble import embedding_cache, views
+
+store_path = os.environ.get('LOADTEST_VECTOR_STORE')
+if store_path:
+    views.VECTOR_STORE_PATH = ai_service.VECTOR_STORE_PATH = store_path
+
+fake_size = int(os.environ.get('LOADTEST_FAKE_EMBEDDINGS') or 0)
+if fake_size:
+    from langchain_core.embeddings import DeterministicFakeEmbedding
+    embedding_cache._query_embeddings = embedding_cache.CachedQueryEmbeddings(
+        DeterministicFakeEmbedding(size=fake_size),
+        embedding_cache.QueryEmbeddingCache(16 * 1024 * 1024),
+        namespace=f'fake-{fake_size}',
+    )
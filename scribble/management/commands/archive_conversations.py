@@ -0,0 +1,52 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from scribble import archive
+from scribble.models import ArchivedConversation
+
+
+class Command(BaseCommand):
+    help = (
+        'Move closed conversations and their messages to the compressed cold archive '
+        'in small batches, or restore one from it (see scribble/archive.py)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--months', type=int,
+                            help='Archive closed conversations untouched for this many months '
+                                 '(default: ARCHIVE_AFTER_MONTHS)')
+        parser.add_argument('--batch-size', type=int,
+                            help='Conversations per transaction (default: ARCHIVE_BATCH_SIZE)')
+        parser.add_argument('--sleep', type=float, default=0.0,
+                            help='Seconds to pause between batches, to leave room for other queries')
+        parser.add_argument('--dry-run', action='store_true', help='Only count what would be archived')
+        parser.add_argument('--restore', metavar='SOURCE:ID',
+                            help='Restore one archived conversation instead, e.g. scribble:42 or chat:7')
+
+    def handle(self, *args, **options):
+        if options['restore']:
+            source, _, conversation_id = options['restore'].partition(':')
+            if source not in archive.sources() or not conversation_id.isdigit():
+                raise CommandError('--restore takes SOURCE:ID, with source scribble or chat')
+            try:
+                archive.restore(source, int(conversation_id))
+            except ArchivedConversation.DoesNotExist:
+                raise CommandError(f'No archived {source} conversation {conversation_id}')
+            except archive.ArchiveError as e:
+                raise CommandError(str(e))
+            self.stdout.write(self.style.SUCCESS(f'Restored {source} conversation {conversation_id}'))
+            return
+
+        report = archive.archive_closed(
+            months=options['months'], batch_size=options['batch_size'],
+            sleep=options['sleep'], dry_run=options['dry_run'],
+        )
+        if report['months'] <= 0:
+            self.stdout.write('Archiving is off (0 months); nothing archived')
+            return
+
+        verb = 'Would archive' if report['dry_run'] else 'Archived'
+        for source, counts in report['sources'].items():
+            self.stdout.write(self.style.SUCCESS(
+                f"{verb} {counts['conversations']} closed {source} conversation(s) and "
+                f"{counts['messages']} message(s) older than {report['months']} months"
+            ))
@@ -0,0 +1,24 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from scribble.boot_profile import BOOT_TARGET, budget_violations, profile_boot
+
+
+class Command(BaseCommand):
+    help = (
+        'Profile worker boot with python -X importtime: time, RSS, heavy ML '
+        'modules imported and the slowest imports. Fails when over budget.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--target', default=BOOT_TARGET,
+                            help=f'Module imported after django.setup() (default: {BOOT_TARGET})')
+        parser.add_argument('--top', type=int, default=15, help='Slowest imports to list (default: 15)')
+
+    def handle(self, *args, **options):
+        profile = profile_boot(options['target'], top=options['top'])
+        self.stdout.write(json.dumps(profile, indent=2))
+        problems = budget_violations(profile)
+        if problems:
+            raise CommandError('; '.join(problems))
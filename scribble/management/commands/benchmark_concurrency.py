@@ -0,0 +1,233 @@
+import json
+import logging
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from scribble.fake_llm import FakeLLMServer
+from scribble.management.commands.benchmark_rag import TARGETS, _summarize
+from scribble.synthetic_kb import generate_knowledge_base, question_set
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class Command(BaseCommand):
+    help = (
+        'Concurrency load test: serves the app with gunicorn (gunicorn.conf.py) '
+        'on a throwaway database, with the LLM replaced by a local fake server, '
+        'fires waves of simultaneous chats and reports how many were served '
+        'concurrently as JSON'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--target', choices=sorted(TARGETS), default='chat',
+                            help='chat: ChatView, send: SendMessageView/AIService (default: chat)')
+        parser.add_argument('--clients', type=int, default=50, help='Simultaneous chats per wave (default: 50)')
+        parser.add_argument('--waves', type=int, default=2, help='Waves of chats (default: 2)')
+        parser.add_argument('--latency-ms', type=float, default=3000, help='Fake LLM latency (default: 3000)')
+        parser.add_argument('--completion-tokens', type=int, default=40)
+        parser.add_argument('--worker-class', help='Override GUNICORN_WORKER_CLASS (gthread, sync)')
+        parser.add_argument('--workers', type=int, help='Override GUNICORN_WORKERS')
+        parser.add_argument('--threads', type=int, help='Override GUNICORN_THREADS')
+        parser.add_argument('--embeddings', choices=['fake', 'model'], default='fake',
+                            help='fake: deterministic vectors, no model download; model: the real '
+                                 'sentence-transformers model (default: fake)')
+        parser.add_argument('--documents', type=int, default=10, help='Synthetic knowledge base documents')
+        parser.add_argument('--ready-timeout', type=float, default=180,
+                            help='Seconds to wait for /api/health/ready/ (default: 180)')
+        parser.add_argument('--min-concurrent', type=int, default=0,
+                            help='Fail unless at least this many chats of a wave were served concurrently')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--output', help='Also write the JSON results to this file')
+
+    def handle(self, *args, **options):
+        # ingest logs every file at INFO to stdout; keep the output parseable
+        logging.getLogger('scribble.ingest').setLevel(logging.WARNING)
+
+        with tempfile.TemporaryDirectory() as workdir:
+            env = self.prepare(options, workdir)
+            with FakeLLMServer(latency_ms=options['latency_ms'], tokens_per_second=0,
+                               completion_tokens=options['completion_tokens'], seed=options['seed']) as llm:
+                env.update(OPENROUTER_BASE_URL=llm.base_url, OPENROUTER_API_KEY='benchmark')
+                port = _free_port()
+                server = self.start_gunicorn(options, env, workdir, port)
+                try:
+                    base_url = f'http://127.0.0.1:{port}'
+                    ready_seconds = self.wait_until_ready(base_url, server, options['ready_timeout'])
+                    results = self.run_waves(base_url, options)
+                finally:
+                    server.send_signal(signal.SIGTERM)
+                    try:
+                        server.wait(timeout=30)
+                    except subprocess.TimeoutExpired:
+                        server.kill()
+                results['fake_llm'] = llm.snapshot()
+
+        results['ready_seconds'] = ready_seconds
+        output = json.dumps(results, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output)
+        self.stdout.write(output)
+
+        if options['min_concurrent'] and results['concurrent_chats'] < options['min_concurrent']:
+            raise CommandError(f"Only {results['concurrent_chats']} chats were served concurrently, "
+                               f"{options['min_concurrent']} required")
+
+    def prepare(self, options, workdir):
+        """Throwaway database and knowledge base index; returns the server environment"""
+        from langchain_community.vectorstores import FAISS
+        from scribble import ingest
+
+        env = dict(
+            os.environ,
+            DJANGO_SETTINGS_MODULE=os.environ.get('DJANGO_SETTINGS_MODULE', 'scribbleintimeai.settings'),
+            DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'loadtest.sqlite3')}",
+            DB_POOL='false',
+            DB_CONN_MAX_AGE='0',
+            PROMETHEUS_MULTIPROC_DIR=os.path.join(workdir, 'prometheus'),
+            GUNICORN_PIDFILE=os.path.join(workdir, 'gunicorn.pid'),
+            LOADTEST_VECTOR_STORE=os.path.join(workdir, 'vectorstore'),
+            # Every simulated client shares one address
+            THROTTLE_LLM_RATE='',
+            THROTTLE_HISTORY_RATE='',
+        )
+        os.makedirs(env['PROMETHEUS_MULTIPROC_DIR'])
+        if options['embeddings'] == 'fake':
+            from langchain_core.embeddings import DeterministicFakeEmbedding
+            env['LOADTEST_FAKE_EMBEDDINGS'] = '64'
+            embeddings = DeterministicFakeEmbedding(size=64)
+        else:
+            env.pop('LOADTEST_FAKE_EMBEDDINGS', None)
+            embeddings = ingest.get_embeddings()
+
+        kb_dir = os.path.join(workdir, 'knowledge_base')
+        generate_knowledge_base(kb_dir, documents=options['documents'], seed=options['seed'])
+        chunks = ingest.chunk_documents(ingest.load_documents(kb_dir))
+        FAISS.from_documents(chunks, embeddings).save_local(env['LOADTEST_VECTOR_STORE'])
+
+        migrate = subprocess.run([sys.executable, 'manage.py', 'migrate', '--noinput'], env=env,
+                                 cwd=settings.BASE_DIR, capture_output=True, text=True)
+        if migrate.returncode:
+            raise CommandError(f'migrate failed:\n{migrate.stderr[-2000:]}')
+        # AIService answers only once a processed document exists
+        subprocess.run([sys.executable, 'manage.py', 'shell', '-c',
+                        "from scribble.models import KnowledgeDocument; "
+                        "KnowledgeDocument.objects.create(title='load test', is_processed=True)"],
+                       env=env, cwd=settings.BASE_DIR, check=True, capture_output=True)
+        return env
+
+    def start_gunicorn(self, options, env, workdir, port):
+        for option, variable in (('worker_class', 'GUNICORN_WORKER_CLASS'), ('workers', 'GUNICORN_WORKERS'),
+                                 ('threads', 'GUNICORN_THREADS')):
+            if options[option] is not None:
+                env[variable] = str(options[option])
+        log = open(os.path.join(workdir, 'gunicorn.log'), 'w')
+        self.gunicorn_log = log.name
+        return subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', '--config', 'gunicorn.conf.py',
+             '--bind', f'127.0.0.1:{port}', 'scribble.loadtest_wsgi:application'],
+            env=env, cwd=settings.BASE_DIR, stdout=log, stderr=subprocess.STDOUT,
+        )
+
+    def server_log(self):
+        with open(self.gunicorn_log) as f:
+            return f.read()[-3000:]
+
+    def wait_until_ready(self, base_url, server, timeout):
+        started = time.perf_counter()
+        last = None
+        while time.perf_counter() - started < timeout:
+            if server.poll() is not None:
+                raise CommandError(f'gunicorn exited:\n{self.server_log()}')
+            try:
+                with urllib.request.urlopen(f'{base_url}/api/health/ready/', timeout=5):
+                    return round(time.perf_counter() - started, 2)
+            except urllib.error.HTTPError as e:
+                last = e.read().decode(errors='replace')
+            except (urllib.error.URLError, ConnectionError, socket.timeout) as e:
+                last = str(e)
+            time.sleep(0.5)
+        raise CommandError(f'Server not ready after {timeout}s: {last}\n{self.server_log()}')
+
+    def run_waves(self, base_url, options):
+        url = base_url + TARGETS[options['target']]
+        latency = options['latency_ms'] / 1000
+        questions = question_set(options['clients'], seed=options['seed'])
+        waves = []
+        for wave in range(options['waves']):
+            records = [None] * options['clients']
+            barrier = threading.Barrier(options['clients'])
+
+            def client(number):
+                if options['target'] == 'chat':
+                    body = {'message': questions[number]}
+                else:
+                    body = {'message': questions[number], 'user_id': f'load-{wave}-{number}'}
+                request = urllib.request.Request(url, data=json.dumps(body).encode(), method='POST',
+                                                 headers={'Content-Type': 'application/json'})
+                barrier.wait()
+                started = time.perf_counter()
+                try:
+                    with urllib.request.urlopen(request, timeout=120) as response:
+                        status, data = response.status, json.loads(response.read() or b'{}')
+                except urllib.error.HTTPError as e:
+                    status, data = e.code, {}
+                except (urllib.error.URLError, ConnectionError, socket.timeout):
+                    status, data = 0, {}
+                records[number] = {
+                    'status': status,
+                    'error': status != 200 or bool(data.get('error')),
+                    'seconds': time.perf_counter() - started,
+                }
+
+            started = time.perf_counter()
+            threads = [threading.Thread(target=client, args=(number,)) for number in range(options['clients'])]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            wall = time.perf_counter() - started
+
+            ok = [record for record in records if not record['error']]
+            statuses = {}
+            for record in records:
+                statuses[str(record['status'])] = statuses.get(str(record['status']), 0) + 1
+            waves.append({
+                'requests': len(records),
+                'errors': len(records) - len(ok),
+                'status_codes': statuses,
+                'wall_seconds': round(wall, 2),
+                # With capacity for k concurrent chats, only k answers can
+                # arrive within one LLM round-trip (plus overhead) of the start
+                'concurrent': sum(record['seconds'] < latency * 1.5 for record in ok),
+                'latency_ms': _summarize([record['seconds'] * 1000 for record in ok]),
+            })
+
+        return {
+            'target': options['target'],
+            'clients': options['clients'],
+            'llm_latency_ms': options['latency_ms'],
+            'embeddings': options['embeddings'],
+            'gunicorn': {
+                'worker_class': options['worker_class'] or os.environ.get('GUNICORN_WORKER_CLASS', 'gthread'),
+                'workers': options['workers'] or os.environ.get('GUNICORN_WORKERS', 'default'),
+                'threads': options['threads'] or os.environ.get('GUNICORN_THREADS', 'default'),
+            },
+            'concurrent_chats': max(wave['concurrent'] for wave in waves),
+            'waves': waves,
+        }
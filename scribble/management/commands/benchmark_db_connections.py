@@ -0,0 +1,111 @@
+import json
+import statistics
+import threading
+import time
+from importlib.util import find_spec
+
+from django.core.management.base import BaseCommand
+from django.core.signals import request_finished, request_started
+from django.db import connections
+
+
+class Command(BaseCommand):
+    help = (
+        'Load-test database connection handling: a new connection per request '
+        'versus persistent connections versus a psycopg_pool pool. Point '
+        'DATABASE_URL at a local Postgres to get meaningful numbers.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500,
+                            help='Simulated requests per mode (default: 500)')
+        parser.add_argument('--concurrency', type=int, default=8,
+                            help='Concurrent worker threads (default: 8)')
+        parser.add_argument('--modes', default='per_request,persistent,pool',
+                            help='Comma separated modes to run')
+
+    def handle(self, *args, **options):
+        db_settings = connections.settings['default']
+        original = {
+            'CONN_MAX_AGE': db_settings.get('CONN_MAX_AGE', 0),
+            'OPTIONS': dict(db_settings.get('OPTIONS', {})),
+        }
+        pool_options = original['OPTIONS'].get('pool') or {'min_size': 2, 'max_size': options['concurrency']}
+        can_pool = (
+            db_settings['ENGINE'] == 'django.db.backends.postgresql'
+            and find_spec('psycopg') is not None and find_spec('psycopg_pool') is not None
+        )
+
+        modes = {
+            'per_request': {'CONN_MAX_AGE': 0, 'pool': None},
+            'persistent': {'CONN_MAX_AGE': 600, 'pool': None},
+            'pool': {'CONN_MAX_AGE': 0, 'pool': pool_options},
+        }
+
+        results = {'vendor': connections['default'].vendor, 'modes': {}}
+        try:
+            for name in options['modes'].split(','):
+                name = name.strip()
+                if name == 'pool' and not can_pool:
+                    results['modes'][name] = {'skipped': 'requires PostgreSQL with psycopg[pool] installed'}
+                    continue
+                self.configure(db_settings, original, modes[name])
+                results['modes'][name] = self.run_mode(options['requests'], options['concurrency'])
+        finally:
+            self.configure(db_settings, original, {
+                'CONN_MAX_AGE': original['CONN_MAX_AGE'], 'pool': original['OPTIONS'].get('pool'),
+            })
+
+        self.stdout.write(json.dumps(results, indent=2))
+
+    @staticmethod
+    def configure(db_settings, original, mode):
+        connections.close_all()
+        connection = connections['default']
+        if hasattr(connection, 'close_pool'):
+            connection.close_pool()
+        db_settings['CONN_MAX_AGE'] = mode['CONN_MAX_AGE']
+        db_settings['OPTIONS'] = {k: v for k, v in original['OPTIONS'].items() if k != 'pool'}
+        if mode['pool']:
+            db_settings['OPTIONS']['pool'] = mode['pool']
+
+    def run_mode(self, total_requests, concurrency):
+        latencies = []
+        lock = threading.Lock()
+        per_thread = total_requests // concurrency
+
+        def worker():
+            samples = []
+            for _ in range(per_thread):
+                started = time.perf_counter()
+                # Same lifecycle Django gives a real request: close_old_connections
+                # runs on request start and finish
+                request_started.send(sender=self.__class__)
+                with connections['default'].cursor() as cursor:
+                    cursor.execute('SELECT 1')
+                    cursor.fetchone()
+                request_finished.send(sender=self.__class__)
+                samples.append((time.perf_counter() - started) * 1000)
+            connections.close_all()
+            with lock:
+                latencies.extend(samples)
+
+        started = time.perf_counter()
+        threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        latencies.sort()
+        return {
+            'requests': len(latencies),
+            'throughput_rps': round(len(latencies) / elapsed, 1),
+            'latency_ms': {
+                'mean': round(statistics.mean(latencies), 3),
+                'p50': round(latencies[len(latencies) // 2], 3),
+                'p95': round(latencies[int(len(latencies) * 0.95)], 3),
+                'max': round(latencies[-1], 3),
+            },
+        }
@@ -0,0 +1,101 @@
+import json
+import logging
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from scribble import ingest, timing
+from scribble.synthetic_kb import generate_corpus
+
+
+class Command(BaseCommand):
+    help = (
+        'Memory ceiling test for streaming ingestion: generate a synthetic '
+        'corpus (1 GB by default), stream it through the ingest pipeline and '
+        'fail if RSS grows by more than --ceiling-mb'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size-mb', type=float, default=1024,
+                            help='Synthetic corpus size in MB (default: 1024)')
+        parser.add_argument('--file-mb', type=float, default=64,
+                            help='Size of each generated file in MB (default: 64)')
+        parser.add_argument('--corpus-dir', help='Use an existing corpus directory instead of generating one')
+        parser.add_argument('--workers', type=int, default=1,
+                            help='Parser processes (default: 1, fully streaming)')
+        parser.add_argument('--batch-size', type=int, default=ingest.EMBED_BATCH_SIZE)
+        parser.add_argument('--embed', action='store_true',
+                            help='Also embed and index the batches. The FAISS index itself grows '
+                                 'with the corpus, so the ceiling then has to allow for it.')
+        parser.add_argument('--ceiling-mb', type=float, default=256,
+                            help='Maximum allowed RSS growth in MB (default: 256)')
+
+    def handle(self, *args, **options):
+        logging.getLogger('scribble.ingest').setLevel(logging.WARNING)
+
+        with tempfile.TemporaryDirectory() as workdir:
+            corpus_dir = options['corpus_dir']
+            if not corpus_dir:
+                corpus_dir = workdir
+                started = time.perf_counter()
+                generate_corpus(corpus_dir, options['size_mb'], file_mb=options['file_mb'])
+                self.stderr.write(f'Generated corpus in {time.perf_counter() - started:.1f}s')
+            results = self.run(Path(corpus_dir), options)
+
+        self.stdout.write(json.dumps(results, indent=2))
+        if results['rss_growth_mb'] > options['ceiling_mb']:
+            raise CommandError(
+                f"RSS grew by {results['rss_growth_mb']} MB, above the {options['ceiling_mb']} MB ceiling"
+            )
+
+    def run(self, corpus_dir, options):
+        files = sorted(path for path in corpus_dir.glob('*') if path.is_file())
+        corpus_mb = round(sum(path.stat().st_size for path in files) / 1024 / 1024, 1)
+
+        # Sample RSS in the background; ru_maxrss would include corpus generation
+        baseline = timing.rss_mb()
+        peak = [baseline]
+        finished = threading.Event()
+
+        def sample():
+            while not finished.wait(0.1):
+                peak[0] = max(peak[0], timing.rss_mb())
+
+        sampler = threading.Thread(target=sample, daemon=True)
+        sampler.start()
+        started = time.perf_counter()
+        try:
+            if options['embed']:
+                vectorstore, report = ingest.ingest_directory(
+                    corpus_dir, workers=options['workers'], batch_size=options['batch_size']
+                )
+            else:
+                report = {'files': []}
+                batches = ingest.iter_batches(
+                    ingest.iter_file_chunks(files, options['workers'], report), options['batch_size']
+                )
+                report['batches'] = sum(1 for _ in batches)
+        finally:
+            finished.set()
+            sampler.join()
+        elapsed = time.perf_counter() - started
+        peak[0] = max(peak[0], timing.rss_mb())
+
+        chunks = sum(file_report['chunks'] for file_report in report['files'])
+        return {
+            'corpus_mb': corpus_mb,
+            'files': len(files),
+            'workers': options['workers'],
+            'batch_size': options['batch_size'],
+            'embedded': options['embed'],
+            'chunks': chunks,
+            'seconds': round(elapsed, 1),
+            'chunks_per_second': round(chunks / elapsed, 1) if elapsed else 0,
+            'rss_baseline_mb': baseline,
+            'rss_peak_mb': peak[0],
+            'rss_growth_mb': round(peak[0] - baseline, 1),
+            'ceiling_mb': options['ceiling_mb'],
+        }
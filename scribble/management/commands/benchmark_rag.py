@@ -0,0 +1,257 @@
+import json
+import logging
+import os
+import subprocess
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+from django.test import Client, override_settings
+from django.utils import timezone
+
+from scribble import timing
+from scribble.fake_llm import FakeLLMServer
+from scribble.synthetic_kb import generate_knowledge_base, question_set
+
+TARGETS = {
+    # ChatView (scribble.views) - llm_utils with model failover
+    'chat': '/api/chat/',
+    # SendMessageView (chat.api_views) - AIService
+    'send': '/api/chat/messages/send/',
+}
+
+
+def _summarize(samples):
+    if not samples:
+        return None
+    samples = sorted(samples)
+    return {
+        'count': len(samples),
+        'mean': round(sum(samples) / len(samples), 2),
+        'p50': round(samples[len(samples) // 2], 2),
+        'p95': round(samples[min(int(len(samples) * 0.95), len(samples) - 1)], 2),
+        'p99': round(samples[min(int(len(samples) * 0.99), len(samples) - 1)], 2),
+        'max': round(samples[-1], 2),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        'Offline RAG benchmark: runs the chat endpoints against a synthetic '
+        'knowledge base and a local fake LLM server, on a throwaway test '
+        'database, and prints per-stage latency, throughput and RSS as JSON'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--target', choices=sorted(TARGETS), default='chat',
+                            help='chat: ChatView, send: SendMessageView/AIService (default: chat)')
+        parser.add_argument('--clients', default='1,4,16',
+                            help='Comma separated concurrent client counts to run (default: 1,4,16)')
+        parser.add_argument('--requests', type=int, default=48,
+                            help='Requests per client count (default: 48)')
+        parser.add_argument('--turns', type=int, default=4,
+                            help='Messages per conversation before a client starts a new one (default: 4)')
+        parser.add_argument('--documents', type=int, default=20,
+                            help='Synthetic knowledge base documents (default: 20)')
+        parser.add_argument('--kb-dir', help='Use an existing knowledge base directory instead')
+        parser.add_argument('--latency-ms', type=float, default=300)
+        parser.add_argument('--jitter-ms', type=float, default=0)
+        parser.add_argument('--tokens-per-second', type=float, default=50)
+        parser.add_argument('--completion-tokens', type=int, default=60)
+        parser.add_argument('--error-rate', type=float, default=0.0)
+        parser.add_argument('--hang-rate', type=float, default=0.0)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--output', help='Also write the JSON results to this file')
+
+    def handle(self, *args, **options):
+        # ingest logs every file at INFO to stdout; keep the output parseable
+        logging.getLogger('scribble.ingest').setLevel(logging.WARNING)
+
+        with tempfile.TemporaryDirectory() as workdir:
+            if connection.vendor == 'sqlite':
+                # Concurrent clients need a file database; the default
+                # in-memory test database locks tables across threads
+                connection.settings_dict['TEST']['NAME'] = os.path.join(workdir, 'benchmark.sqlite3')
+            old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+            try:
+                results = self.run_benchmark(options, workdir)
+            finally:
+                connections.close_all()
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        output = json.dumps(results, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output)
+        self.stdout.write(output)
+
+    def run_benchmark(self, options, workdir):
+        from chat import ai_service
+        from langchain_community.vectorstores import FAISS
+        from scribble import ingest, views
+        from scribble.embedding_cache import get_query_embeddings
+        from scribble.models import KnowledgeDocument
+
+        results = {
+            'commit': self.git_commit(),
+            'timestamp': timezone.now().isoformat(),
+            'vendor': connection.vendor,
+            'config': {key: options[key] for key in (
+                'target', 'clients', 'requests', 'turns', 'documents', 'latency_ms', 'jitter_ms',
+                'tokens_per_second', 'completion_tokens', 'error_rate', 'hang_rate', 'seed',
+            )},
+            'rss_mb': {'start': timing.rss_mb()},
+        }
+
+        # Knowledge base -> chunks -> FAISS index, timed
+        setup = {}
+        kb_dir = options['kb_dir']
+        if not kb_dir:
+            kb_dir = os.path.join(workdir, 'knowledge_base')
+            generate_knowledge_base(kb_dir, documents=options['documents'], seed=options['seed'])
+        started = time.perf_counter()
+        documents = ingest.load_documents(kb_dir)
+        setup['load_ms'] = round((time.perf_counter() - started) * 1000, 1)
+        started = time.perf_counter()
+        chunks = ingest.chunk_documents(documents)
+        setup['chunk_ms'] = round((time.perf_counter() - started) * 1000, 1)
+        started = time.perf_counter()
+        # The same cached wrapper the chat views load the store with
+        embeddings = get_query_embeddings()
+        setup['embedding_model_load_ms'] = round((time.perf_counter() - started) * 1000, 1)
+        started = time.perf_counter()
+        store = FAISS.from_documents(chunks, embeddings)
+        setup['index_ms'] = round((time.perf_counter() - started) * 1000, 1)
+        setup.update(documents=len(documents), chunks=len(chunks))
+        results['setup'] = setup
+        results['rss_mb']['after_index'] = timing.rss_mb()
+
+        # Point both chat paths at the benchmark index instead of ./vectorstore
+        store_path = os.path.join(workdir, 'vectorstore')
+        store.save_local(store_path)
+        previous_store, previous_path = views.vectorstore, ai_service.VECTOR_STORE_PATH
+        previous_views_path = views.VECTOR_STORE_PATH
+        views.VECTOR_STORE_PATH = ai_service.VECTOR_STORE_PATH = store_path
+        views.set_vector_store(store)
+        KnowledgeDocument.objects.create(title='benchmark knowledge base', is_processed=True)
+
+        questions = question_set(max(options['requests'], 1), seed=options['seed'])
+        server = FakeLLMServer(
+            latency_ms=options['latency_ms'],
+            jitter_ms=options['jitter_ms'],
+            tokens_per_second=options['tokens_per_second'],
+            completion_tokens=options['completion_tokens'],
+            error_rate=options['error_rate'],
+            hang_rate=options['hang_rate'],
+            seed=options['seed'],
+        )
+        try:
+            with server, override_settings(
+                OPENROUTER_BASE_URL=server.base_url,
+                OPENROUTER_API_KEY='benchmark',
+                ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'],
+                # Every simulated client shares one address
+                THROTTLE_RATES={},
+            ):
+                results['runs'] = []
+                for clients in [int(value) for value in options['clients'].split(',') if value.strip()]:
+                    before = server.snapshot()
+                    run = self.run_clients(options['target'], clients, options['requests'],
+                                           options['turns'], questions)
+                    after = server.snapshot()
+                    run['llm_calls'] = after['requests'] - before['requests']
+                    run['llm_calls_per_request'] = round(run['llm_calls'] / run['requests'], 2) if run['requests'] else 0
+                    run['llm_max_in_flight'] = after['max_in_flight']
+                    results['runs'].append(run)
+                results['fake_llm'] = server.snapshot()
+        finally:
+            views.VECTOR_STORE_PATH, ai_service.VECTOR_STORE_PATH = previous_views_path, previous_path
+            views.set_vector_store(previous_store)
+
+        results['rss_mb']['end'] = timing.rss_mb()
+        results['rss_mb']['peak'] = timing.peak_rss_mb()
+        return results
+
+    def run_clients(self, target, clients, total_requests, turns, questions):
+        url = TARGETS[target]
+        per_client = max(total_requests // clients, 1)
+        records = []
+        lock = threading.Lock()
+
+        def client_loop(client_number):
+            client = Client()
+            conversation_id = None
+            samples = []
+            for index in range(per_client):
+                if index % turns == 0:
+                    conversation_id = None
+                question = questions[(client_number * per_client + index) % len(questions)]
+                if target == 'chat':
+                    body = {'message': question}
+                    if conversation_id:
+                        body['conversation_id'] = conversation_id
+                else:
+                    body = {'message': question, 'user_id': f'bench-{clients}-{client_number}-{index // turns}'}
+
+                with timing.collect() as stages:
+                    started = time.perf_counter()
+                    response = client.post(url, data=json.dumps(body), content_type='application/json')
+                    elapsed = (time.perf_counter() - started) * 1000
+
+                try:
+                    data = json.loads(response.content)
+                except ValueError:
+                    data = {}
+                if target == 'chat':
+                    conversation_id = data.get('conversation_id', conversation_id)
+                samples.append({
+                    'status': response.status_code,
+                    'error': response.status_code >= 400 or bool(data.get('error')),
+                    'end_to_end': elapsed,
+                    'stages': dict(stages),
+                })
+            connections.close_all()
+            with lock:
+                records.extend(samples)
+
+        started = time.perf_counter()
+        threads = [threading.Thread(target=client_loop, args=(number,)) for number in range(clients)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        wall = time.perf_counter() - started
+
+        stage_names = sorted({name for record in records for name in record['stages']})
+        statuses = {}
+        for record in records:
+            statuses[str(record['status'])] = statuses.get(str(record['status']), 0) + 1
+        return {
+            'clients': clients,
+            'requests': len(records),
+            'errors': sum(record['error'] for record in records),
+            'status_codes': statuses,
+            'wall_seconds': round(wall, 2),
+            'throughput_rps': round(len(records) / wall, 2) if wall else 0,
+            'latency_ms': {
+                'end_to_end': _summarize([record['end_to_end'] for record in records]),
+                **{
+                    name: _summarize([record['stages'][name] for record in records if name in record['stages']])
+                    for name in stage_names
+                },
+            },
+            'rss_mb': timing.rss_mb(),
+        }
+
+    @staticmethod
+    def git_commit():
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, timeout=5,
+                cwd=settings.BASE_DIR,
+            ).stdout.strip() or None
+        except (OSError, subprocess.SubprocessError):
+            return None
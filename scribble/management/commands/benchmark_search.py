@@ -0,0 +1,101 @@
+import json
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.utils import timezone
+
+from scribble import search
+from scribble.models import Conversation, Message
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark full-text message search against icontains on a throwaway '
+        'test database seeded with synthetic messages'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=1_000_000,
+                            help='Number of synthetic messages to generate (default: 1,000,000)')
+        parser.add_argument('--batch-size', type=int, default=10_000,
+                            help='bulk_create batch size (default: 10,000)')
+        parser.add_argument('--repeat', type=int, default=5,
+                            help='Timed runs per query (default: 5)')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        # Never touch the real database: run against a fresh test database
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            results = self.run_benchmark(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+        self.stdout.write(json.dumps(results, indent=2))
+
+    def run_benchmark(self, options):
+        rng = random.Random(options['seed'])
+        vocabulary = [f'word{i}' for i in range(5000)] + [
+            'memoir', 'biography', 'pricing', 'ghostwriting', 'interview', 'family',
+        ]
+        weights = [1.0 / (rank + 1) for rank in range(len(vocabulary))]
+
+        conversations = Conversation.objects.bulk_create(
+            [Conversation() for _ in range(max(options['messages'] // 50, 1))]
+        )
+
+        started = time.perf_counter()
+        remaining = options['messages']
+        now = timezone.now()
+        while remaining > 0:
+            batch = min(options['batch_size'], remaining)
+            Message.objects.bulk_create([
+                Message(
+                    conversation=rng.choice(conversations),
+                    content=' '.join(rng.choices(vocabulary, weights=weights, k=rng.randint(8, 40))),
+                    sender=rng.choice(['user', 'ai']),
+                    created_at=now,
+                )
+                for _ in range(batch)
+            ], batch_size=batch)
+            remaining -= batch
+        insert_seconds = time.perf_counter() - started
+
+        queries = {
+            'common_term': 'word1',
+            'rare_term': 'ghostwriting',
+            'two_terms': 'memoir family',
+            'no_match': 'nonexistentterm',
+        }
+        timings = {}
+        for label, query in queries.items():
+            timings[label] = {
+                'query': query,
+                'icontains_ms': self.time_it(
+                    lambda: list(Message.objects.filter(content__icontains=query)
+                                 .order_by('-created_at')[:20]),
+                    options['repeat']
+                ),
+                'full_text_ms': self.time_it(
+                    lambda: search.search_messages(query, page=1, page_size=20),
+                    options['repeat']
+                ),
+            }
+
+        return {
+            'vendor': connection.vendor,
+            'messages': options['messages'],
+            'insert_seconds_including_index': round(insert_seconds, 2),
+            'queries': timings,
+        }
+
+    @staticmethod
+    def time_it(func, repeat):
+        samples = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            func()
+            samples.append((time.perf_counter() - started) * 1000)
+        samples.sort()
+        return {'median': round(samples[len(samples) // 2], 2), 'min': round(samples[0], 2)}
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from scribble import vector_index
+
+class Command(BaseCommand):
+    help = "Remove deleted documents' vectors from the knowledge base index and rewrite it"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--path',
+            help='Vector store directory (default: the ingest VECTOR_STORE_PATH)',
+        )
+
+    def handle(self, *args, **options):
+        from scribble.ingest import VECTOR_STORE_PATH, get_embeddings
+
+        store_path = options['path'] or VECTOR_STORE_PATH
+        pending = len(vector_index.deleted_hashes(store_path))
+        if not pending:
+            self.stdout.write('No deleted documents waiting for compaction')
+            return
+
+        result = vector_index.compact(store_path, get_embeddings())
+        self.stdout.write(self.style.SUCCESS(
+            f"Removed {result['vectors_removed']} vectors of {result['documents']} deleted document(s) "
+            f"in {result['seconds']}s; {result['vectors']} vectors left"
+        ))
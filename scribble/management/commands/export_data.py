@@ -0,0 +1,50 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from scribble import exports
+
+
+class Command(BaseCommand):
+    help = (
+        'Export conversations, messages or memoir form submissions as JSON lines or CSV, '
+        'streamed from a server-side cursor so memory use stays flat for any number of rows'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('dataset', choices=list(exports.DATASETS))
+        parser.add_argument('--format', dest='fmt', choices=list(exports.FORMATS), default='jsonl',
+                            help='Output format (default: jsonl)')
+        parser.add_argument('--compression', choices=list(exports.COMPRESSIONS), default='',
+                            help='Compress the output (zstd needs the zstandard package)')
+        parser.add_argument('--date-from', help='First day to include (YYYY-MM-DD)')
+        parser.add_argument('--date-to', help='Last day to include (YYYY-MM-DD)')
+        parser.add_argument('--status',
+                            help='Conversation status, or processed/unprocessed for submissions')
+        parser.add_argument('--chunk-size', type=int, help='Rows fetched at a time (default: EXPORT_CHUNK_SIZE)')
+        parser.add_argument('--output', '-o', default='-', help='File to write (default: standard output)')
+
+    def handle(self, *args, **options):
+        try:
+            content = exports.stream(
+                options['dataset'], fmt=options['fmt'], compression=options['compression'],
+                date_from=options['date_from'], date_to=options['date_to'], status=options['status'],
+                chunk_size=options['chunk_size'],
+            )
+        except exports.ExportError as e:
+            raise CommandError(str(e))
+
+        output = sys.stdout.buffer if options['output'] == '-' else open(options['output'], 'wb')
+        written = 0
+        try:
+            for piece in content:
+                output.write(piece)
+                written += len(piece)
+        finally:
+            if output is sys.stdout.buffer:
+                output.flush()
+            else:
+                output.close()
+        if options['output'] != '-':
+            self.stdout.write(self.style.SUCCESS(
+                f"Exported {options['dataset']} to {options['output']} ({written} bytes)"
+            ))
@@ -0,0 +1,53 @@
+from django.core.management.base import BaseCommand
+
+from scribble.fake_llm import FakeLLMServer
+
+
+class Command(BaseCommand):
+    help = (
+        'Run a local OpenAI-compatible chat completions server for load tests. '
+        'Start the app with OPENROUTER_BASE_URL=<printed base URL> to use it.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8900)
+        parser.add_argument('--latency-ms', type=float, default=300,
+                            help='Time to first token in milliseconds (default: 300)')
+        parser.add_argument('--jitter-ms', type=float, default=0,
+                            help='Random extra latency, 0..N milliseconds (default: 0)')
+        parser.add_argument('--tokens-per-second', type=float, default=50,
+                            help='Generation rate (default: 50)')
+        parser.add_argument('--completion-tokens', type=int, default=60,
+                            help='Tokens per reply (default: 60)')
+        parser.add_argument('--error-rate', type=float, default=0.0,
+                            help='Fraction of requests that fail (default: 0)')
+        parser.add_argument('--error-status', type=int, default=500,
+                            help='HTTP status for injected failures (default: 500)')
+        parser.add_argument('--hang-rate', type=float, default=0.0,
+                            help='Fraction of requests that hang to trigger client timeouts (default: 0)')
+        parser.add_argument('--hang-seconds', type=float, default=30)
+        parser.add_argument('--seed', type=int, default=None)
+
+    def handle(self, *args, **options):
+        server = FakeLLMServer(
+            host=options['host'],
+            port=options['port'],
+            latency_ms=options['latency_ms'],
+            jitter_ms=options['jitter_ms'],
+            tokens_per_second=options['tokens_per_second'],
+            completion_tokens=options['completion_tokens'],
+            error_rate=options['error_rate'],
+            error_status=options['error_status'],
+            hang_rate=options['hang_rate'],
+            hang_seconds=options['hang_seconds'],
+            seed=options['seed'],
+        )
+        self.stdout.write(self.style.SUCCESS(f'Fake LLM server listening on {server.base_url}'))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            self.stdout.write(f'Served: {server.snapshot()}')
@@ -0,0 +1,66 @@
+from datetime import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from scribble import partitions
+
+
+class Command(BaseCommand):
+    help = (
+        'Manage the monthly partitions of the message tables on PostgreSQL: convert the '
+        'tables once, create the coming months and detach old ones (see scribble/partitions.py)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--convert', action='store_true',
+                            help='Turn the message tables into partitioned tables first (locks them while it runs)')
+        parser.add_argument('--ahead', type=int,
+                            help='Months of partitions to keep ready (default: PARTITION_MONTHS_AHEAD)')
+        parser.add_argument('--from', dest='start', metavar='YYYY-MM',
+                            help='Also create partitions from this month, e.g. to restore archived conversations')
+        parser.add_argument('--detach-older-than', type=int, metavar='MONTHS',
+                            help='Detach empty partitions that ended at least this many months ago')
+        parser.add_argument('--drop', action='store_true', help='Drop detached partitions instead of keeping them')
+        parser.add_argument('--force', action='store_true', help='Detach partitions even if they still hold rows')
+
+    def handle(self, *args, **options):
+        start = None
+        if options['start']:
+            try:
+                start = timezone.make_aware(datetime.strptime(options['start'], '%Y-%m'))
+            except ValueError:
+                raise CommandError('--from takes a month as YYYY-MM')
+        ahead = options['ahead'] if options['ahead'] is not None else getattr(settings, 'PARTITION_MONTHS_AHEAD', 3)
+
+        try:
+            for model in partitions.message_models():
+                table = model._meta.db_table
+                if options['convert'] and partitions.convert(model):
+                    self.stdout.write(self.style.SUCCESS(f'Converted {table} to a partitioned table'))
+                created = partitions.ensure_partitions(model, months_ahead=ahead, start=start)
+                self.stdout.write(self.style.SUCCESS(
+                    f"{table}: created {len(created)} partition(s){': ' + ', '.join(created) if created else ''}"
+                ))
+                if options['detach_older_than'] is not None:
+                    report = partitions.detach_partitions(
+                        model, options['detach_older_than'], drop=options['drop'], force=options['force'],
+                    )
+                    verb = 'dropped' if options['drop'] else 'detached'
+                    self.stdout.write(self.style.SUCCESS(
+                        f"{table}: {verb} {len(report['detached'])} partition(s)"
+                        f"{': ' + ', '.join(report['detached']) if report['detached'] else ''}"
+                    ))
+                    if report['skipped']:
+                        self.stdout.write(self.style.WARNING(
+                            f"{table}: kept {', '.join(report['skipped'])}, which still hold rows; "
+                            'archive their conversations first or use --force'
+                        ))
+        except partitions.PartitioningUnsupported as e:
+            if connection.vendor != 'postgresql':
+                # Not an error for scheduled runs on SQLite; the cold archive does the work there
+                self.stdout.write(self.style.WARNING(str(e)))
+                return
+            raise CommandError(str(e))
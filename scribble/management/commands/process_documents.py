@@ -1,6 +1,6 @@
 from django.core.management.base import BaseCommand
 from django.core.cache import cache
-from scribble.ingest import main as process_documents
+from scribble.ingest import EMBED_BATCH_SIZE, main as process_documents
 from scribble.models import KnowledgeDocument
 import os
 from pathlib import Path
@@ -14,6 +14,17 @@ class Command(BaseCommand):
             action='store_true',
             help='Force reprocessing even if documents are already processed',
         )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            help='Parser processes (default: one per CPU, minus one for embedding)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=EMBED_BATCH_SIZE,
+            help=f'Chunks per embedding batch (default: {EMBED_BATCH_SIZE})',
+        )
 
     def handle(self, *args, **options):
         self.stdout.write("Starting document processing...")
@@ -42,7 +53,7 @@ class Command(BaseCommand):
         
         # Process documents
         try:
-            success = process_documents()
+            success = process_documents(workers=options['workers'], batch_size=options['batch_size'])
             
             if success:
                 # Update KnowledgeDocument records
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+
+from scribble import retention
+
+
+class Command(BaseCommand):
+    help = (
+        'Delete abandoned anonymous conversations and their messages in small '
+        'batches, optionally archiving them first (see scribble/retention.py)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int,
+                            help='Purge conversations untouched for this many days (default: RETENTION_ANONYMOUS_DAYS)')
+        parser.add_argument('--batch-size', type=int,
+                            help='Conversations per transaction (default: RETENTION_BATCH_SIZE)')
+        parser.add_argument('--archive-dir',
+                            help='Append purged rows to a gzipped JSON lines file in this directory first '
+                                 '(default: RETENTION_ARCHIVE_DIR)')
+        parser.add_argument('--sleep', type=float, default=0.0,
+                            help='Seconds to pause between batches, to leave room for other queries')
+        parser.add_argument('--dry-run', action='store_true', help='Only count what would be purged')
+
+    def handle(self, *args, **options):
+        report = retention.purge_abandoned(
+            days=options['days'], batch_size=options['batch_size'], archive_dir=options['archive_dir'],
+            sleep=options['sleep'], dry_run=options['dry_run'],
+        )
+        if report['days'] <= 0:
+            self.stdout.write('Retention is off (0 days); nothing purged')
+            return
+
+        verb = 'Would purge' if report['dry_run'] else 'Purged'
+        for table, counts in report['tables'].items():
+            self.stdout.write(self.style.SUCCESS(
+                f"{verb} {counts['conversations']} {table} conversation(s) and "
+                f"{counts['messages']} message(s) older than {report['days']} days"
+            ))
+        if report['archive']:
+            self.stdout.write(f"Archived to {report['archive']}")
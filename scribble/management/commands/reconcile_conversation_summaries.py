@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+from scribble.summaries import reconcile
+
+class Command(BaseCommand):
+    help = (
+        'Check the denormalized conversation summaries (last message, message and '
+        'unread counts) against the messages table and repair the ones that drifted. '
+        'Also backfills them for existing data'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Only report stale summaries, exiting with an error if there are any',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Conversations per batch (default: 1000)',
+        )
+
+    def handle(self, *args, **options):
+        report = reconcile(repair=not options['check'], batch_size=options['batch_size'])
+        if options['check']:
+            if report['stale']:
+                raise CommandError(
+                    f"{report['stale']} of {report['checked']} conversation summaries are stale "
+                    f"(e.g. conversations {', '.join(map(str, report['stale_ids'][:10]))})"
+                )
+            self.stdout.write(self.style.SUCCESS(f"All {report['checked']} conversation summaries are consistent"))
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f"Checked {report['checked']} conversation summaries, repaired {report['repaired']}"
+        ))
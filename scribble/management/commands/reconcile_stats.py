@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from scribble.stats import reconcile
+
+class Command(BaseCommand):
+    help = 'Recompute the daily dashboard statistics from the source tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=2,
+            help='Number of most recent days to rebuild (default: 2)',
+        )
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Rebuild the statistics for every day',
+        )
+
+    def handle(self, *args, **options):
+        days = None if options['all'] else options['days']
+        rows = reconcile(days=days)
+        scope = 'all days' if days is None else f'the last {days} day(s)'
+        self.stdout.write(
+            self.style.SUCCESS(f"Reconciled {rows} daily stats row(s) for {scope}")
+        )
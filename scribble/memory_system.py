@@ -3,8 +3,19 @@ from django.core.cache import cache
 from django.conf import settings
 import json
 from typing import List, Dict, Any, Optional
+import threading
 import uuid
 
+# Adding a memory reads the list from the cache, appends and writes it back.
+# Requests for the same session can run concurrently on a worker's threads,
+# so each read-modify-write holds a lock for its key (striped, so the lock
+# table stays small). Workers don't share the default local-memory cache.
+_LOCK_STRIPES = 64
+_locks = [threading.Lock() for _ in range(_LOCK_STRIPES)]
+
+def _lock_for(key: str) -> threading.Lock:
+    return _locks[hash(key) % _LOCK_STRIPES]
+
 class MemorySystem:
     def __init__(self, session_id: str = None):
         self.session_id = session_id or str(uuid.uuid4())
@@ -24,16 +35,17 @@ class MemorySystem:
 
     def add_episodic_memory(self, role: str, content: str):
         """Add to episodic memory (user-specific experiences)"""
-        current = self.get_episodic_memory()
-        current.append({
-            "role": role,
-            "content": content,
-            "timestamp": str(datetime.now())
-        })
-        # Keep only the most recent messages within context window
-        current = current[-self.context_window:]
-        # Cache for 24 hours of inactivity
-        cache.set(self.episodic_key, current, timeout=86400)
+        with _lock_for(self.episodic_key):
+            current = self.get_episodic_memory()
+            current.append({
+                "role": role,
+                "content": content,
+                "timestamp": str(datetime.now())
+            })
+            # Keep only the most recent messages within context window
+            current = current[-self.context_window:]
+            # Cache for 24 hours of inactivity
+            cache.set(self.episodic_key, current, timeout=86400)
 
     # Semantic Memory Methods
     def get_semantic_memory(self) -> Dict[str, Any]:
@@ -42,10 +54,11 @@ class MemorySystem:
 
     def update_semantic_memory(self, key: str, value: Any):
         """Update semantic memory with new knowledge"""
-        current = self.get_semantic_memory()
-        current[key] = value
-        # Cache for 30 days
-        cache.set(self.semantic_key, current, timeout=2592000)
+        with _lock_for(self.semantic_key):
+            current = self.get_semantic_memory()
+            current[key] = value
+            # Cache for 30 days
+            cache.set(self.semantic_key, current, timeout=2592000)
 
     # Procedural Memory Methods
     def get_procedures(self) -> List[Dict[str, Any]]:
@@ -54,13 +67,14 @@ class MemorySystem:
 
     def add_procedure(self, name: str, steps: List[str]):
         """Add a new procedure to memory"""
-        procedures = self.get_procedures()
-        procedures.append({
-            "name": name,
-            "steps": steps,
-            "last_used": str(datetime.now())
-        })
-        cache.set(self.procedural_key, procedures, timeout=2592000)
+        with _lock_for(self.procedural_key):
+            procedures = self.get_procedures()
+            procedures.append({
+                "name": name,
+                "steps": steps,
+                "last_used": str(datetime.now())
+            })
+            cache.set(self.procedural_key, procedures, timeout=2592000)
 
     def get_conversation_context(self) -> List[Dict[str, str]]:
         """Get the conversation context with system prompt and relevant memories"""
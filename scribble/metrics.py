@@ -0,0 +1,120 @@
+"""
+Prometheus metrics for the chat pipeline.
+
+Under gunicorn every worker is a separate process, so metrics are written
+through prometheus_client's multiprocess mode (PROMETHEUS_MULTIPROC_DIR, set
+up in gunicorn.conf.py) and /metrics merges the files of all workers. Without
+that variable a single-process registry is used, which suits runserver and
+tests. If prometheus_client isn't installed the metrics become no-ops.
+"""
+import os
+
+try:
+    import prometheus_client
+    from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram
+except ImportError:  # pragma: no cover - optional in local setups
+    prometheus_client = None
+
+# Chat stages run from sub-millisecond (prompt building) to tens of seconds (LLM)
+STAGE_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+class _NoopMetric:
+    def labels(self, *args, **kwargs):
+        return self
+
+    def observe(self, value):
+        pass
+
+    def inc(self, amount=1):
+        pass
+
+    def dec(self, amount=1):
+        pass
+
+
+if prometheus_client is not None:
+    STAGE_SECONDS = Histogram(
+        'scribble_stage_duration_seconds', 'Time spent in each chat pipeline stage',
+        ['stage'], buckets=STAGE_BUCKETS,
+    )
+    STAGE_ERRORS = Counter(
+        'scribble_stage_errors_total', 'Chat pipeline stages that raised an exception', ['stage'],
+    )
+    REQUEST_SECONDS = Histogram(
+        'scribble_http_request_duration_seconds', 'HTTP request latency by view',
+        ['method', 'view', 'status'], buckets=STAGE_BUCKETS,
+    )
+    LLM_REQUESTS = Counter(
+        'scribble_llm_requests_total', 'Chat completion requests by model and outcome',
+        ['model', 'outcome'],
+    )
+    LLM_SECONDS = Histogram(
+        'scribble_llm_request_duration_seconds', 'Chat completion latency by model',
+        ['model'], buckets=STAGE_BUCKETS,
+    )
+    RETRIEVAL_CACHE_REQUESTS = Counter(
+        'scribble_retrieval_cache_requests_total', 'Knowledge base retrievals by cache result', ['result'],
+    )
+    RETRIEVAL_CACHE_SAVED_SECONDS = Counter(
+        'scribble_retrieval_cache_saved_seconds_total',
+        'Embedding and search time avoided by retrieval cache hits',
+    )
+    EMBEDDING_CACHE_REQUESTS = Counter(
+        'scribble_query_embedding_cache_requests_total', 'Query embedding cache lookups by tier and result',
+        ['tier', 'result'],
+    )
+    # Gauges are summed over the live workers in multiprocess mode
+    LLM_QUEUE_DEPTH = Gauge(
+        'scribble_llm_queue_depth', 'Requests waiting for an LLM call slot', ['priority'],
+        multiprocess_mode='livesum',
+    )
+    LLM_SLOTS_IN_USE = Gauge(
+        'scribble_llm_slots_in_use', 'LLM call slots held', multiprocess_mode='livesum',
+    )
+    LLM_QUEUE_WAIT_SECONDS = Histogram(
+        'scribble_llm_queue_wait_seconds', 'Time spent waiting for an LLM call slot',
+        ['priority'], buckets=STAGE_BUCKETS,
+    )
+    LLM_ADMISSIONS = Counter(
+        'scribble_llm_admissions_total', 'LLM call slot requests by priority and outcome '
+        '(admitted, shed: queue full, timeout: no slot before the deadline)',
+        ['priority', 'outcome'],
+    )
+    THROTTLE_DECISIONS = Counter(
+        'scribble_throttle_decisions_total', 'Token bucket checks by scope and outcome, with the '
+        'identity (user, session, ip) whose bucket ran out for throttled requests',
+        ['scope', 'outcome', 'identity'],
+    )
+    RETENTION_PURGED = Counter(
+        'scribble_retention_purged_rows_total', 'Rows deleted by conversation retention, by table', ['table'],
+    )
+    EXPORT_ROWS = Counter(
+        'scribble_export_rows_total', 'Rows written by bulk exports, by dataset', ['dataset'],
+    )
+    ARCHIVED_CONVERSATIONS = Counter(
+        'scribble_archived_conversations_total', 'Closed conversations moved to the cold archive, by source',
+        ['source'],
+    )
+else:
+    STAGE_SECONDS = STAGE_ERRORS = REQUEST_SECONDS = LLM_REQUESTS = LLM_SECONDS = _NoopMetric()
+    RETRIEVAL_CACHE_REQUESTS = RETRIEVAL_CACHE_SAVED_SECONDS = EMBEDDING_CACHE_REQUESTS = _NoopMetric()
+    LLM_QUEUE_DEPTH = LLM_SLOTS_IN_USE = LLM_QUEUE_WAIT_SECONDS = LLM_ADMISSIONS = _NoopMetric()
+    THROTTLE_DECISIONS = RETENTION_PURGED = EXPORT_ROWS = ARCHIVED_CONVERSATIONS = _NoopMetric()
+
+
+def render():
+    """
+    Return (body, content_type) for the metrics endpoint.
+
+    Returns None when prometheus_client isn't installed.
+    """
+    if prometheus_client is None:
+        return None
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = prometheus_client.REGISTRY
+    return prometheus_client.generate_latest(registry), prometheus_client.CONTENT_TYPE_LATEST
@@ -0,0 +1,46 @@
+import time
+
+from django.conf import settings
+
+from . import anonymous, timing
+from .metrics import REQUEST_SECONDS
+
+
+class MetricsMiddleware:
+    """
+    Record request latency per view and collect stage timings per request.
+
+    With SERVER_TIMING_HEADER enabled the stage breakdown is returned in a
+    Server-Timing header, which browser dev tools show in the network panel.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        started = time.perf_counter()
+        with timing.collect() as stages:
+            response = self.get_response(request)
+        elapsed = time.perf_counter() - started
+
+        # Label by URL pattern name, not path, to keep the series count bounded
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match else 'unmatched'
+        REQUEST_SECONDS.labels(method=request.method, view=view, status=response.status_code).observe(elapsed)
+
+        if getattr(settings, 'SERVER_TIMING_HEADER', False):
+            response['Server-Timing'] = timing.server_timing(stages, total_ms=elapsed * 1000)
+            response['Timing-Allow-Origin'] = '*'
+        return response
+
+
+class AnonymousIdMiddleware:
+    """Set the anonymous id cookie when a view handed out a new id (see anonymous.py)"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        anonymous.set_cookie(request, response)
+        return response
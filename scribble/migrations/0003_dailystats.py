@@ -0,0 +1,68 @@
+# Generated by Django 5.2.5 on 2026-10-19 02:32
+
+from django.db import migrations, models
+from django.db.models import Count, Q
+from django.db.models.functions import TruncDate
+
+
+def backfill_daily_stats(apps, schema_editor):
+    """Build the initial rollup rows from existing data"""
+    DailyStats = apps.get_model('scribble', 'DailyStats')
+    Conversation = apps.get_model('scribble', 'Conversation')
+    Message = apps.get_model('scribble', 'Message')
+    User = apps.get_model('scribble', 'User')
+
+    rows = {}
+
+    def merge(queryset, field, **aggregates):
+        results = queryset.order_by().annotate(day=TruncDate(field)).values('day').annotate(**aggregates)
+        for result in results:
+            rows.setdefault(result.pop('day'), {}).update(result)
+
+    merge(Conversation.objects.all(), 'created_at', conversations=Count('id'))
+    merge(
+        Message.objects.all(), 'created_at',
+        messages=Count('id'),
+        user_messages=Count('id', filter=Q(sender='user')),
+        ai_messages=Count('id', filter=Q(sender='ai')),
+        admin_messages=Count('id', filter=Q(sender='admin')),
+    )
+    merge(User.objects.all(), 'date_joined', new_users=Count('id'))
+
+    DailyStats.objects.bulk_create([
+        DailyStats(date=day, **counters) for day, counters in rows.items()
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scribble', '0002_memoirformsubmission'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(unique=True)),
+                ('conversations', models.PositiveIntegerField(default=0)),
+                ('messages', models.PositiveIntegerField(default=0)),
+                ('user_messages', models.PositiveIntegerField(default=0)),
+                ('ai_messages', models.PositiveIntegerField(default=0)),
+                ('admin_messages', models.PositiveIntegerField(default=0)),
+                ('new_users', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name_plural': 'Daily Stats',
+                'ordering': ['-date'],
+            },
+        ),
+        migrations.AddField(
+            model_name='knowledgedocument',
+            name='processing_error',
+            field=models.TextField(blank=True, help_text='Error message if processing failed', null=True),
+        ),
+        migrations.RunPython(backfill_daily_stats, migrations.RunPython.noop),
+    ]
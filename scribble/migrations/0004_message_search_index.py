@@ -0,0 +1,26 @@
+# Full-text search index for message content (tsvector + GIN on PostgreSQL,
+# FTS5 on SQLite). The SQL lives in scribble/search.py so the post_migrate
+# repair hook and this migration stay in sync.
+
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    from scribble.search import ensure_index
+    ensure_index(schema_editor.connection)
+
+
+def drop_search_index(apps, schema_editor):
+    from scribble.search import drop_index
+    drop_index(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scribble', '0003_dailystats'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
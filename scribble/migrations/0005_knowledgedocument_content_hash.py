@@ -0,0 +1,32 @@
+# Generated by Django 5.2.5 on 2026-10-19 02:52
+
+from django.db import migrations, models
+
+
+def backfill_content_hash(apps, schema_editor):
+    from scribble.fingerprints import file_sha256
+
+    KnowledgeDocument = apps.get_model('scribble', 'KnowledgeDocument')
+    for document in KnowledgeDocument.objects.filter(content_hash='').exclude(file=''):
+        try:
+            content_hash = file_sha256(document.file.path)
+        except (OSError, ValueError):
+            # File missing from storage; it gets a hash if it is uploaded again
+            continue
+        KnowledgeDocument.objects.filter(pk=document.pk).update(content_hash=content_hash)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scribble', '0004_message_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='knowledgedocument',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, help_text='SHA-256 of the file contents, used to skip re-uploads of the same file', max_length=64),
+        ),
+        migrations.RunPython(backfill_content_hash, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 5.2.5 on 2026-10-19 03:35
+
+from django.db import migrations, models
+
+from scribble.summaries import SUMMARY_FIELDS, summary_expressions
+
+
+def backfill_summaries(apps, schema_editor):
+    # Same computation as the reconcile_conversation_summaries command, on
+    # the historical models, 1000 conversations per UPDATE
+    Conversation = apps.get_model('scribble', 'Conversation')
+    expressions = summary_expressions(apps.get_model('scribble', 'Message'),
+                                      apps.get_model('scribble', 'ReadWatermark'))
+    last_pk = 0
+    while True:
+        ids = list(Conversation.objects.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)[:1000])
+        if not ids:
+            break
+        last_pk = ids[-1]
+        Conversation.objects.filter(pk__in=ids).update(**{field: expressions[field] for field in SUMMARY_FIELDS})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scribble', '0006_readwatermark'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversation',
+            name='last_message_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='last_message_id',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='last_message_preview',
+            field=models.CharField(blank=True, default='', max_length=200),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='last_message_sender',
+            field=models.CharField(blank=True, default='', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='message_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='unread_count',
+            field=models.PositiveIntegerField(default=0, help_text='User messages the admins have not read'),
+        ),
+        migrations.AddIndex(
+            model_name='conversation',
+            index=models.Index(fields=['-updated_at', '-id'], name='scribble_conv_updated_idx'),
+        ),
+        migrations.RunPython(backfill_summaries, migrations.RunPython.noop),
+    ]
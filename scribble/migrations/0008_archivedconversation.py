@@ -0,0 +1,34 @@
+# Generated by Django 5.2.5 on 2026-10-19 03:41
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scribble', '0007_conversation_summary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedConversation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(choices=[('scribble', 'Scribble'), ('chat', 'Chat')], max_length=10)),
+                ('conversation_id', models.BigIntegerField()),
+                ('owner', models.CharField(blank=True, default='', help_text='User of the conversation, for lookups', max_length=255)),
+                ('status', models.CharField(blank=True, default='', max_length=20)),
+                ('message_count', models.PositiveIntegerField(default=0)),
+                ('conversation_created_at', models.DateTimeField()),
+                ('conversation_updated_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('payload', models.BinaryField(help_text='gzip-compressed JSON of the conversation, its messages and read state')),
+            ],
+            options={
+                'ordering': ['-conversation_updated_at'],
+                'indexes': [models.Index(fields=['source', 'owner'], name='scribble_archive_owner_idx')],
+                'constraints': [models.UniqueConstraint(fields=('source', 'conversation_id'), name='scribble_archive_unique_conversation')],
+            },
+        ),
+    ]
@@ -1,10 +1,19 @@
-from django.db import models
+from django.db import models, transaction
 from django.conf import settings
 from django.utils import timezone
 
 # Import the custom User model from custom_user.py
 from .custom_user import User
 
+class ConversationQuerySet(models.QuerySet):
+    def with_summary(self):
+        """
+        Conversations ready for the list endpoints. The last message, message
+        count and unread count are columns kept up to date by the message
+        writes (see summaries.py), so this only joins the user.
+        """
+        return self.select_related('user')
+
 class Conversation(models.Model):
     STATUS_CHOICES = [
         ('pending_ai', 'Pending AI Response'),
@@ -21,8 +30,21 @@ class Conversation(models.Model):
     ai_enabled = models.BooleanField(default=True)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending_ai')
 
+    # Denormalized summary, maintained by summaries.py
+    last_message_id = models.BigIntegerField(null=True, blank=True)
+    last_message_preview = models.CharField(max_length=200, blank=True, default='')
+    last_message_sender = models.CharField(max_length=10, blank=True, default='')
+    last_message_at = models.DateTimeField(null=True, blank=True)
+    message_count = models.PositiveIntegerField(default=0)
+    unread_count = models.PositiveIntegerField(default=0, help_text='User messages the admins have not read')
+
+    objects = ConversationQuerySet.as_manager()
+
     class Meta:
         ordering = ['-updated_at']
+        indexes = [
+            models.Index(fields=['-updated_at', '-id'], name='scribble_conv_updated_idx'),
+        ]
 
 class Message(models.Model):
     SENDER_CHOICES = [
@@ -34,12 +56,93 @@ class Message(models.Model):
     conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE, related_name='messages')
     content = models.TextField()
     sender = models.CharField(max_length=10, choices=SENDER_CHOICES)
-    created_at = models.DateTimeField(auto_now_add=True)
-    is_read = models.BooleanField(default=False)
+    # Not auto_now_add: messages built when they arrive keep that time when
+    # they are saved later with the rest of the turn (persist_turn)
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
 
     class Meta:
         ordering = ['created_at']
 
+    def save(self, *args, **kwargs):
+        # The conversation summary is updated from post_save; keep it in the
+        # same transaction as the message
+        from . import summaries
+
+        adding = self._state.adding
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
+            if not adding:
+                summaries.record_edit(self)
+
+    def delete(self, *args, **kwargs):
+        from . import summaries
+
+        with transaction.atomic(using=kwargs.get('using')):
+            result = super().delete(*args, **kwargs)
+            summaries.refresh(Conversation.objects.filter(pk=self.conversation_id))
+        return result
+
+class ReadWatermark(models.Model):
+    """Newest message a participant role has read in a conversation (see read_state.py)"""
+    ROLE_CHOICES = [('admin', 'Admin'), ('user', 'User')]
+
+    conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE, related_name='read_watermarks')
+    role = models.CharField(max_length=10, choices=ROLE_CHOICES)
+    last_read_message_id = models.BigIntegerField(default=0)
+    read_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['conversation', 'role'], name='scribble_readwatermark_unique_role'),
+        ]
+
+    def __str__(self):
+        return f"{self.role} read conversation {self.conversation_id} up to message {self.last_read_message_id}"
+
+class ArchivedConversation(models.Model):
+    """A closed conversation moved to the cold archive with its messages (see archive.py)"""
+    SOURCE_CHOICES = [('scribble', 'Scribble'), ('chat', 'Chat')]
+
+    source = models.CharField(max_length=10, choices=SOURCE_CHOICES)
+    conversation_id = models.BigIntegerField()
+    owner = models.CharField(max_length=255, blank=True, default='', help_text='User of the conversation, for lookups')
+    status = models.CharField(max_length=20, blank=True, default='')
+    message_count = models.PositiveIntegerField(default=0)
+    conversation_created_at = models.DateTimeField()
+    conversation_updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField(default=timezone.now)
+    payload = models.BinaryField(help_text='gzip-compressed JSON of the conversation, its messages and read state')
+
+    class Meta:
+        ordering = ['-conversation_updated_at']
+        constraints = [
+            models.UniqueConstraint(fields=['source', 'conversation_id'], name='scribble_archive_unique_conversation'),
+        ]
+        indexes = [
+            models.Index(fields=['source', 'owner'], name='scribble_archive_owner_idx'),
+        ]
+
+    def __str__(self):
+        return f"Archived {self.source} conversation {self.conversation_id}"
+
+class DailyStats(models.Model):
+    """Per-day rollup of dashboard counters, maintained incrementally by signals"""
+    date = models.DateField(unique=True)
+    conversations = models.PositiveIntegerField(default=0)
+    messages = models.PositiveIntegerField(default=0)
+    user_messages = models.PositiveIntegerField(default=0)
+    ai_messages = models.PositiveIntegerField(default=0)
+    admin_messages = models.PositiveIntegerField(default=0)
+    new_users = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-date']
+        verbose_name_plural = "Daily Stats"
+
+    def __str__(self):
+        return f"Stats for {self.date}"
+
 class Document(models.Model):
     DOCUMENT_TYPES = [
         ('knowledge', 'Knowledge Base'),
@@ -69,6 +172,8 @@ class AdminSettings(models.Model):
 
 import os
 
+from .fingerprints import file_sha256
+
 class KnowledgeDocument(models.Model):
     file = models.FileField(upload_to='knowledge_base/')
     title = models.CharField(max_length=255, blank=True)
@@ -78,6 +183,10 @@ class KnowledgeDocument(models.Model):
     processing_error = models.TextField(blank=True, null=True, help_text='Error message if processing failed')
     file_size = models.PositiveIntegerField(null=True, blank=True)
     file_type = models.CharField(max_length=50, blank=True)
+    content_hash = models.CharField(
+        max_length=64, blank=True, db_index=True,
+        help_text='SHA-256 of the file contents, used to skip re-uploads of the same file'
+    )
 
     def save(self, *args, **kwargs):
         if not self.title and self.file:
@@ -85,8 +194,24 @@ class KnowledgeDocument(models.Model):
         if self.file:
             self.file_size = self.file.size
             self.file_type = os.path.splitext(self.file.name)[1].lower()
+            # New uploads, not yet written to storage; existing rows were
+            # hashed by migration 0005
+            if not self.file._committed:
+                self.content_hash = file_sha256(self.file)
         super().save(*args, **kwargs)
 
+    @classmethod
+    def find_duplicate(cls, uploaded_file, exclude_pk=None):
+        """
+        Return ``(content_hash, existing)`` for an upload, where ``existing``
+        is an already processed document with identical bytes, or None.
+        """
+        content_hash = file_sha256(uploaded_file)
+        existing = cls.objects.filter(content_hash=content_hash, is_processed=True)
+        if exclude_pk is not None:
+            existing = existing.exclude(pk=exclude_pk)
+        return content_hash, existing.order_by('uploaded_at').first()
+
     def process_document(self):
         """Process the document content for vector search"""
         try:
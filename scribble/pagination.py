@@ -0,0 +1,114 @@
+"""
+Cursor pagination for the API list endpoints.
+
+Page-number pagination runs COUNT(*) over the filtered table for every page
+and OFFSET scans past every earlier row, so list responses slowed down as the
+conversation and message tables grew. A cursor instead encodes the position
+of the last row in the ordering, and the next page is one indexed range
+query, however deep it is.
+
+The ordering comes from the view's ``cursor_ordering``, otherwise from the
+queryset's own ``order_by`` (or the model's Meta.ordering), with the primary
+key appended as a tie-breaker so pages are stable. Totals are only returned
+when asked for with ``?count=1``, and then estimated: from the planner's row
+count (pg_class.reltuples) for a whole table on PostgreSQL, otherwise from a
+COUNT cached for PAGINATION_COUNT_CACHE_SECONDS.
+"""
+import hashlib
+import logging
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet
+from django.db import DatabaseError, connections
+from rest_framework import pagination
+from rest_framework.response import Response
+
+logger = logging.getLogger(__name__)
+
+COUNT_CACHE_PREFIX = 'pagination-count'
+
+
+def _table_estimate(queryset):
+    """pg_class.reltuples for an unfiltered PostgreSQL table, or None"""
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql' or queryset.query.where or queryset.query.distinct:
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass',
+                       [queryset.model._meta.db_table])
+        row = cursor.fetchone()
+    # -1 (or 0 on older servers) until the table is first analyzed
+    return row[0] if row and row[0] > 0 else None
+
+
+def estimated_count(queryset):
+    """
+    Approximate number of rows in ``queryset``, without a COUNT(*) on every call.
+
+    Returns:
+        int or None: None if the queryset can't be counted
+    """
+    try:
+        estimate = _table_estimate(queryset)
+    except DatabaseError as e:
+        logger.warning(f"Row estimate failed for {queryset.model._meta.db_table}: {e}")
+        estimate = None
+    if estimate is not None:
+        return estimate
+
+    try:
+        sql, params = queryset.order_by().query.sql_with_params()
+    except EmptyResultSet:
+        return 0
+    key = f"{COUNT_CACHE_PREFIX}:{hashlib.sha1(f'{queryset.db}:{sql}:{params}'.encode('utf-8')).hexdigest()}"
+    count = cache.get(key)
+    if count is None:
+        count = queryset.count()
+        cache.set(key, count, getattr(settings, 'PAGINATION_COUNT_CACHE_SECONDS', 60))
+    return count
+
+
+class CursorPagination(pagination.CursorPagination):
+    """Project-wide cursor pagination; see the module docstring"""
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = '-pk'
+    count_query_param = 'count'
+
+    def get_ordering(self, request, queryset, view):
+        ordering = getattr(view, 'cursor_ordering', None)
+        if not ordering:
+            ordering = [field for field in queryset.query.order_by if isinstance(field, str)]
+        if not ordering:
+            ordering = [field for field in queryset.model._meta.ordering if isinstance(field, str)]
+        if not ordering:
+            ordering = [self.ordering]
+        ordering = tuple(ordering)
+        if not any(field.lstrip('-') in ('pk', 'id') for field in ordering):
+            ordering += ('-pk' if ordering[0].startswith('-') else 'pk',)
+        return ordering
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.count = None
+        if request.query_params.get(self.count_query_param, '').lower() in ('1', 'true', 'estimate'):
+            self.count = estimated_count(queryset)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            *([('count', self.count)] if self.count is not None else []),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        response_schema = super().get_paginated_response_schema(schema)
+        response_schema['properties']['count'] = {
+            'type': 'integer',
+            'nullable': True,
+            'description': f'Estimated total, only with ?{self.count_query_param}=1',
+        }
+        return response_schema
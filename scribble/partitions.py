@@ -0,0 +1,275 @@
+"""
+Monthly range partitioning of the message tables on PostgreSQL.
+
+scribble_message and chat_message only ever grow. Partitioned by created_at,
+one partition per month, the planner skips the months a date-bounded query
+can't touch, and old months are removed by detaching their partition (a
+catalog change) instead of a long DELETE.
+
+``convert()`` turns an existing table into a partitioned one, once: the table
+is renamed to <table>_legacy and becomes the partition for everything before
+next month, under a new partitioned table with the same columns, indexes and
+foreign keys. PostgreSQL requires the partition key in unique constraints, so
+the primary key becomes (id, created_at); ids stay unique because they still
+come from one sequence. The conversion locks the table while the new primary
+key index is built on the old rows, so run it in a quiet period.
+
+``ensure_partitions()`` creates the partitions for the coming months and has
+to run before each month starts (the partition_messages command, e.g. daily
+from cron). There is no default partition: an insert into a month without a
+partition fails loudly rather than piling up in a catch-all table.
+``detach_partitions()`` detaches months older than a cutoff once they are
+empty; the cold archive (archive.py) moves closed conversations out first.
+Detached partitions are renamed <name>_detached, or dropped.
+
+Other databases have no declarative partitioning and these functions raise
+PartitioningUnsupported; there the cold archive alone keeps the hot tables
+small.
+"""
+import calendar
+import logging
+import re
+from datetime import datetime, timezone as dt_timezone
+
+from django.db import connections, transaction
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+_BOUND = re.compile(r"FROM \((.+)\) TO \((.+)\)")
+
+
+class PartitioningUnsupported(Exception):
+    """The database can't partition the message tables (not PostgreSQL, or not converted yet)"""
+
+
+def message_models():
+    from chat.models import Message as ChatMessage
+
+    from .models import Message
+    return [Message, ChatMessage]
+
+
+def month_start(value):
+    return value.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def add_months(value, count):
+    """``value`` moved by ``count`` calendar months, clamping the day to the month's length"""
+    index = value.year * 12 + value.month - 1 + count
+    year, month = divmod(index, 12)
+    return value.replace(year=year, month=month + 1, day=min(value.day, calendar.monthrange(year, month + 1)[1]))
+
+
+def _connection(using):
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        raise PartitioningUnsupported(
+            f'Partitioning needs PostgreSQL, not {connection.vendor}; the cold archive '
+            '(archive_conversations) keeps the message tables small instead'
+        )
+    return connection
+
+
+def _literal(value):
+    # Bounds and names come from our own datetimes, never from input
+    return f"'{value.isoformat()}'"
+
+
+def _parse_bound(value):
+    value = value.strip()
+    if value in ('MINVALUE', 'MAXVALUE'):
+        return None
+    return datetime.fromisoformat(value.strip("'"))
+
+
+def is_partitioned(cursor, table):
+    cursor.execute('SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)', [table])
+    row = cursor.fetchone()
+    return bool(row) and row[0] == 'p'
+
+
+def partitions(cursor, table):
+    """
+    Partitions of ``table``.
+
+    Returns:
+        list: (name, lower bound, upper bound), None for an unbounded side
+    """
+    cursor.execute(
+        """SELECT c.relname, pg_get_expr(c.relpartbound, c.oid)
+           FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+           WHERE i.inhparent = %s::regclass""",
+        [table],
+    )
+    found = []
+    for name, bound in cursor.fetchall():
+        match = _BOUND.search(bound or '')
+        if match:
+            found.append((name, _parse_bound(match.group(1)), _parse_bound(match.group(2))))
+    return sorted(found, key=lambda partition: partition[2] or datetime.max.replace(tzinfo=dt_timezone.utc))
+
+
+def convert(model, using='default'):
+    """
+    Make ``model``'s table a monthly partitioned table, keeping its rows in
+    a legacy partition. See the module docstring.
+
+    Returns:
+        bool: False if the table was already partitioned
+    """
+    connection = _connection(using)
+    qn = connection.ops.quote_name
+    table = model._meta.db_table
+    legacy = f'{table}_legacy'
+    bound = add_months(month_start(timezone.now()), 1)
+
+    with transaction.atomic(using=using), connection.cursor() as cursor:
+        if is_partitioned(cursor, table):
+            return False
+        cursor.execute(f'LOCK TABLE {qn(table)} IN ACCESS EXCLUSIVE MODE')
+        cursor.execute(f'SELECT COALESCE(MAX(id), 0) FROM {qn(table)}')
+        max_id = cursor.fetchone()[0]
+        cursor.execute("SELECT attidentity FROM pg_attribute WHERE attrelid = %s::regclass AND attname = 'id'",
+                       [table])
+        identity = cursor.fetchone()[0] != ''
+        if identity:
+            # Carry on from the old sequence, not MAX(id): ids above MAX(id)
+            # may have been handed out and deleted (retention, archive) and
+            # are still referenced by read watermarks and conversation summaries
+            cursor.execute(
+                """SELECT last_value FROM pg_sequences
+                   WHERE format('%%I.%%I', schemaname, sequencename)::regclass
+                         = pg_get_serial_sequence(%s, 'id')::regclass""",
+                [table],
+            )
+            row = cursor.fetchone()
+            # last_value is NULL until the sequence is first used
+            last_value = row[0] if row and row[0] is not None else 0
+            next_id = max(last_value, max_id) + 1
+        cursor.execute(
+            """SELECT i.relname, pg_get_indexdef(i.oid), x.indisprimary, x.indisunique
+               FROM pg_index x JOIN pg_class i ON i.oid = x.indexrelid
+               WHERE x.indrelid = %s::regclass""",
+            [table],
+        )
+        indexes = cursor.fetchall()
+        cursor.execute("SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+                       "WHERE conrelid = %s::regclass AND contype = 'f'", [table])
+        foreign_keys = cursor.fetchall()
+
+        # Move the table and its index names out of the way
+        cursor.execute(f'ALTER TABLE {qn(table)} RENAME TO {qn(legacy)}')
+        for name, _, _, _ in indexes:
+            cursor.execute(f'ALTER INDEX {qn(name)} RENAME TO {qn(name[:56] + "_legacy")}')
+
+        if identity:
+            # The new parent table owns the id sequence; partitions can't have their own
+            cursor.execute(f'ALTER TABLE {qn(legacy)} ALTER COLUMN id DROP IDENTITY')
+        cursor.execute(
+            f'CREATE TABLE {qn(table)} (LIKE {qn(legacy)} INCLUDING DEFAULTS INCLUDING GENERATED '
+            f'INCLUDING STORAGE) PARTITION BY RANGE (created_at)'
+        )
+        if identity:
+            cursor.execute(f'ALTER TABLE {qn(table)} ALTER COLUMN id ADD GENERATED BY DEFAULT AS IDENTITY '
+                           f'(START WITH {int(next_id)})')
+        else:
+            # A serial column: the copied default keeps using the old sequence
+            cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", [legacy])
+            sequence = cursor.fetchone()[0]
+            if sequence:
+                cursor.execute(f'ALTER SEQUENCE {sequence} OWNED BY {qn(table)}.id')
+
+        cursor.execute(f'ALTER TABLE {qn(table)} ADD CONSTRAINT {qn(table + "_pkey")} PRIMARY KEY (id, created_at)')
+        for name, definition, primary, unique in indexes:
+            if primary:
+                continue
+            if unique:
+                logger.warning(f'Not recreating unique index {name} on partitioned {table}: '
+                               'unique indexes must include created_at')
+                continue
+            # The definition still names the original table, now the partitioned one
+            cursor.execute(definition)
+        for name, definition in foreign_keys:
+            cursor.execute(f'ALTER TABLE {qn(table)} ADD CONSTRAINT {qn(name)} {definition}')
+
+        cursor.execute(f'ALTER TABLE {qn(table)} ATTACH PARTITION {qn(legacy)} '
+                       f'FOR VALUES FROM (MINVALUE) TO ({_literal(bound)})')
+    logger.info(f'Partitioned {table}; existing rows are in {legacy} (before {bound:%Y-%m})')
+    return True
+
+
+def ensure_partitions(model, months_ahead=3, start=None, using='default'):
+    """
+    Create the missing monthly partitions from ``start`` (default this month)
+    until ``months_ahead`` months after this one.
+
+    Returns:
+        list: Names of the partitions created
+    """
+    connection = _connection(using)
+    qn = connection.ops.quote_name
+    table = model._meta.db_table
+    this_month = month_start(timezone.now())
+    month = month_start(start) if start else this_month
+    last = add_months(this_month, months_ahead)
+
+    created = []
+    with transaction.atomic(using=using), connection.cursor() as cursor:
+        if not is_partitioned(cursor, table):
+            raise PartitioningUnsupported(f'{table} is not partitioned; run partition_messages --convert first')
+        existing = partitions(cursor, table)
+        while month <= last:
+            end = add_months(month, 1)
+            covered = any((lower is None or lower < end) and (upper is None or upper > month)
+                          for _, lower, upper in existing)
+            if not covered:
+                name = f'{table}_p{month:%Y%m}'
+                cursor.execute(f'CREATE TABLE {qn(name)} PARTITION OF {qn(table)} '
+                               f'FOR VALUES FROM ({_literal(month)}) TO ({_literal(end)})')
+                created.append(name)
+            month = end
+    if created:
+        logger.info(f'Created partitions of {table}: {", ".join(created)}')
+    return created
+
+
+def detach_partitions(model, older_than_months, drop=False, force=False, using='default'):
+    """
+    Detach the partitions of ``model``'s table that end at least
+    ``older_than_months`` months before this month.
+
+    Args:
+        drop: Drop detached partitions instead of renaming them <name>_detached
+        force: Also detach partitions that still hold rows
+
+    Returns:
+        dict: Partition names detached and skipped (not empty)
+    """
+    connection = _connection(using)
+    qn = connection.ops.quote_name
+    table = model._meta.db_table
+    cutoff = add_months(month_start(timezone.now()), -older_than_months)
+
+    report = {'detached': [], 'skipped': []}
+    with connection.cursor() as cursor:
+        if not is_partitioned(cursor, table):
+            raise PartitioningUnsupported(f'{table} is not partitioned; run partition_messages --convert first')
+        for name, _, upper in partitions(cursor, table):
+            if upper is None or upper > cutoff:
+                continue
+            with transaction.atomic(using=using):
+                if not force:
+                    cursor.execute(f'SELECT EXISTS (SELECT 1 FROM {qn(name)})')
+                    if cursor.fetchone()[0]:
+                        report['skipped'].append(name)
+                        continue
+                cursor.execute(f'ALTER TABLE {qn(table)} DETACH PARTITION {qn(name)}')
+                if drop:
+                    cursor.execute(f'DROP TABLE {qn(name)}')
+                else:
+                    cursor.execute(f'ALTER TABLE {qn(name)} RENAME TO {qn(name[:54] + "_detached")}')
+            report['detached'].append(name)
+    if report['detached'] or report['skipped']:
+        logger.info(f'Partitions of {table} older than {cutoff:%Y-%m}: {report}')
+    return report
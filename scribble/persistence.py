@@ -0,0 +1,63 @@
+"""
+Transactional persistence for chat turns.
+
+A chat turn (the user's message plus the assistant's reply) is written with
+one bulk INSERT and one conversation UPDATE inside a single transaction
+(which also maintains the scribble conversation summary, see summaries.py),
+instead of a save per message followed by a post_save handler re-saving the
+conversation for each of them. Works with both the chat and scribble
+Conversation/Message models.
+"""
+from django.db import transaction
+from django.dispatch import Signal
+from django.utils import timezone
+
+from .timing import stage
+
+# Sent once per persisted turn, inside the transaction, with the Message
+# model as sender and ``conversation`` and ``messages`` keyword arguments.
+# bulk_create() doesn't send post_save, so batch-aware receivers hook in here.
+turn_persisted = Signal()
+
+
+def persist_turn(conversation, messages, conversation_fields=()):
+    """
+    Save the messages of one chat turn and touch the conversation atomically.
+
+    Args:
+        conversation: Conversation instance, inserted first if unsaved, then
+            given a single UPDATE of ``updated_at``
+        messages: Unsaved Message instances, in the order they were sent
+        conversation_fields: Other conversation fields changed during the
+            turn (e.g. ``status``) to include in the UPDATE
+
+    Returns:
+        list: The saved messages with primary keys set
+    """
+    if not messages:
+        return []
+
+    message_model = type(messages[0])
+    conversation_model = type(conversation)
+
+    with stage('db_write'), transaction.atomic():
+        if conversation.pk is None:
+            conversation.save()
+
+        for message in messages:
+            message.conversation = conversation
+        created = message_model.objects.bulk_create(messages)
+
+        conversation.updated_at = timezone.now()
+        updates = {field: getattr(conversation, field) for field in conversation_fields}
+        if hasattr(conversation_model, 'message_count'):
+            # Scribble conversations keep a summary of their messages
+            from .summaries import message_updates
+            updates = {**message_updates(created), **updates}
+        conversation_model.objects.filter(pk=conversation.pk).update(
+            updated_at=conversation.updated_at, **updates
+        )
+
+        turn_persisted.send(sender=message_model, conversation=conversation, messages=created)
+
+    return created
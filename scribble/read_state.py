@@ -0,0 +1,99 @@
+"""
+Read state as per-participant watermarks.
+
+Each conversation has at most one ReadWatermark per reader role: the id of
+the newest message that role has read, and when. Everything up to the
+watermark counts as read, so marking a conversation read is a single-row
+upsert instead of an UPDATE over every unread message, and the unread count
+is the number of the other side's messages with a larger id, an index range
+on (conversation, id).
+
+Admins read what the visitor sends ('user' messages); the visitor reads the
+AI and admin replies. The same helpers serve the chat app's conversations,
+given its watermark model. Scribble conversations also keep the admins'
+unread count in a column (see summaries.py), recomputed here when their
+watermark moves.
+"""
+from django.db import models
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+ADMIN, USER = 'admin', 'user'
+
+
+def reader_of(sender):
+    """The role whose watermark says whether a message from ``sender`` was read"""
+    return ADMIN if sender == 'user' else USER
+
+
+def _watermark_model(model):
+    if model is None:
+        from .models import ReadWatermark
+        return ReadWatermark
+    return model
+
+
+def mark_read(conversation_id, role, up_to=None, model=None):
+    """
+    Advance ``role``'s watermark in a conversation to message ``up_to``.
+
+    A watermark never moves back, so an older page loaded late can't mark
+    newer messages unread again.
+
+    Args:
+        up_to: Message id; the conversation's newest message when None
+        model: Watermark model (default scribble's ReadWatermark)
+
+    Returns:
+        int: The message id marked up to
+    """
+    summarized = model is None
+    model = _watermark_model(model)
+    if up_to is None:
+        message_model = model._meta.get_field('conversation').related_model.messages.field.model
+        up_to = message_model.objects.filter(conversation_id=conversation_id).aggregate(
+            newest=models.Max('id'))['newest'] or 0
+
+    updates = {'last_read_message_id': Greatest(models.F('last_read_message_id'), up_to), 'read_at': timezone.now()}
+    watermark = model.objects.filter(conversation_id=conversation_id, role=role)
+    if not watermark.update(**updates):
+        model.objects.get_or_create(conversation_id=conversation_id, role=role,
+                                    defaults={'last_read_message_id': up_to})
+        watermark.update(**updates)
+    if summarized and role == ADMIN:
+        from . import summaries
+
+        summaries.refresh(model._meta.get_field('conversation').related_model.objects.filter(pk=conversation_id),
+                          fields=['unread_count'])
+    return up_to
+
+
+def watermarks(conversation_ids, model=None):
+    """
+    Watermarks of many conversations in one query.
+
+    Returns:
+        dict: {(conversation_id, role): last_read_message_id}
+    """
+    rows = _watermark_model(model).objects.filter(conversation_id__in=conversation_ids)
+    return {
+        (conversation_id, role): last_read
+        for conversation_id, role, last_read in rows.values_list('conversation_id', 'role', 'last_read_message_id')
+    }
+
+
+def watermark_subquery(role, model=None, conversation_ref='pk'):
+    """The watermark id of ``role`` for the outer conversation (0 if unread), for annotations"""
+    last_read = _watermark_model(model).objects.filter(
+        conversation=models.OuterRef(conversation_ref), role=role,
+    ).values('last_read_message_id')[:1]
+    return Coalesce(models.Subquery(last_read), 0, output_field=models.BigIntegerField())
+
+
+def unread_count(conversation, role=ADMIN, model=None):
+    """Messages in ``conversation`` that ``role`` hasn't read"""
+    last_read = watermarks([conversation.pk], model).get((conversation.pk, role), 0)
+    messages = conversation.messages.filter(id__gt=last_read)
+    if role == ADMIN:
+        return messages.filter(sender='user').count()
+    return messages.exclude(sender='user').count()
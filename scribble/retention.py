@@ -0,0 +1,150 @@
+"""
+Retention for abandoned anonymous conversations.
+
+Every anonymous visitor leaves a conversation behind: a scribble Conversation
+from the chat widget (no user) and a chat Conversation from the messages API
+(user_id ``anonymous_<id>``). Nothing removed them, and the tables grew with
+every visit, slowing down the admin lists, counts and search.
+
+``purge_abandoned()`` deletes the ones nobody has touched for
+RETENTION_ANONYMOUS_DAYS, with their messages. Conversations of signed-in
+users, named API users and conversations waiting for an admin are kept. Rows
+are walked by primary key and deleted RETENTION_BATCH_SIZE conversations at a
+time, each batch in its own short transaction, so the purge never holds locks
+for long and can be paused between batches. With an archive directory each
+batch is first appended to a gzipped JSON lines file, one conversation with
+its messages per line.
+
+DailyStats rollups count what was created and are left alone; running
+reconcile_stats afterwards would drop the purged conversations from them.
+"""
+import gzip
+import json
+import logging
+import os
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils import timezone
+
+from .metrics import RETENTION_PURGED
+
+logger = logging.getLogger(__name__)
+
+
+def abandoned_conversations(cutoff):
+    """
+    Conversations eligible for purging, per conversation table.
+
+    Returns:
+        list: (label, conversation queryset, message model)
+    """
+    from chat.models import Conversation as ChatConversation, Message as ChatMessage
+
+    from .models import Conversation, Message
+
+    return [
+        ('scribble', Conversation.objects.filter(user__isnull=True, updated_at__lt=cutoff)
+            .exclude(status='awaiting_admin'), Message),
+        ('chat', ChatConversation.objects.filter(user_id__startswith='anonymous_', updated_at__lt=cutoff),
+            ChatMessage),
+    ]
+
+
+def _archive(archive, label, conversations, message_model):
+    messages = {}
+    for message in message_model.objects.filter(conversation_id__in=[c['id'] for c in conversations]).values():
+        messages.setdefault(message['conversation_id'], []).append(message)
+    for conversation in conversations:
+        archive.write(json.dumps({
+            'table': label,
+            'conversation': conversation,
+            'messages': messages.get(conversation['id'], []),
+        }, cls=DjangoJSONEncoder) + '\n')
+    archive.flush()
+
+
+def purge_abandoned(days=None, batch_size=None, archive_dir=None, sleep=0.0, dry_run=False):
+    """
+    Delete anonymous conversations untouched for ``days`` days, in batches.
+
+    Args:
+        days: Default RETENTION_ANONYMOUS_DAYS; 0 or less purges nothing
+        batch_size: Conversations per transaction (default RETENTION_BATCH_SIZE)
+        archive_dir: Append purged rows to a gzipped JSON lines file here
+            first (default RETENTION_ARCHIVE_DIR; empty for no archive)
+        sleep: Seconds to pause between batches
+        dry_run: Only count what would be purged
+
+    Returns:
+        dict: Conversations and messages purged per table, the archive path
+        and the time taken
+    """
+    if days is None:
+        days = getattr(settings, 'RETENTION_ANONYMOUS_DAYS', 30)
+    if batch_size is None:
+        batch_size = getattr(settings, 'RETENTION_BATCH_SIZE', 500)
+    if archive_dir is None:
+        archive_dir = getattr(settings, 'RETENTION_ARCHIVE_DIR', '')
+
+    started = time.perf_counter()
+    report = {'days': days, 'dry_run': dry_run, 'archive': None, 'tables': {}}
+    if days <= 0:
+        report['seconds'] = 0.0
+        return report
+
+    cutoff = timezone.now() - timedelta(days=days)
+    archive = None
+    if archive_dir and not dry_run:
+        os.makedirs(archive_dir, exist_ok=True)
+        report['archive'] = os.path.join(
+            archive_dir, f"conversations-{timezone.now().strftime('%Y%m%dT%H%M%S')}.jsonl.gz"
+        )
+        archive = gzip.open(report['archive'], 'at', encoding='utf-8')
+
+    try:
+        for label, conversations, message_model in abandoned_conversations(cutoff):
+            counts = report['tables'][label] = {'conversations': 0, 'messages': 0, 'batches': 0}
+            conversation_table = conversations.model._meta.db_table
+            message_table = message_model._meta.db_table
+            last_pk = 0
+            while True:
+                ids = list(conversations.filter(pk__gt=last_pk).order_by('pk')
+                           .values_list('pk', flat=True)[:batch_size])
+                if not ids:
+                    break
+                last_pk = ids[-1]
+                if dry_run:
+                    counts['conversations'] += len(ids)
+                    counts['messages'] += message_model.objects.filter(conversation_id__in=ids).count()
+                    continue
+
+                with transaction.atomic():
+                    # Lock the batch and re-check it: a visitor may have come
+                    # back since it was selected
+                    ids = list(conversations.filter(pk__in=ids).select_for_update()
+                               .values_list('pk', flat=True))
+                    if archive and ids:
+                        _archive(archive, label, list(conversations.model.objects.filter(pk__in=ids).values()),
+                                 message_model)
+                    messages = message_model.objects.filter(conversation_id__in=ids).delete()[0]
+                    purged = conversations.model.objects.filter(pk__in=ids).delete()[1].get(
+                        conversations.model._meta.label, 0
+                    )
+                counts['conversations'] += purged
+                counts['messages'] += messages
+                counts['batches'] += 1
+                RETENTION_PURGED.labels(table=conversation_table).inc(purged)
+                RETENTION_PURGED.labels(table=message_table).inc(messages)
+                if sleep:
+                    time.sleep(sleep)
+    finally:
+        if archive:
+            archive.close()
+
+    report['seconds'] = round(time.perf_counter() - started, 3)
+    logger.info(f"Purged abandoned conversations older than {days} days: {report}")
+    return report
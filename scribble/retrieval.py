@@ -0,0 +1,114 @@
+"""
+Cached knowledge base retrieval.
+
+Both chat paths embed the user's message and search FAISS for it. Results
+are cached by (normalized query, k, index generation) as docstore ids and
+scores in the ``retrieval`` cache, which is shared by all workers (Redis
+when REDIS_URL is set, otherwise files on local disk). The index generation
+changes whenever the index or its tombstones are rewritten, so entries for
+an old index simply stop matching and age out; nothing has to be flushed.
+"""
+import hashlib
+import logging
+import os
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.base import InvalidCacheBackendError
+
+from . import vector_index
+from .fingerprints import normalize_text
+from .metrics import RETRIEVAL_CACHE_REQUESTS, RETRIEVAL_CACHE_SAVED_SECONDS
+from .timing import stage
+
+logger = logging.getLogger(__name__)
+
+CACHE_ALIAS = 'retrieval'
+
+
+def _cache():
+    try:
+        return caches[CACHE_ALIAS]
+    except InvalidCacheBackendError:
+        return caches['default']
+
+
+def index_generation(store_path):
+    """Identifies the saved index and its deletions; changes on every rewrite"""
+    parts = []
+    for name in ('index.faiss', vector_index.TOMBSTONE_FILE):
+        try:
+            parts.append(str(os.stat(os.path.join(store_path, name)).st_mtime_ns))
+        except OSError:
+            parts.append('0')
+    return '-'.join(parts)
+
+
+def cache_key(query, k, generation):
+    digest = hashlib.sha256(f'{generation}:{k}:{normalize_text(query)}'.encode('utf-8')).hexdigest()
+    return f'retrieval:{digest}'
+
+
+def _resolve(vectorstore, hits):
+    """Documents for cached (docstore id, score) pairs, or None if any is gone"""
+    results = []
+    for docstore_id, score in hits:
+        document = vectorstore.docstore.search(docstore_id)
+        if isinstance(document, str):
+            # InMemoryDocstore returns an error message for unknown ids
+            return None
+        results.append((document, score))
+    return results
+
+
+def search(vectorstore, query, k, store_path, embeddings=None):
+    """
+    Return the ``k`` chunks most similar to ``query`` as (document, score)
+    pairs, excluding deleted documents.
+
+    Args:
+        vectorstore: Loaded FAISS store saved at ``store_path``
+        query: The user's message
+        k: Number of chunks
+        store_path: Where ``vectorstore`` is saved; its files identify the
+            index generation
+        embeddings: Embeddings for the query; defaults to the store's own
+    """
+    cache = _cache()
+    timeout = getattr(settings, 'RETRIEVAL_CACHE_TTL', 3600)
+    key = cache_key(query, k, index_generation(store_path))
+
+    started = time.perf_counter()
+    with stage('retrieval_cache'):
+        try:
+            cached = cache.get(key) if timeout else None
+        except Exception as e:
+            logger.warning(f"Retrieval cache unavailable: {str(e)}")
+            cached = None
+        results = _resolve(vectorstore, cached['hits']) if cached else None
+    if results is not None:
+        RETRIEVAL_CACHE_REQUESTS.labels(result='hit').inc()
+        RETRIEVAL_CACHE_SAVED_SECONDS.inc(max(cached['seconds'] - (time.perf_counter() - started), 0))
+        return results
+    RETRIEVAL_CACHE_REQUESTS.labels(result='miss').inc()
+
+    started = time.perf_counter()
+    with stage('embed'):
+        query_embedding = (embeddings or vectorstore.embeddings).embed_query(query)
+    with stage('search'):
+        results = vectorstore.similarity_search_with_score_by_vector(
+            query_embedding, k=k, filter=vector_index.search_filter(store_path)
+        )
+    elapsed = time.perf_counter() - started
+
+    # Stores written by older LangChain versions don't set Document.id
+    if timeout and all(document.id for document, _ in results):
+        try:
+            cache.set(key, {
+                'hits': [(document.id, float(score)) for document, score in results],
+                'seconds': elapsed,
+            }, timeout)
+        except Exception as e:
+            logger.warning(f"Retrieval cache unavailable: {str(e)}")
+    return results
@@ -0,0 +1,184 @@
+"""
+Full-text search over message content.
+
+On PostgreSQL messages carry a generated ``search_vector`` tsvector column
+with a GIN index. On SQLite an external-content FTS5 table mirrors the
+message table through triggers. Both are maintained by the database itself,
+so every insert, update and delete (including bulk writes) stays in sync.
+Other backends fall back to ``icontains``.
+"""
+import logging
+
+from django.db import connection
+from django.db.models import BooleanField, FloatField, TextField, prefetch_related_objects
+from django.db.models.expressions import RawSQL
+
+from .models import Message
+
+logger = logging.getLogger(__name__)
+
+MESSAGE_TABLE = 'scribble_message'
+FTS_TABLE = 'scribble_message_fts'
+SEARCH_CONFIG = 'english'
+HIGHLIGHT_START = '<mark>'
+HIGHLIGHT_STOP = '</mark>'
+
+POSTGRES_INDEX_SQL = [
+    f"""ALTER TABLE {MESSAGE_TABLE} ADD COLUMN IF NOT EXISTS search_vector tsvector
+        GENERATED ALWAYS AS (to_tsvector('{SEARCH_CONFIG}', coalesce(content, ''))) STORED""",
+    f"CREATE INDEX IF NOT EXISTS scribble_message_search_idx ON {MESSAGE_TABLE} USING GIN (search_vector)",
+]
+
+POSTGRES_DROP_SQL = [
+    "DROP INDEX IF EXISTS scribble_message_search_idx",
+    f"ALTER TABLE {MESSAGE_TABLE} DROP COLUMN IF EXISTS search_vector",
+]
+
+SQLITE_TABLE_SQL = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+    f"content, content='{MESSAGE_TABLE}', content_rowid='id', tokenize='porter unicode61')"
+)
+
+# Trigger name -> SQL. Rebuilding a table on SQLite (as Django does for most
+# ALTERs) drops its triggers, so ensure_index() re-creates any that are missing.
+SQLITE_TRIGGERS = {
+    f'{FTS_TABLE}_ai': f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON {MESSAGE_TABLE} BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, content) VALUES (new.id, new.content);
+    END""",
+    f'{FTS_TABLE}_ad': f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON {MESSAGE_TABLE} BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, content) VALUES ('delete', old.id, old.content);
+    END""",
+    f'{FTS_TABLE}_au': f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF content ON {MESSAGE_TABLE} BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, content) VALUES ('delete', old.id, old.content);
+        INSERT INTO {FTS_TABLE}(rowid, content) VALUES (new.id, new.content);
+    END""",
+}
+
+
+def _sqlite_has_fts(cursor):
+    cursor.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'trigger') AND name LIKE %s",
+                   [f'{FTS_TABLE}%'])
+    return {row[0] for row in cursor.fetchall()}
+
+
+def ensure_index(using_connection=None, repair_only=False):
+    """
+    Create the full-text index for the current backend if it is missing.
+
+    Safe to call repeatedly; on SQLite it also restores triggers dropped by
+    table rebuilds and re-indexes existing rows when it had to. With
+    ``repair_only`` nothing is created unless the index already exists.
+    """
+    conn = using_connection or connection
+    with conn.cursor() as cursor:
+        if conn.vendor == 'postgresql' and not repair_only:
+            for sql in POSTGRES_INDEX_SQL:
+                cursor.execute(sql)
+        elif conn.vendor == 'sqlite':
+            existing = _sqlite_has_fts(cursor)
+            missing = [name for name in SQLITE_TRIGGERS if name not in existing]
+            if FTS_TABLE in existing and not missing:
+                return
+            if FTS_TABLE not in existing and repair_only:
+                return
+            cursor.execute(SQLITE_TABLE_SQL)
+            for name in missing:
+                cursor.execute(SQLITE_TRIGGERS[name])
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+            logger.info("Rebuilt SQLite message search index")
+
+
+def drop_index(using_connection=None):
+    conn = using_connection or connection
+    with conn.cursor() as cursor:
+        if conn.vendor == 'postgresql':
+            for sql in POSTGRES_DROP_SQL:
+                cursor.execute(sql)
+        elif conn.vendor == 'sqlite':
+            for name in SQLITE_TRIGGERS:
+                cursor.execute(f"DROP TRIGGER IF EXISTS {name}")
+            cursor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+
+def _fts5_query(query):
+    """Quote each term so user input can't break FTS5 query syntax"""
+    terms = [term.replace('"', '""') for term in query.split()]
+    return ' '.join(f'"{term}"' for term in terms if term)
+
+
+def matching_messages(query):
+    """
+    Return a Message queryset restricted to full-text matches for ``query``.
+
+    It is unordered and unannotated so it can be used for ``id__in`` and
+    ``conversation_id__in`` filters as well as listings.
+    """
+    if connection.vendor == 'postgresql':
+        return Message.objects.filter(
+            RawSQL(f"search_vector @@ websearch_to_tsquery('{SEARCH_CONFIG}', %s)",
+                   [query], output_field=BooleanField())
+        )
+
+    if connection.vendor == 'sqlite':
+        fts_query = _fts5_query(query)
+        if not fts_query:
+            # MATCH '' is an FTS5 syntax error
+            return Message.objects.none()
+        return Message.objects.filter(
+            id__in=RawSQL(f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", [fts_query])
+        )
+
+    return Message.objects.filter(content__icontains=query)
+
+
+def search_messages(query, page=1, page_size=20):
+    """
+    Ranked, highlighted, paginated message search.
+
+    Returns:
+        tuple: (messages, has_next). Each message has ``rank`` (higher is
+        better) and ``highlight`` attributes; the highlight wraps matched
+        terms in <mark> tags.
+    """
+    page = max(int(page), 1)
+    offset = (page - 1) * page_size
+    # Fetch one extra row to know whether there is a next page without a COUNT(*)
+    limit = page_size + 1
+
+    if connection.vendor == 'postgresql':
+        tsquery = f"websearch_to_tsquery('{SEARCH_CONFIG}', %s)"
+        queryset = matching_messages(query).select_related('conversation__user').annotate(
+            rank=RawSQL(f"ts_rank(search_vector, {tsquery})", [query], output_field=FloatField()),
+            highlight=RawSQL(
+                f"ts_headline('{SEARCH_CONFIG}', content, {tsquery}, "
+                f"'StartSel={HIGHLIGHT_START}, StopSel={HIGHLIGHT_STOP}, MaxFragments=2')",
+                [query], output_field=TextField()
+            ),
+        )
+        results = list(queryset.order_by('-rank', '-created_at')[offset:offset + limit])
+
+    elif connection.vendor == 'sqlite':
+        fts_query = _fts5_query(query)
+        if not fts_query:
+            return [], False
+        # FTS5 ranks with bm25() (lower is better); negate it to match Postgres
+        results = list(Message.objects.raw(
+            f"""SELECT m.*, -bm25({FTS_TABLE}) AS rank,
+                       snippet({FTS_TABLE}, 0, %s, %s, '...', 24) AS highlight
+                FROM {FTS_TABLE} JOIN {MESSAGE_TABLE} m ON m.id = {FTS_TABLE}.rowid
+                WHERE {FTS_TABLE} MATCH %s
+                ORDER BY bm25({FTS_TABLE}), m.created_at DESC
+                LIMIT %s OFFSET %s""",
+            [HIGHLIGHT_START, HIGHLIGHT_STOP, fts_query, limit, offset]
+        ))
+        prefetch_related_objects(results, 'conversation__user')
+
+    else:
+        queryset = matching_messages(query).select_related('conversation__user')
+        results = list(queryset.order_by('-created_at')[offset:offset + limit])
+        for message in results:
+            message.rank = 0.0
+            message.highlight = message.content[:200]
+
+    has_next = len(results) > page_size
+    return results[:page_size], has_next
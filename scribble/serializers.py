@@ -1,6 +1,8 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
-from .models import Conversation, Message, Document, AdminSettings, MemoirFormSubmission
+from django.db.models import QuerySet
+from .models import ArchivedConversation, Conversation, Message, Document, AdminSettings, MemoirFormSubmission
+from . import read_state
 
 User = get_user_model()
 
@@ -21,11 +23,23 @@ class MessageCreateSerializer(serializers.ModelSerializer):
 
 class MessageSerializer(serializers.ModelSerializer):
     sender_name = serializers.SerializerMethodField()
+    is_read = serializers.SerializerMethodField()
     
     class Meta:
         model = Message
         fields = ['id', 'conversation', 'content', 'sender', 'sender_name', 'created_at', 'is_read']
-        read_only_fields = ['created_at', 'is_read']
+        read_only_fields = ['created_at']
+    
+    def get_is_read(self, obj):
+        # Judged by the other side's read watermark, loaded once for a whole list
+        if obj.conversation_id not in getattr(self, '_watermark_conversations', ()):
+            messages = getattr(self.parent, 'instance', None)
+            if not isinstance(messages, (list, tuple, QuerySet)):
+                messages = [obj]
+            conversation_ids = {message.conversation_id for message in messages} | {obj.conversation_id}
+            self._watermarks = read_state.watermarks(conversation_ids)
+            self._watermark_conversations = conversation_ids
+        return obj.pk <= self._watermarks.get((obj.conversation_id, read_state.reader_of(obj.sender)), 0)
     
     def get_sender_name(self, obj):
         if obj.sender == 'user':
@@ -34,28 +48,36 @@ class MessageSerializer(serializers.ModelSerializer):
             return 'Unknown User'
         return obj.sender.upper()
 
+class MessageSearchResultSerializer(MessageSerializer):
+    highlight = serializers.CharField(read_only=True)
+    rank = serializers.FloatField(read_only=True)
+    
+    class Meta(MessageSerializer.Meta):
+        fields = MessageSerializer.Meta.fields + ['highlight', 'rank']
+
+def summary_last_message(conversation):
+    """The last message of a conversation from its summary columns"""
+    if conversation.last_message_id is None:
+        return None
+    content = conversation.last_message_preview
+    return {
+        'content': content[:100] + ('...' if len(content) > 100 else ''),
+        'sender': conversation.last_message_sender,
+        'created_at': conversation.last_message_at
+    }
+
 class ConversationSerializer(serializers.ModelSerializer):
     user_email = serializers.EmailField(source='user.email', read_only=True)
     last_message = serializers.SerializerMethodField()
-    unread_count = serializers.SerializerMethodField()
     
     class Meta:
         model = Conversation
-        fields = ['id', 'user', 'user_email', 'created_at', 'updated_at', 'is_active', 'ai_enabled', 'last_message', 'unread_count']
-        read_only_fields = ['created_at', 'updated_at']
+        fields = ['id', 'user', 'user_email', 'created_at', 'updated_at', 'is_active', 'ai_enabled', 'last_message',
+                  'message_count', 'unread_count']
+        read_only_fields = ['created_at', 'updated_at', 'message_count', 'unread_count']
     
     def get_last_message(self, obj):
-        last_message = obj.messages.order_by('-created_at').first()
-        if last_message:
-            return {
-                'content': last_message.content[:100] + ('...' if len(last_message.content) > 100 else ''),
-                'sender': last_message.sender,
-                'created_at': last_message.created_at
-            }
-        return None
-    
-    def get_unread_count(self, obj):
-        return obj.messages.filter(is_read=False, sender='user').count()
+        return summary_last_message(obj)
 
 class ConversationListSerializer(serializers.ModelSerializer):
     user = UserSerializer(read_only=True)
@@ -68,17 +90,16 @@ class ConversationListSerializer(serializers.ModelSerializer):
         read_only_fields = ['created_at', 'updated_at']
 
     def get_last_message(self, obj):
-        last_message = obj.messages.last()
-        if last_message:
-            return {
-                'content': last_message.content[:100] + '...' if len(last_message.content) > 100 else last_message.content,
-                'sender': last_message.sender,
-                'created_at': last_message.created_at
-            }
-        return None
+        return summary_last_message(obj)
 
     def get_unread_count(self, obj):
-        return obj.messages.filter(is_read=False).exclude(sender='user').count()
+        return read_state.unread_count(obj, read_state.USER)
+
+class ArchivedConversationSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ArchivedConversation
+        fields = ['source', 'conversation_id', 'owner', 'status', 'message_count', 'conversation_created_at',
+                  'conversation_updated_at', 'archived_at']
 
 class ConversationDetailSerializer(serializers.ModelSerializer):
     messages = MessageSerializer(many=True, read_only=True)
@@ -1,6 +1,9 @@
+from django.db import connections
 from django.db.models.signals import post_save
 from django.dispatch import receiver
-from .models import User, AdminSettings
+from .models import User, AdminSettings, Conversation, Message
+from . import search, stats, summaries
+from .persistence import turn_persisted
 
 @receiver(post_save, sender=User)
 def create_user_settings(sender, instance, created, **kwargs):
@@ -14,3 +17,36 @@ def create_user_settings(sender, instance, created, **kwargs):
                 'response_timeout': 30,
             }
         )
+
+@receiver(post_save, sender=User)
+def count_new_user(sender, instance, created, raw=False, **kwargs):
+    """Bump the daily new user counter"""
+    if created and not raw:
+        stats.record_user(instance)
+
+@receiver(post_save, sender=Conversation)
+def count_new_conversation(sender, instance, created, raw=False, **kwargs):
+    """Bump the daily conversation counter"""
+    if created and not raw:
+        stats.record_conversation(instance)
+
+@receiver(post_save, sender=Message)
+def count_new_message(sender, instance, created, raw=False, **kwargs):
+    """Bump the daily message counters"""
+    if created and not raw:
+        stats.record_messages([instance])
+
+@receiver(turn_persisted, sender=Message)
+def count_turn_messages(sender, messages, **kwargs):
+    """Bump the daily message counters for a bulk-saved chat turn"""
+    stats.record_messages(messages)
+
+@receiver(post_save, sender=Message)
+def summarize_new_message(sender, instance, created, raw=False, **kwargs):
+    """Fold a new message into its conversation's summary columns"""
+    if created and not raw:
+        summaries.record_messages(instance.conversation_id, [instance])
+
+def repair_search_index(sender, using='default', **kwargs):
+    """Restore SQLite search triggers dropped when a migration rebuilt the message table"""
+    search.ensure_index(connections[using], repair_only=True)
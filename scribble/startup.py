@@ -0,0 +1,294 @@
+"""
+Container startup and worker warm-up.
+
+``docker_start.py`` calls ``prepare()`` once per container, before gunicorn:
+
+- waits for the database by connecting with exponential backoff, rather
+  than sleeping a fixed time;
+- runs ``migrate`` only when the django_migrations table is missing
+  migrations that exist on disk;
+- runs ``collectstatic`` only when the content fingerprint of the source
+  static files differs from the one saved in STATIC_ROOT by the last run.
+
+Each gunicorn worker then calls ``warm_up()`` from ``post_worker_init``,
+before it accepts requests. That loads the embedding model (and runs one
+query through it), the FAISS index and the LLM client, retrying with
+exponential backoff if a step fails. ``readiness()`` backs the
+``/api/health/ready/`` endpoint: it returns 503 until the worker is warm, so
+the platform health check only sends traffic to a deploy that has finished
+loading. A worker whose warm-up failed every attempt starts over on a
+readiness probe once STARTUP_WARMUP_RETRY_AFTER seconds have passed.
+"""
+import hashlib
+import logging
+import os
+import threading
+import time
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+STATIC_FINGERPRINT_FILE = '.collectstatic-fingerprint'
+
+COLD, WARMING, WARM, FAILED = 'cold', 'warming', 'warm', 'failed'
+# Backoff between warm-up attempts, in seconds
+WARMUP_INITIAL_DELAY = 1.0
+WARMUP_MAX_DELAY = 30.0
+
+_state_lock = threading.Lock()
+_state = {'state': COLD, 'components': {}, 'seconds': None, 'error': None, 'failed_at': None}
+_thread = None
+
+
+def wait_for_database(timeout=60, initial_delay=0.2, max_delay=5.0, alias='default'):
+    """
+    Connect to the database, retrying with exponential backoff.
+
+    Returns:
+        int: Connection attempts it took
+
+    Raises:
+        OperationalError: The database was still unreachable after ``timeout`` seconds
+    """
+    from django.db import OperationalError, connections
+
+    connection = connections[alias]
+    deadline = time.monotonic() + timeout
+    delay = initial_delay
+    attempt = 0
+    while True:
+        attempt += 1
+        try:
+            connection.ensure_connection()
+            return attempt
+        except OperationalError as e:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise
+            logger.info(f"Database not ready (attempt {attempt}): {str(e).strip()}; retrying in {delay:.1f}s")
+            time.sleep(min(delay, remaining))
+            delay = min(delay * 2, max_delay)
+
+
+def pending_migrations(alias='default'):
+    """Migrations on disk that the database hasn't applied, in apply order"""
+    from django.db import connections
+    from django.db.migrations.executor import MigrationExecutor
+
+    executor = MigrationExecutor(connections[alias])
+    plan = executor.migration_plan(executor.loader.graph.leaf_nodes())
+    return [f'{migration.app_label}.{migration.name}' for migration, _ in plan]
+
+
+def static_fingerprint():
+    """Hash of every file collectstatic would copy, by path and content"""
+    from django.contrib.staticfiles.finders import get_finders
+
+    from .fingerprints import file_sha256
+
+    files = {}
+    for finder in get_finders():
+        for path, storage in finder.list(['CVS', '.*', '*~']):
+            # First finder wins, as in collectstatic
+            files.setdefault(path, storage.path(path))
+
+    digest = hashlib.sha256(settings.STATIC_ROOT.encode('utf-8'))
+    for path in sorted(files):
+        digest.update(f'{path}\0{file_sha256(files[path])}\n'.encode('utf-8'))
+    return digest.hexdigest()
+
+
+def _static_fingerprint_path():
+    return os.path.join(settings.STATIC_ROOT, STATIC_FINGERPRINT_FILE)
+
+
+def collectstatic_if_changed():
+    """
+    Run collectstatic unless the static sources are unchanged since the last run.
+
+    Returns:
+        bool: Whether collectstatic ran
+    """
+    from django.core.management import call_command
+
+    fingerprint = static_fingerprint()
+    try:
+        with open(_static_fingerprint_path()) as f:
+            if f.read().strip() == fingerprint:
+                return False
+    except OSError:
+        pass
+
+    call_command('collectstatic', interactive=False, verbosity=0)
+    os.makedirs(settings.STATIC_ROOT, exist_ok=True)
+    with open(_static_fingerprint_path(), 'w') as f:
+        f.write(fingerprint)
+    return True
+
+
+def prepare(migrate=True, collectstatic=True, db_timeout=None):
+    """
+    Get the container ready to serve: database reachable, schema current,
+    static files collected.
+
+    Returns:
+        dict: What was done and how long each step took
+    """
+    from django.core.management import call_command
+
+    report = {}
+    started = time.perf_counter()
+
+    step = time.perf_counter()
+    if db_timeout is None:
+        db_timeout = getattr(settings, 'STARTUP_DB_TIMEOUT', 60)
+    report['database_attempts'] = wait_for_database(timeout=db_timeout)
+    report['database_seconds'] = round(time.perf_counter() - step, 3)
+
+    if migrate:
+        step = time.perf_counter()
+        pending = pending_migrations()
+        if pending:
+            logger.info(f"Applying {len(pending)} migrations: {', '.join(pending)}")
+            call_command('migrate', interactive=False, verbosity=1)
+        report['migrations_applied'] = len(pending)
+        report['migrate_seconds'] = round(time.perf_counter() - step, 3)
+
+    if collectstatic:
+        step = time.perf_counter()
+        report['collectstatic'] = 'collected' if collectstatic_if_changed() else 'unchanged'
+        report['collectstatic_seconds'] = round(time.perf_counter() - step, 3)
+
+    report['seconds'] = round(time.perf_counter() - started, 3)
+    return report
+
+
+def status():
+    """Warm-up state of this process"""
+    with _state_lock:
+        return dict(_state, components=dict(_state['components']))
+
+
+def _set_state(**values):
+    with _state_lock:
+        _state.update(values)
+
+
+def _warm_once(components):
+    from . import views
+
+    step = time.perf_counter()
+    # One query runs the model's lazy initialisation too
+    views.get_embeddings().embed_query('warm up')
+    components['embeddings'] = {'seconds': round(time.perf_counter() - step, 3)}
+
+    step = time.perf_counter()
+    store = views.get_vector_store()
+    components['vectorstore'] = {
+        'seconds': round(time.perf_counter() - step, 3),
+        'vectors': store.index.ntotal,
+    }
+
+    step = time.perf_counter()
+    # The OpenAI SDK is slow to import; keep that off the first chat
+    from . import llm_utils  # noqa: F401
+    components['llm_client'] = {'seconds': round(time.perf_counter() - step, 3)}
+
+
+def _warm():
+    """Warm up, retrying with exponential backoff up to STARTUP_WARMUP_ATTEMPTS times"""
+    attempts = max(getattr(settings, 'STARTUP_WARMUP_ATTEMPTS', 5), 1)
+    started = time.perf_counter()
+    delay = WARMUP_INITIAL_DELAY
+    for attempt in range(1, attempts + 1):
+        components = {}
+        try:
+            _warm_once(components)
+            break
+        except Exception as e:
+            if attempt == attempts:
+                logger.exception(f"Warm-up failed after {attempt} attempts")
+                _set_state(state=FAILED, components=components, error=str(e), failed_at=time.monotonic(),
+                           seconds=round(time.perf_counter() - started, 3))
+                return
+            # Still warming; readiness shows the last error meanwhile
+            logger.warning(f"Warm-up attempt {attempt} failed: {e}; retrying in {delay:.1f}s")
+            _set_state(components=components, error=str(e))
+            time.sleep(delay)
+            delay = min(delay * 2, WARMUP_MAX_DELAY)
+    seconds = round(time.perf_counter() - started, 3)
+    _set_state(state=WARM, components=components, error=None, seconds=seconds)
+    logger.info(f"Warm in {seconds}s: {components}")
+
+
+def start_warm_up():
+    """
+    Start warming up in a background thread unless already warming or warm.
+
+    Returns:
+        threading.Thread or None: The warm-up thread, if one was started
+    """
+    global _thread
+    with _state_lock:
+        if _state['state'] in (WARMING, WARM):
+            return None
+        _state.update(state=WARMING, error=None)
+        _thread = threading.Thread(target=_warm, name='warm-up', daemon=True)
+        _thread.start()
+        return _thread
+
+
+def warm_up(heartbeat=None, interval=1.0):
+    """
+    Load the embedding model and FAISS index, blocking until done (or until
+    a warm-up already in progress is done).
+
+    Args:
+        heartbeat: Called every ``interval`` seconds while loading, so a
+            gunicorn worker can tell the arbiter it is alive (``worker.notify``)
+            and isn't killed for exceeding the worker timeout
+
+    Returns:
+        dict: The resulting status()
+    """
+    thread = start_warm_up() or _thread
+    while thread is not None and thread.is_alive():
+        thread.join(interval)
+        if heartbeat:
+            heartbeat()
+    return status()
+
+
+def readiness():
+    """
+    Whether this process should receive traffic.
+
+    Returns:
+        tuple: (ready, details). Ready means the database answers and, unless
+        STARTUP_WARMUP is off, the model and index are loaded.
+    """
+    from django.db import DatabaseError, connection
+
+    details = status()
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        details['database'] = 'ok'
+    except DatabaseError as e:
+        details['database'] = str(e).strip()
+
+    warmup_required = getattr(settings, 'STARTUP_WARMUP', True)
+    if warmup_required and details['state'] == COLD:
+        # Not started by gunicorn (runserver, other servers): warm up now
+        start_warm_up()
+        details['state'] = WARMING
+    elif warmup_required and details['state'] == FAILED and (
+        time.monotonic() - (details['failed_at'] or 0) >= getattr(settings, 'STARTUP_WARMUP_RETRY_AFTER', 60)
+    ):
+        # Give a worker whose warm-up failed another go rather than
+        # leaving it unready until it restarts
+        start_warm_up()
+        details['state'] = WARMING
+    ready = details['database'] == 'ok' and (details['state'] == WARM or not warmup_required)
+    return ready, details
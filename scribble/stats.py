@@ -0,0 +1,135 @@
+"""
+Precomputed dashboard statistics.
+
+Counters are kept in one DailyStats row per day. Signals bump the row for the
+day an object was created, the reconcile_stats command recomputes rows from
+the source tables, and the dashboards read the rollups instead of running a
+COUNT(*) over every table on each load.
+"""
+import logging
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import Conversation, DailyStats, Message
+
+logger = logging.getLogger(__name__)
+
+COUNTER_FIELDS = [
+    'conversations', 'messages', 'user_messages',
+    'ai_messages', 'admin_messages', 'new_users',
+]
+
+# Message.sender value -> per-sender counter column
+SENDER_FIELDS = {
+    'user': 'user_messages',
+    'ai': 'ai_messages',
+    'admin': 'admin_messages',
+}
+
+
+def _local_date(value):
+    return timezone.localdate(value) if value else timezone.localdate()
+
+
+def increment(day, **deltas):
+    """Atomically add the given deltas to the rollup row for ``day``"""
+    updates = {field: F(field) + delta for field, delta in deltas.items() if delta}
+    if not updates:
+        return
+    if not DailyStats.objects.filter(date=day).update(**updates):
+        DailyStats.objects.get_or_create(date=day)
+        DailyStats.objects.filter(date=day).update(**updates)
+
+
+def record_conversation(conversation):
+    increment(_local_date(conversation.created_at), conversations=1)
+
+
+def record_messages(messages):
+    """Count a batch of newly created messages in as few UPDATEs as possible"""
+    per_day = {}
+    for message in messages:
+        deltas = per_day.setdefault(_local_date(message.created_at), {})
+        deltas['messages'] = deltas.get('messages', 0) + 1
+        sender_field = SENDER_FIELDS.get(message.sender)
+        if sender_field:
+            deltas[sender_field] = deltas.get(sender_field, 0) + 1
+    for day, deltas in per_day.items():
+        increment(day, **deltas)
+
+
+def record_user(user):
+    increment(_local_date(user.date_joined), new_users=1)
+
+
+def reconcile(days=None):
+    """
+    Recompute rollup rows from the source tables.
+
+    Args:
+        days: Only rebuild the most recent N days. Rebuilds everything when None.
+
+    Returns:
+        int: Number of DailyStats rows written
+    """
+    User = get_user_model()
+    since = timezone.localdate() - timedelta(days=days - 1) if days else None
+
+    def grouped(queryset, field, **aggregates):
+        if since:
+            queryset = queryset.filter(**{f'{field}__gte': since})
+        return queryset.annotate(day=TruncDate(field)).values('day').annotate(**aggregates)
+
+    rows = {}
+
+    def merge(results):
+        for result in results:
+            row = rows.setdefault(result.pop('day'), dict.fromkeys(COUNTER_FIELDS, 0))
+            row.update(result)
+
+    merge(grouped(Conversation.objects.order_by(), 'created_at', conversations=Count('id')))
+    merge(grouped(
+        Message.objects.order_by(), 'created_at',
+        messages=Count('id'),
+        user_messages=Count('id', filter=Q(sender='user')),
+        ai_messages=Count('id', filter=Q(sender='ai')),
+        admin_messages=Count('id', filter=Q(sender='admin')),
+    ))
+    merge(grouped(User.objects.order_by(), 'date_joined', new_users=Count('id')))
+
+    stale = DailyStats.objects.all()
+    if since:
+        stale = stale.filter(date__gte=since)
+    stale.exclude(date__in=list(rows)).delete()
+
+    for day, counters in rows.items():
+        DailyStats.objects.update_or_create(date=day, defaults=counters)
+
+    logger.info(f"Reconciled {len(rows)} daily stats rows")
+    return len(rows)
+
+
+def get_dashboard_stats():
+    """
+    Return dashboard counters from the rollup table.
+
+    Totals are a single SUM over the (small) per-day table and today's
+    figures come from one row lookup, so the cost doesn't grow with the
+    number of messages.
+    """
+    totals = DailyStats.objects.aggregate(**{field: Sum(field) for field in COUNTER_FIELDS})
+    totals = {field: value or 0 for field, value in totals.items()}
+    today = DailyStats.objects.filter(date=timezone.localdate()).values(*COUNTER_FIELDS).first()
+    today = today or dict.fromkeys(COUNTER_FIELDS, 0)
+
+    ai_response_rate = (totals['ai_messages'] / totals['messages']) * 100 if totals['messages'] > 0 else 0
+
+    return {
+        'totals': totals,
+        'today': today,
+        'ai_response_rate': round(ai_response_rate, 1),
+    }
@@ -0,0 +1,181 @@
+"""
+Denormalized conversation summaries.
+
+The admin lists show each conversation's last message, its sender, the
+number of messages and how many the admins haven't read. Those are columns
+on Conversation, updated in the same transaction as the message writes:
+
+- a new message adds to the counts and becomes the last message, with one
+  UPDATE of the conversation (``persist_turn()`` folds this into the UPDATE
+  it already makes for the turn);
+- editing the last message updates its preview;
+- deleting a message, or an admin marking messages read, recomputes the
+  conversation's row from the messages table.
+
+Bulk changes that bypass the model (``QuerySet.update()`` or ``delete()`` on
+messages) don't maintain the columns. ``reconcile()`` (the
+reconcile_conversation_summaries command) finds and repairs rows that drifted,
+and backfills existing data.
+"""
+import logging
+
+from django.db import models
+from django.db.models.functions import Coalesce, Substr
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+PREVIEW_LENGTH = 200
+SUMMARY_FIELDS = [
+    'message_count', 'unread_count', 'last_message_id', 'last_message_preview',
+    'last_message_sender', 'last_message_at',
+]
+
+
+def preview(content):
+    return (content or '')[:PREVIEW_LENGTH]
+
+
+def _models():
+    from .models import Conversation, Message, ReadWatermark
+    return Conversation, Message, ReadWatermark
+
+
+def summary_expressions(message_model, watermark_model):
+    """
+    Expressions computing each summary column from the messages of the outer
+    conversation, for ``update()`` or ``annotate()``. Takes the models so the
+    migration can use its historical ones.
+    """
+    messages = message_model.objects.filter(conversation=models.OuterRef('pk')).order_by()
+    last = messages.order_by('-id')
+    admin_read = watermark_model.objects.filter(
+        conversation=models.OuterRef('conversation'), role='admin',
+    ).values('last_read_message_id')[:1]
+    unread = messages.filter(
+        sender='user', id__gt=Coalesce(models.Subquery(admin_read), 0, output_field=models.BigIntegerField()),
+    )
+
+    def count(queryset):
+        return Coalesce(models.Subquery(
+            queryset.values('conversation').annotate(total=models.Count('id')).values('total')
+        ), 0)
+
+    return {
+        'message_count': count(messages),
+        'unread_count': count(unread),
+        'last_message_id': models.Subquery(last.values('id')[:1]),
+        'last_message_preview': Coalesce(models.Subquery(
+            last.annotate(preview=Substr('content', 1, PREVIEW_LENGTH)).values('preview')[:1]
+        ), models.Value('')),
+        'last_message_sender': Coalesce(models.Subquery(last.values('sender')[:1]), models.Value('')),
+        'last_message_at': models.Subquery(last.values('created_at')[:1]),
+    }
+
+
+def message_updates(messages):
+    """
+    UPDATE arguments folding newly created messages into their conversation's
+    summary, for callers that already update the conversation row.
+    """
+    Conversation, _, _ = _models()
+    newest = max(messages, key=lambda message: message.pk)
+    is_newer = models.Q(last_message_id__isnull=True) | models.Q(last_message_id__lt=newest.pk)
+
+    def latest(field, value):
+        # Concurrent turns may commit out of order; keep the newest message
+        output_field = Conversation._meta.get_field(field)
+        return models.Case(models.When(is_newer, then=models.Value(value, output_field=output_field)),
+                           default=models.F(field), output_field=output_field)
+
+    return {
+        'message_count': models.F('message_count') + len(messages),
+        'unread_count': models.F('unread_count') + sum(message.sender == 'user' for message in messages),
+        'last_message_id': latest('last_message_id', newest.pk),
+        'last_message_preview': latest('last_message_preview', preview(newest.content)),
+        'last_message_sender': latest('last_message_sender', newest.sender),
+        'last_message_at': latest('last_message_at', newest.created_at),
+    }
+
+
+def record_messages(conversation_id, messages):
+    """
+    Fold newly created messages into their conversation's summary with one
+    UPDATE. Call inside the transaction that inserted them.
+    """
+    if not messages:
+        return
+    Conversation, _, _ = _models()
+    Conversation.objects.filter(pk=conversation_id).update(updated_at=timezone.now(), **message_updates(messages))
+
+
+def record_edit(message):
+    """Refresh the preview if ``message`` is its conversation's last message"""
+    Conversation, _, _ = _models()
+    Conversation.objects.filter(pk=message.conversation_id, last_message_id=message.pk).update(
+        last_message_preview=preview(message.content), last_message_sender=message.sender,
+    )
+
+
+def refresh(conversations, fields=None):
+    """
+    Recompute summary columns from the messages table.
+
+    Args:
+        conversations: Conversation queryset to update
+        fields: Columns to recompute (default all)
+
+    Returns:
+        int: Conversations updated
+    """
+    _, Message, ReadWatermark = _models()
+    expressions = summary_expressions(Message, ReadWatermark)
+    return conversations.update(**{field: expressions[field] for field in (fields or SUMMARY_FIELDS)})
+
+
+def stale(conversations):
+    """Conversations in ``conversations`` whose summary columns disagree with their messages"""
+    _, Message, ReadWatermark = _models()
+    expressions = summary_expressions(Message, ReadWatermark)
+    return conversations.annotate(
+        expected_message_count=expressions['message_count'],
+        expected_unread_count=expressions['unread_count'],
+        expected_last_message_id=Coalesce(expressions['last_message_id'], 0),
+        expected_last_message_preview=expressions['last_message_preview'],
+        current_last_message_id=Coalesce('last_message_id', 0),
+    ).filter(
+        ~models.Q(message_count=models.F('expected_message_count'))
+        | ~models.Q(unread_count=models.F('expected_unread_count'))
+        | ~models.Q(current_last_message_id=models.F('expected_last_message_id'))
+        | ~models.Q(last_message_preview=models.F('expected_last_message_preview'))
+    )
+
+
+def reconcile(repair=True, batch_size=1000):
+    """
+    Check every conversation's summary, walking the table in primary key
+    batches, and repair the ones that drifted.
+
+    Returns:
+        dict: Conversations checked, stale ids found (up to 100) and how many
+        were stale and repaired
+    """
+    Conversation, _, _ = _models()
+    report = {'checked': 0, 'stale': 0, 'repaired': 0, 'stale_ids': []}
+    last_pk = 0
+    while True:
+        ids = list(Conversation.objects.filter(pk__gt=last_pk).order_by('pk')
+                   .values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            break
+        last_pk = ids[-1]
+        report['checked'] += len(ids)
+        stale_ids = list(stale(Conversation.objects.filter(pk__in=ids)).values_list('pk', flat=True))
+        report['stale'] += len(stale_ids)
+        report['stale_ids'] += stale_ids[:100 - len(report['stale_ids'])]
+        if repair and stale_ids:
+            report['repaired'] += refresh(Conversation.objects.filter(pk__in=stale_ids))
+    if report['stale']:
+        logger.info(f"Conversation summaries: {report['stale']} of {report['checked']} stale, "
+                    f"{report['repaired']} repaired")
+    return report
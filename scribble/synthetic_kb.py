@@ -0,0 +1,129 @@
+"""
+Synthetic knowledge base and question set for RAG benchmarks.
+
+Generates business documents in the shape of the real knowledge base
+(services, pricing, process, FAQs) with deterministic content for a given
+seed, plus questions that hit, partly hit and miss that content.
+"""
+import random
+from pathlib import Path
+
+SERVICES = [
+    'memoir writing', 'family history book', 'biography', 'ghostwriting',
+    'legacy letters', 'corporate history', 'eulogy writing', 'life story interview',
+]
+
+TOPICS = ['pricing', 'process', 'timeline', 'interviews', 'editing', 'printing', 'privacy', 'payment']
+
+SENTENCES = {
+    'pricing': 'The {service} package starts at ${price} and includes {revisions} rounds of revisions.',
+    'process': 'For {service} projects I begin with a discovery call, then schedule {sessions} recorded sessions.',
+    'timeline': 'A typical {service} project takes {weeks} weeks from the first interview to the final draft.',
+    'interviews': 'Interviews for {service} clients can happen in person, by phone or over video.',
+    'editing': 'Every {service} manuscript goes through a developmental edit and a final proofread.',
+    'printing': 'Clients can order {copies} hardcover copies of their {service} book at a discounted rate.',
+    'privacy': 'Recordings and drafts for {service} work are kept confidential and deleted on request.',
+    'payment': 'Payment for {service} is split into {instalments} instalments across the project.',
+}
+
+QUESTION_TEMPLATES = [
+    'How much does the {service} package cost?',
+    'How long does a {service} project take?',
+    'What is your process for {service}?',
+    'Can I order printed copies of my {service} book?',
+    'How do interviews work for {service}?',
+    'Can you tell me more about {topic} for {service}? Please be detailed.',
+]
+
+# Questions the knowledge base doesn't answer, to exercise low-confidence paths
+OFF_TOPIC_QUESTIONS = [
+    'Do you offer website design?',
+    'What is the weather like today?',
+    'Can you translate my book into Japanese?',
+]
+
+
+def generate_knowledge_base(output_dir, documents=20, paragraphs=40, seed=42):
+    """
+    Write ``documents`` markdown files of ``paragraphs`` paragraphs each.
+
+    Returns:
+        list: Paths of the generated files
+    """
+    rng = random.Random(seed)
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    paths = []
+    for number in range(documents):
+        service = SERVICES[number % len(SERVICES)]
+        lines = [f'# {service.title()} guide {number + 1}', '']
+        for _ in range(paragraphs):
+            topic = rng.choice(TOPICS)
+            sentences = [
+                SENTENCES[rng.choice(TOPICS)].format(
+                    service=rng.choice(SERVICES) if rng.random() < 0.2 else service,
+                    price=rng.randrange(500, 9000, 250),
+                    revisions=rng.randint(1, 4),
+                    sessions=rng.randint(3, 12),
+                    weeks=rng.randint(6, 30),
+                    copies=rng.choice([5, 10, 25, 50]),
+                    instalments=rng.randint(2, 4),
+                )
+                for _ in range(rng.randint(3, 6))
+            ]
+            lines.extend([f'## {topic.title()}', ' '.join(sentences), ''])
+        path = output_dir / f'{service.replace(" ", "_")}_{number + 1:03d}.md'
+        path.write_text('\n'.join(lines), encoding='utf-8')
+        paths.append(path)
+    return paths
+
+
+def question_set(count=50, seed=42):
+    """Return ``count`` questions, roughly one in ten off topic"""
+    rng = random.Random(seed)
+    questions = []
+    for _ in range(count):
+        if rng.random() < 0.1:
+            questions.append(rng.choice(OFF_TOPIC_QUESTIONS))
+        else:
+            questions.append(rng.choice(QUESTION_TEMPLATES).format(
+                service=rng.choice(SERVICES), topic=rng.choice(TOPICS)
+            ))
+    return questions
+
+
+def generate_corpus(output_dir, total_mb, file_mb=64, seed=42):
+    """
+    Write a corpus of about ``total_mb`` megabytes as text files of up to
+    ``file_mb`` megabytes, for ingestion memory tests. Paragraphs are written
+    as they are generated, so generating a large corpus uses little memory.
+
+    Returns:
+        list: Paths of the generated files
+    """
+    rng = random.Random(seed)
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    remaining = int(total_mb * 1024 * 1024)
+
+    paths = []
+    while remaining > 0:
+        path = output_dir / f'corpus_{len(paths) + 1:04d}.txt'
+        file_remaining = min(remaining, int(file_mb * 1024 * 1024))
+        with open(path, 'w', encoding='utf-8') as f:
+            while file_remaining > 0:
+                service = rng.choice(SERVICES)
+                paragraph = ' '.join(
+                    SENTENCES[rng.choice(TOPICS)].format(
+                        service=service, price=rng.randrange(500, 9000, 250), revisions=rng.randint(1, 4),
+                        sessions=rng.randint(3, 12), weeks=rng.randint(6, 30),
+                        copies=rng.choice([5, 10, 25, 50]), instalments=rng.randint(2, 4),
+                    )
+                    for _ in range(rng.randint(3, 6))
+                ) + '\n\n'
+                f.write(paragraph)
+                file_remaining -= len(paragraph)
+        remaining -= path.stat().st_size
+        paths.append(path)
+    return paths
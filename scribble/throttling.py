@@ -0,0 +1,235 @@
+"""
+Per-client token-bucket throttling for the public chat endpoints.
+
+Every client has one bucket per scope (THROTTLE_RATES): ``llm`` for requests
+that call the model, ``history`` for cheap conversation and message reads.
+A bucket holds up to THROTTLE_BURSTS[scope] tokens and refills at the scope's
+rate. A request takes one token from each bucket of the client: the signed-in
+user or the ``user_id`` the client sent, the session (the anonymous id cookie,
+see anonymous.py) and the IP address (as DRF identifies it, honouring
+NUM_PROXIES). The IP bucket is THROTTLE_IP_MULTIPLIER times larger, since
+offices and mobile carriers put many people behind one address, but it still
+stops a script that invents a new user id for every request. If any bucket is empty the request is refused
+with 429 and Retry-After, and no bucket is charged.
+
+Buckets live in the THROTTLE_CACHE cache. With Redis (REDIS_URL) a Lua script
+refills and charges all of a request's buckets atomically in one round trip,
+using the Redis clock, so the limits hold across workers and hosts. Other
+cache backends are updated under a process lock; with the local-memory
+cache the limits then apply per worker process. Either way a check costs a
+constant amount of work, and a bucket's key expires once it has refilled.
+"""
+import logging
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.throttling import BaseThrottle
+
+from . import anonymous
+from .metrics import THROTTLE_DECISIONS
+
+logger = logging.getLogger(__name__)
+
+LLM, HISTORY = 'llm', 'history'
+KEY_PREFIX = 'throttle'
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+# KEYS: the buckets. ARGV: rate (tokens/s), cost, then the capacity of each
+# bucket. Returns {allowed, seconds to wait, index of the first empty bucket}.
+_TOKEN_BUCKET_LUA = """
+local rate = tonumber(ARGV[1])
+local cost = tonumber(ARGV[2])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local levels = {}
+local wait = 0
+local blocked = 0
+for i, key in ipairs(KEYS) do
+    local burst = tonumber(ARGV[i + 2])
+    local state = redis.call('HMGET', key, 'tokens', 'at')
+    local tokens = tonumber(state[1]) or burst
+    local at = tonumber(state[2]) or now
+    tokens = math.min(burst, tokens + math.max(0, now - at) * rate)
+    if tokens < cost then
+        wait = math.max(wait, (cost - tokens) / rate)
+        if blocked == 0 then blocked = i end
+    end
+    levels[i] = tokens
+end
+for i, key in ipairs(KEYS) do
+    local tokens = levels[i]
+    if blocked == 0 then tokens = tokens - cost end
+    redis.call('HSET', key, 'tokens', tostring(tokens), 'at', tostring(now))
+    redis.call('PEXPIRE', key, math.ceil((tonumber(ARGV[i + 2]) - tokens) / rate * 1000) + 1000)
+end
+return {blocked == 0 and 1 or 0, tostring(wait), blocked}
+"""
+
+_local_lock = threading.Lock()
+
+
+def parse_rate(rate):
+    """
+    Parse a rate such as ``'10/min'`` or ``'2/s'``.
+
+    Returns:
+        float or None: Tokens per second; None for an empty rate (scope not throttled)
+    """
+    if not rate:
+        return None
+    count, period = rate.split('/')
+    return int(count) / PERIODS[period.strip()[0]]
+
+
+def _cache():
+    return caches[getattr(settings, 'THROTTLE_CACHE', 'default')]
+
+
+def _scope_settings(scope):
+    """(tokens per second, burst) of ``scope``, or None when it isn't throttled"""
+    rate = parse_rate(getattr(settings, 'THROTTLE_RATES', {}).get(scope))
+    if not rate:
+        return None
+    burst = getattr(settings, 'THROTTLE_BURSTS', {}).get(scope) or 1
+    return rate, max(burst, 1)
+
+
+def client_identities(request, user_id=None):
+    """
+    The identities a request is charged to, most specific first.
+
+    Returns:
+        list: (kind, value) pairs; kind is 'user', 'session' or 'ip'
+    """
+    identities = []
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        identities.append(('user', f'auth:{user.pk}'))
+    elif user_id:
+        identities.append(('user', str(user_id)[:128]))
+    # The browser's anonymous id cookie, if it has one already
+    anonymous_id = anonymous.get_anonymous_id(request, create=False)
+    if anonymous_id:
+        identities.append(('session', anonymous_id))
+    identities.append(('ip', BaseThrottle().get_ident(request)))
+    return identities
+
+
+def _consume_redis(cache, keys, rate, bursts, cost):
+    client = cache._cache.get_client(keys[0], write=True)
+    script = client.register_script(_TOKEN_BUCKET_LUA)
+    allowed, wait, blocked = script(keys=keys, args=[rate, cost, *bursts], client=client)
+    return bool(allowed), float(wait), int(blocked) - 1
+
+
+def _consume_local(cache, keys, rate, bursts, cost):
+    now = time.time()
+    with _local_lock:
+        states = cache.get_many(keys)
+        levels = []
+        wait, blocked = 0.0, -1
+        for index, (key, burst) in enumerate(zip(keys, bursts)):
+            tokens, at = states.get(key, (burst, now))
+            tokens = min(burst, tokens + max(0.0, now - at) * rate)
+            if tokens < cost:
+                wait = max(wait, (cost - tokens) / rate)
+                if blocked < 0:
+                    blocked = index
+            levels.append(tokens)
+        for key, burst, tokens in zip(keys, bursts, levels):
+            if blocked < 0:
+                tokens -= cost
+            cache.set(key, (tokens, now), math.ceil((burst - tokens) / rate) + 1)
+    return blocked < 0, wait, blocked
+
+
+def consume(scope, identities, cost=1):
+    """
+    Take ``cost`` tokens from each identity's bucket for ``scope``, or from
+    none if any of them is short.
+
+    Returns:
+        tuple: (allowed, retry_after seconds, kind of the identity that ran out or None)
+    """
+    scope_settings = _scope_settings(scope)
+    if scope_settings is None:
+        return True, 0, None
+    rate, burst = scope_settings
+    ip_burst = burst * getattr(settings, 'THROTTLE_IP_MULTIPLIER', 1)
+    cache = _cache()
+    keys = [f'{KEY_PREFIX}:{scope}:{kind}:{value}' for kind, value in identities]
+    bursts = [ip_burst if kind == 'ip' else burst for kind, _ in identities]
+
+    from django.core.cache.backends.redis import RedisCache
+    if isinstance(cache, RedisCache):
+        keys = [cache.make_and_validate_key(key) for key in keys]
+        allowed, wait, blocked = _consume_redis(cache, keys, rate, bursts, cost)
+    else:
+        allowed, wait, blocked = _consume_local(cache, keys, rate, bursts, cost)
+
+    if allowed:
+        THROTTLE_DECISIONS.labels(scope=scope, outcome='allowed', identity='').inc()
+        return True, 0, None
+    kind = identities[blocked][0]
+    THROTTLE_DECISIONS.labels(scope=scope, outcome='throttled', identity=kind).inc()
+    return False, max(1, math.ceil(wait)), kind
+
+
+def check(request, scope, user_id=None):
+    """
+    Charge ``request`` to its client's buckets for ``scope``.
+
+    Returns:
+        int or None: None if the request may go ahead, otherwise the seconds
+        to wait before retrying
+    """
+    try:
+        allowed, wait, kind = consume(scope, client_identities(request, user_id))
+    except Exception:
+        # A cache outage must not take the chat endpoints down with it
+        logger.exception("Throttle check failed; letting the request through")
+        return None
+    if allowed:
+        return None
+    logger.info(f"Throttled {scope} request by {kind} bucket; retry in {wait}s")
+    return wait
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """DRF throttle over the token buckets of ``scope``"""
+    scope = None
+
+    def get_user_id(self, request, view):
+        """The client-supplied user id, if the view takes one"""
+        return None
+
+    def allow_request(self, request, view):
+        if request.method == 'OPTIONS':
+            return True
+        self.retry_after = check(request, self.scope, self.get_user_id(request, view))
+        return self.retry_after is None
+
+    def wait(self):
+        return self.retry_after
+
+
+class LLMThrottle(TokenBucketThrottle):
+    scope = LLM
+
+    def get_user_id(self, request, view):
+        if request.method != 'POST':
+            return None
+        try:
+            return request.data.get('user_id')
+        except Exception:  # unparseable body; the view reports it
+            return None
+
+
+class HistoryThrottle(TokenBucketThrottle):
+    scope = HISTORY
+
+    def get_user_id(self, request, view):
+        return view.kwargs.get('user_id') or request.query_params.get('user_id')
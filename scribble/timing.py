@@ -0,0 +1,76 @@
+"""
+Lightweight tracing for the chat request path.
+
+Code on the hot path wraps each stage (retrieval, prompt building, LLM call,
+memory updates, DB writes) in a ``stage()`` span. Every span is observed in
+the ``scribble_stage_duration_seconds`` histogram; while a ``collect()``
+block is active in the same context (a request, via MetricsMiddleware, or a
+benchmark run) the durations are also gathered per request for the
+Server-Timing header and benchmark reports.
+"""
+import resource
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from .metrics import STAGE_ERRORS, STAGE_SECONDS
+
+_timings = ContextVar('stage_timings', default=None)
+
+
+@contextmanager
+def collect():
+    """
+    Record stage timings for the code run inside the block.
+
+    Yields:
+        dict: Stage name -> total milliseconds, filled in as stages finish
+    """
+    timings = {}
+    token = _timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _timings.reset(token)
+
+
+@contextmanager
+def stage(name):
+    """Time a stage, adding to any earlier time recorded under the same name"""
+    timings = _timings.get()
+    started = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        STAGE_ERRORS.labels(stage=name).inc()
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_SECONDS.labels(stage=name).observe(elapsed)
+        if timings is not None:
+            timings[name] = timings.get(name, 0.0) + elapsed * 1000
+
+
+def server_timing(timings, total_ms=None):
+    """Format collected timings as a Server-Timing header value"""
+    entries = [f'{name};dur={duration:.1f}' for name, duration in timings.items()]
+    if total_ms is not None:
+        entries.append(f'total;dur={total_ms:.1f}')
+    return ', '.join(entries)
+
+
+def rss_mb():
+    """Current resident set size in MB (peak RSS where /proc isn't available)"""
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmRSS:'):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return peak_rss_mb()
+
+
+def peak_rss_mb():
+    # ru_maxrss is KB on Linux
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
@@ -0,0 +1,347 @@
+"""
+Per-document deletion for the FAISS knowledge base index.
+
+Every indexed chunk carries the SHA-256 of its source file as ``file_hash``
+metadata (see fingerprints), the same value as
+``KnowledgeDocument.content_hash``. Deleting a document only records that
+hash in a tombstone file next to the index, so deleting or replacing one
+document takes milliseconds whatever the size of the index. Searches skip
+tombstoned chunks through a metadata filter (``search_filter()``).
+
+A chunk found in several documents is indexed once, under the first
+document's hash; ``shared.json`` records the other documents that contain
+it. Before a document is tombstoned, ``rehome()`` hands its shared chunks
+over to one of those documents, so deleting it doesn't take passages the
+remaining documents still contain out of search.
+
+Compaction removes the tombstoned vectors from the index with
+``remove_ids`` and rewrites it. It runs in a background thread once
+VECTORSTORE_COMPACT_AFTER documents have been deleted, from the
+``compact_vectorstore`` command, and as part of any ingest that rewrites
+the index anyway.
+"""
+import json
+import logging
+import os
+import pickle
+import shutil
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+TOMBSTONE_FILE = 'deleted.json'
+SHARED_FILE = 'shared.json'
+LOCK_FILE = '.write.lock'
+
+_write_lock = threading.RLock()
+_held = threading.local()
+_compacting = threading.Lock()
+_cache = {}
+
+
+@contextmanager
+def store_lock(store_path):
+    """
+    Serialize index and tombstone rewrites (ingest, compaction, deletes)
+    across threads and worker processes, so one writer can't save over
+    another's changes. A thread already holding the lock can take it again.
+    """
+    os.makedirs(store_path, exist_ok=True)
+    with _write_lock:
+        if getattr(_held, 'depth', 0):
+            _held.depth += 1
+            try:
+                yield
+            finally:
+                _held.depth -= 1
+            return
+        with open(os.path.join(store_path, LOCK_FILE), 'w') as lock_file:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            _held.depth = 1
+            try:
+                yield
+            finally:
+                _held.depth = 0
+                if fcntl:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _tombstone_path(store_path):
+    return os.path.join(store_path, TOMBSTONE_FILE)
+
+
+def deleted_hashes(store_path):
+    """File hashes deleted from the store since it was last compacted"""
+    path = _tombstone_path(store_path)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return frozenset()
+    cached = _cache.get(path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    hashes = _read_tombstones(path)
+    _cache[path] = (mtime, hashes)
+    return hashes
+
+
+def _read_tombstones(path):
+    try:
+        with open(path) as f:
+            return frozenset(json.load(f).get('file_hashes', []))
+    except FileNotFoundError:
+        return frozenset()
+    except (OSError, ValueError) as e:
+        logger.error(f"Unreadable tombstone file {path}: {e}")
+        return frozenset()
+
+
+def _write_tombstones(store_path, hashes):
+    os.makedirs(store_path, exist_ok=True)
+    path = _tombstone_path(store_path)
+    if not hashes:
+        if os.path.exists(path):
+            os.remove(path)
+        return
+    # Write then rename, so readers never see a partial file
+    fd, tmp_path = tempfile.mkstemp(dir=store_path, prefix='.deleted-')
+    with os.fdopen(fd, 'w') as f:
+        json.dump({'file_hashes': sorted(hashes), 'updated_at': time.time()}, f)
+    os.replace(tmp_path, path)
+
+
+def _read_shared(store_path):
+    try:
+        with open(os.path.join(store_path, SHARED_FILE)) as f:
+            return {chunk_hash: set(file_hashes) for chunk_hash, file_hashes in json.load(f).items()}
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        logger.error(f"Unreadable shared chunk file in {store_path}: {e}")
+        return {}
+
+
+def _replace_file(store_path, name, write, mode='w'):
+    """Write ``name`` in ``store_path`` through a temporary file and a rename"""
+    fd, tmp_path = tempfile.mkstemp(dir=store_path, prefix=f'.{name}-')
+    try:
+        with os.fdopen(fd, mode) as f:
+            write(f)
+        os.replace(tmp_path, os.path.join(store_path, name))
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def _write_shared(store_path, shared):
+    data = {chunk_hash: sorted(file_hashes) for chunk_hash, file_hashes in shared.items() if file_hashes}
+    _replace_file(store_path, SHARED_FILE, lambda f: json.dump(data, f))
+
+
+def record_shared(store_path, shared):
+    """
+    Remember which other files contain chunks that were indexed under an
+    earlier file (``Fingerprints.shared``). Call once the index is saved.
+    """
+    if not shared:
+        return
+    with store_lock(store_path):
+        current = _read_shared(store_path)
+        for chunk_hash, file_hashes in shared.items():
+            current.setdefault(chunk_hash, set()).update(file_hashes)
+        _write_shared(store_path, current)
+
+
+def rehome(store_path, file_hash):
+    """
+    Move the chunks indexed under ``file_hash`` that other, undeleted files
+    also contain to one of those files, so tombstoning ``file_hash`` keeps
+    them searchable. Only the docstore metadata is rewritten; the vectors
+    stay where they are.
+
+    Returns:
+        int: Number of chunks moved
+    """
+    from .fingerprints import chunk_fingerprint
+
+    with store_lock(store_path):
+        shared = _read_shared(store_path)
+        if not shared:
+            return 0
+        docstore_file = os.path.join(store_path, 'index.pkl')
+        moved = 0
+        if os.path.exists(docstore_file):
+            deleted = _read_tombstones(_tombstone_path(store_path)) | {file_hash}
+            # Same trust as FAISS.load_local(allow_dangerous_deserialization=True)
+            with open(docstore_file, 'rb') as f:
+                docstore, index_to_docstore_id = pickle.load(f)
+            for document in docstore._dict.values():
+                if document.metadata.get('file_hash') != file_hash:
+                    continue
+                chunk_hash = document.metadata.get('chunk_hash') or chunk_fingerprint(document.page_content)
+                holders = shared.get(chunk_hash, set()) - deleted
+                if holders:
+                    owner = min(holders)
+                    document.metadata['file_hash'] = owner
+                    shared[chunk_hash].discard(owner)
+                    moved += 1
+            if moved:
+                _replace_file(store_path, 'index.pkl',
+                              lambda f: pickle.dump((docstore, index_to_docstore_id), f), mode='wb')
+                # Loaded copies of the store and cached searches follow the index mtime
+                os.utime(os.path.join(store_path, 'index.faiss'))
+        for file_hashes in shared.values():
+            file_hashes.discard(file_hash)
+        _write_shared(store_path, shared)
+    if moved:
+        logger.info(f"Moved {moved} shared chunks of {file_hash} to the documents that still contain them")
+    return moved
+
+
+def mark_deleted(store_path, file_hash):
+    """
+    Tombstone a document's chunks.
+
+    Returns:
+        int: Number of documents now waiting for compaction
+    """
+    # Under the store lock, so a delete in another worker or a compaction
+    # can't write back a set that is missing this tombstone
+    with store_lock(store_path):
+        hashes = set(_read_tombstones(_tombstone_path(store_path)))
+        hashes.add(file_hash)
+        _write_tombstones(store_path, hashes)
+    return len(hashes)
+
+
+def clear_tombstones(store_path, file_hashes):
+    """Forget tombstones whose vectors have been removed from the index"""
+    with store_lock(store_path):
+        hashes = set(_read_tombstones(_tombstone_path(store_path))) - set(file_hashes)
+        _write_tombstones(store_path, hashes)
+
+
+def search_filter(store_path):
+    """
+    Metadata filter for FAISS searches that hides deleted documents, or None
+    when nothing is waiting for compaction (the unfiltered search is faster).
+    """
+    hashes = deleted_hashes(store_path)
+    if not hashes:
+        return None
+    return lambda metadata: metadata.get('file_hash') not in hashes
+
+
+def remove_documents(vectorstore, file_hashes):
+    """
+    Remove every vector whose chunk came from one of ``file_hashes``.
+
+    Returns:
+        int: Number of vectors removed
+    """
+    file_hashes = set(file_hashes)
+    ids = [
+        docstore_id for docstore_id in vectorstore.index_to_docstore_id.values()
+        if vectorstore.docstore.search(docstore_id).metadata.get('file_hash') in file_hashes
+    ]
+    if ids:
+        vectorstore.delete(ids)
+    return len(ids)
+
+
+def purge_deleted(vectorstore, store_path):
+    """
+    Remove tombstoned vectors from a loaded store before it is saved over
+    ``store_path``. Call clear_tombstones() with the returned hashes once the
+    store has been saved.
+    """
+    hashes = deleted_hashes(store_path)
+    if hashes:
+        removed = remove_documents(vectorstore, hashes)
+        logger.info(f"Removed {removed} vectors of {len(hashes)} deleted documents")
+    return hashes
+
+
+def save_atomic(vectorstore, store_path):
+    """Save a store beside ``store_path`` and swap the files in"""
+    os.makedirs(store_path, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(dir=store_path, prefix='.compact-')
+    try:
+        vectorstore.save_local(tmp_dir)
+        # index.pkl first: a reader that sees the new index.faiss with the old
+        # docstore could map vector positions to the wrong chunks
+        for name in ('index.pkl', 'index.faiss'):
+            os.replace(os.path.join(tmp_dir, name), os.path.join(store_path, name))
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def compact(store_path, embeddings):
+    """
+    Remove tombstoned vectors from the saved index and rewrite it.
+
+    Returns:
+        dict: Documents and vectors removed, vectors left and seconds taken
+    """
+    from langchain_community.vectorstores import FAISS
+
+    started = time.perf_counter()
+    with store_lock(store_path):
+        hashes = deleted_hashes(store_path)
+        if not hashes or not os.path.exists(os.path.join(store_path, 'index.faiss')):
+            return {'documents': 0, 'vectors_removed': 0, 'vectors': None, 'seconds': 0.0}
+
+        vectorstore = FAISS.load_local(store_path, embeddings, allow_dangerous_deserialization=True)
+        removed = remove_documents(vectorstore, hashes)
+        save_atomic(vectorstore, store_path)
+        clear_tombstones(store_path, hashes)
+    elapsed = time.perf_counter() - started
+    logger.info(f"Compacted {store_path}: removed {removed} vectors of {len(hashes)} documents "
+                f"in {elapsed:.2f}s, {vectorstore.index.ntotal} left")
+    return {
+        'documents': len(hashes),
+        'vectors_removed': removed,
+        'vectors': vectorstore.index.ntotal,
+        'seconds': round(elapsed, 3),
+    }
+
+
+def compact_in_background(store_path, embeddings_factory):
+    """
+    Start compaction in a daemon thread unless one is already running.
+
+    Returns:
+        bool: Whether a compaction was started
+    """
+    if not _compacting.acquire(blocking=False):
+        return False
+
+    def run():
+        try:
+            compact(store_path, embeddings_factory())
+        except Exception:
+            logger.exception(f"Background compaction of {store_path} failed")
+        finally:
+            _compacting.release()
+
+    threading.Thread(target=run, name='vectorstore-compact', daemon=True).start()
+    return True
+
+
+def maybe_compact(store_path, pending, embeddings_factory):
+    """Compact in the background once enough deletions have piled up"""
+    threshold = getattr(settings, 'VECTORSTORE_COMPACT_AFTER', 10)
+    if threshold and pending >= threshold:
+        return compact_in_background(store_path, embeddings_factory)
+    return False
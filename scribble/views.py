@@ -1,6 +1,7 @@
 import json
 import os
 import logging
+import threading
 
 # Set up logging
 logger = logging.getLogger(__name__)
@@ -11,12 +12,13 @@ from django.contrib.auth.decorators import login_required, user_passes_test
 from django.views.generic import TemplateView
 from django.utils.decorators import method_decorator
 from django.contrib.admin.views.decorators import staff_member_required
-from langchain_community.vectorstores import FAISS
-from langchain_huggingface import HuggingFaceEmbeddings
-from .ingest import load_documents, chunk_documents, create_or_update_vector_store
+from django.utils import timezone
 from .models import KnowledgeDocument, Conversation, Message
-from .llm_utils import get_chat_completion
+from . import anonymous, llm_governor, retrieval, throttling
+from .connections import release_connection
 from .memory_system import MemorySystem
+from .persistence import persist_turn
+from .timing import stage
 from dotenv import load_dotenv
 from pathlib import Path
 
@@ -37,52 +39,87 @@ os.makedirs(VECTOR_STORE_PATH, exist_ok=True)
 
 # Initialize vector store as None - it will be loaded when needed
 vectorstore = None
+# index.faiss mtime when vectorstore was loaded, to pick up rewrites by
+# ingest or compaction in other processes
+vectorstore_mtime = None
+# Requests run on several threads per worker (gthread); loads happen once,
+# under this lock, while reads of an already loaded model or store don't wait
+_load_lock = threading.RLock()
 
 def get_embeddings():
+    """The shared embeddings model, with the query embedding cache in front"""
     global embeddings
     if embeddings is None:
-        embeddings = HuggingFaceEmbeddings(model_name=MODEL_NAME)
+        with _load_lock:
+            if embeddings is None:
+                from .embedding_cache import get_query_embeddings
+                embeddings = get_query_embeddings()
     return embeddings
 
+def _index_mtime():
+    try:
+        return os.stat(os.path.join(VECTOR_STORE_PATH, 'index.faiss')).st_mtime_ns
+    except OSError:
+        return None
+
+def set_vector_store(store, mtime=None):
+    """
+    Serve ``store`` until the index under VECTOR_STORE_PATH is rewritten.
+    Pass the index mtime read before loading ``store``, so a rewrite during
+    the load isn't mistaken for the loaded version.
+    """
+    global vectorstore, vectorstore_mtime
+    with _load_lock:
+        vectorstore, vectorstore_mtime = store, mtime if mtime is not None else _index_mtime()
+    return store
+
 def get_vector_store():
-    """Lazily load the vector store when needed"""
-    global vectorstore
-    if vectorstore is not None:
-        return vectorstore
-        
-    # Get embeddings (will be loaded if not already)
-    embeddings = get_embeddings()
+    """Lazily load the vector store when needed, reloading it if the saved index changed"""
+    store = vectorstore
+    if store is not None and _index_mtime() == vectorstore_mtime:
+        return store
     
-    # Check if vector store exists and has the required files
-    if os.path.exists(VECTOR_STORE_PATH):
-        required_files = ['index.faiss', 'index.pkl']
-        has_all_files = all(os.path.exists(os.path.join(VECTOR_STORE_PATH, f)) for f in required_files)
+    with _load_lock:
+        # Another thread may have loaded it while this one waited
+        mtime = _index_mtime()
+        if vectorstore is not None and mtime == vectorstore_mtime:
+            return vectorstore
         
-        if has_all_files:
-            try:
-                vectorstore = FAISS.load_local(
-                    VECTOR_STORE_PATH,
-                    embeddings,
-                    allow_dangerous_deserialization=True
-                )
-                return vectorstore
-            except Exception as e:
-                print(f"Error loading vector store: {e}")
-    
-    # If we get here, either the vector store doesn't exist or failed to load
-    # Create a new, empty vector store
-    vectorstore = FAISS.from_texts(
-        ["Initial document"],  # Add an initial document
-        embedding=embeddings
-    )
-    vectorstore.save_local(VECTOR_STORE_PATH)
-    return vectorstore
+        from langchain_community.vectorstores import FAISS
+            
+        # Get embeddings (will be loaded if not already)
+        embeddings = get_embeddings()
+        
+        # Check if vector store exists and has the required files
+        if os.path.exists(VECTOR_STORE_PATH):
+            required_files = ['index.faiss', 'index.pkl']
+            has_all_files = all(os.path.exists(os.path.join(VECTOR_STORE_PATH, f)) for f in required_files)
+            
+            if has_all_files:
+                try:
+                    return set_vector_store(FAISS.load_local(
+                        VECTOR_STORE_PATH,
+                        embeddings,
+                        allow_dangerous_deserialization=True
+                    ), mtime)
+                except Exception as e:
+                    logger.error(f"Error loading vector store: {e}")
+        
+        # If we get here, either the vector store doesn't exist or failed to load
+        # Create a new, empty vector store
+        store = FAISS.from_texts(
+            ["Initial document"],  # Add an initial document
+            embedding=embeddings
+        )
+        store.save_local(VECTOR_STORE_PATH)
+        return set_vector_store(store)
 
 def get_memory_system(request: HttpRequest) -> MemorySystem:
-    """Get or create memory system for the current session"""
+    """Get or create memory system for the current visitor"""
     if not hasattr(request, 'memory_system'):
-        session_id = request.session.session_key or request.session.create()
-        request.memory_system = MemorySystem(session_id=session_id)
+        # Keyed by the signed anonymous id cookie; creating a Django session
+        # here would write a django_session row for every new visitor
+        request.memory_system = MemorySystem(session_id=anonymous.get_anonymous_id(request))
     return request.memory_system
 
 @csrf_exempt
@@ -180,6 +217,13 @@ class ChatView(View):
         return super().dispatch(request, *args, **kwargs)
 
     def post(self, request, *args, **kwargs):
+        retry_after = throttling.check(request, throttling.LLM)
+        if retry_after is not None:
+            response = JsonResponse({'error': 'Too many messages, please slow down', 'status': 'throttled',
+                                     'retry_after': retry_after}, status=429)
+            response['Retry-After'] = str(retry_after)
+            return response
+
         try:
             data = json.loads(request.body)
             user_message = data.get('message', '').strip()
@@ -197,27 +241,21 @@ class ChatView(View):
                 except (Conversation.DoesNotExist, ValueError):
                     return JsonResponse({'error': 'Invalid conversation ID'}, status=400)
             else:
-                # For new conversations, create with session key or IP as fallback
-                session_key = None
-                if hasattr(request, 'session') and request.session.session_key:
-                    session_key = request.session.session_key
-                else:
-                    # Generate a unique identifier from IP and timestamp if no session
-                    ip = request.META.get('REMOTE_ADDR', '0.0.0.0')
-                    import time
-                    session_key = f'anon_{ip}_{int(time.time())}'
-                
-                conversation = Conversation.objects.create(
+                # New conversations are tied to the visitor's anonymous id.
+                # Saved together with the first messages by persist_turn()
+                conversation = Conversation(
                     user=request.user if request.user.is_authenticated else None,
-                    session_key=session_key,
+                    session_key=anonymous.get_anonymous_id(request),
                     status='pending_ai'  # New conversation starts with AI response
                 )
             
-            # Save user message
-            user_msg = Message.objects.create(
+            # Build the user message now so its timestamp reflects when it was
+            # received; it is saved with the rest of the turn
+            user_msg = Message(
                 conversation=conversation,
                 content=user_message,
-                sender='user'
+                sender='user',
+                created_at=timezone.now()
             )
             
             # Check if this is an admin reply
@@ -225,7 +263,7 @@ class ChatView(View):
             if is_admin_reply and is_admin:
                 # Admin is replying, no need for AI response
                 conversation.status = 'admin_responded'
-                conversation.save()
+                persist_turn(conversation, [user_msg], conversation_fields=['status'])
                 
                 # Just return the user message for the admin to see
                 return JsonResponse({
@@ -236,6 +274,7 @@ class ChatView(View):
             
             # If conversation is waiting for admin, don't generate AI response
             if conversation.status == 'awaiting_admin':
+                persist_turn(conversation, [user_msg])
                 return JsonResponse({
                     'status': 'awaiting_admin_response',
                     'message': 'Your previous message is being reviewed by our team. Please wait for a response.',
@@ -246,7 +285,8 @@ class ChatView(View):
             from .llm_utils import get_chat_completion
             
             # Try to get the vector store
-            vectorstore = get_vector_store()
+            with stage('vectorstore_load'):
+                vectorstore = get_vector_store()
             
             if vectorstore is None:
                 # Check if knowledge base directory exists and has files
@@ -275,15 +315,9 @@ class ChatView(View):
                     vector_store = get_vector_store()
                     try:
                         # Search for relevant document chunks
-                        docs = vector_store.similarity_search(user_message, k=3)
-                        
-                        # Prepare context with source information
-                        context_parts = []
-                        for i, doc in enumerate(docs, 1):
-                            source = getattr(doc, 'metadata', {}).get('source', 'document')
-                            context_parts.append(f"--- Source {i} ({source}) ---\n{doc.page_content}")
-                        
-                        context = "\n\n".join(context_parts)
+                        docs = [
+                            doc for doc, _ in retrieval.search(vector_store, user_message, 3, VECTOR_STORE_PATH)
+                        ]
                         
                         # System prompt for the AI with RAG instructions
                         system_prompt = """You are Uche, the AI assistant for Scribble in Time. Your responses should be:
@@ -305,12 +339,22 @@ class ChatView(View):
                         }
                         """
                         
-                        messages = [
-                            {"role": "system", "content": system_prompt},
-                            {"role": "user", "content": f"CONTEXT FROM DOCUMENTS:\n{context}\n\nQUESTION: {user_message}\n\nAnswer based ONLY on the context above. If the answer isn't there, say so."}
-                        ]
+                        # Prepare the context with source information and the messages
+                        with stage('prompt_build'):
+                            context_parts = []
+                            for i, doc in enumerate(docs, 1):
+                                source = getattr(doc, 'metadata', {}).get('source', 'document')
+                                context_parts.append(f"--- Source {i} ({source}) ---\n{doc.page_content}")
+                            
+                            context = "\n\n".join(context_parts)
+                            
+                            messages = [
+                                {"role": "system", "content": system_prompt},
+                                {"role": "user", "content": f"CONTEXT FROM DOCUMENTS:\n{context}\n\nQUESTION: {user_message}\n\nAnswer based ONLY on the context above. If the answer isn't there, say so."}
+                            ]
                     except Exception as e:
                         logger.error(f"Error retrieving document context: {str(e)}")
+                        persist_turn(conversation, [user_msg])
                         return JsonResponse({
                             'error': 'Error retrieving document context. Please try again.',
                             'status': 'error'
@@ -318,7 +362,15 @@ class ChatView(View):
                     
                     # Use the synchronous version of get_chat_completion
                     from .llm_utils import get_chat_completion_sync
-                    response = get_chat_completion_sync(messages, response_format={ "type": "json_object" })
+                    release_connection()
+                    # Signed-in users and returning conversations are served
+                    # first when the LLM is at capacity
+                    returning = request.user.is_authenticated or conversation.pk is not None
+                    with stage('llm'):
+                        response = get_chat_completion_sync(
+                            messages, response_format={ "type": "json_object" },
+                            priority=llm_governor.HIGH if returning else llm_governor.NORMAL
+                        )
                     
                     if response['success']:
                         try:
@@ -331,7 +383,6 @@ class ChatView(View):
                             # Update conversation status if admin review is needed
                             if needs_admin_review or confidence < 0.5:  # Threshold for admin review
                                 conversation.status = 'awaiting_admin'
-                                conversation.save()
                                 ai_response += "\n\n[Your question has been escalated to our support team for further assistance.]"
                             
                         except json.JSONDecodeError:
@@ -340,25 +391,30 @@ class ChatView(View):
                     else:
                         ai_response = "I'm having trouble generating a response right now. Please try again in a moment."
                     
+                except llm_governor.LLMOverloaded:
+                    raise
                 except Exception as e:
                     import traceback
                     logger.error(f"Error in chat view: {str(e)}\n{traceback.format_exc()}")
                     ai_response = "I encountered an error while processing your request. Please try again."
             
             # Update memory system
-            memory_system = get_memory_system(request)
-            memory_system.add_episodic_memory('user', user_message)
+            with stage('memory'):
+                memory_system = get_memory_system(request)
+                memory_system.add_episodic_memory('user', user_message)
+                if 'ai_response' in locals():
+                    memory_system.add_episodic_memory('assistant', ai_response)
             
-            # Save AI response if we have one
+            # Save the user message, the AI response if we have one and the
+            # conversation status in a single transaction
+            turn_messages = [user_msg]
             if 'ai_response' in locals():
-                memory_system.add_episodic_memory('assistant', ai_response)
-                
-                # Save AI response to database
-                Message.objects.create(
+                turn_messages.append(Message(
                     conversation=conversation,
                     content=ai_response,
                     sender='ai'
-                )
+                ))
+            persist_turn(conversation, turn_messages, conversation_fields=['status'])
             
             # Prepare response data
             response_data = {
@@ -376,6 +432,12 @@ class ChatView(View):
             
         except json.JSONDecodeError:
             return JsonResponse({'error': 'Invalid JSON'}, status=400)
+        
+        except llm_governor.LLMOverloaded as e:
+            # Shed before anything is saved, so the client can simply retry
+            response = JsonResponse({'error': str(e), 'status': 'overloaded', 'retry_after': e.retry_after}, status=503)
+            response['Retry-After'] = str(e.retry_after)
+            return response
             
             response = JsonResponse(response_data)
             response['Access-Control-Allow-Origin'] = '*'
@@ -45,6 +45,10 @@ OPENROUTER_API_KEY = os.getenv('OPENROUTER_API_KEY', '')
 # Model configuration
 OPENROUTER_MODEL = os.getenv('OPENROUTER_MODEL', 'meta-llama/llama-3.3-70b-instruct:free')
 
+# OpenAI-compatible API base URL. Point it at a local stand-in (see the
+# fake_llm_server command) to load-test without spending OpenRouter credits.
+OPENROUTER_BASE_URL = os.getenv('OPENROUTER_BASE_URL', 'https://openrouter.ai/api/v1')
+
 # System message for the AI
 AI_SYSTEM_MESSAGE = """You are Uche, the owner and founder of Scribble in Time. You're speaking directly to your customers and potential clients.
 
@@ -181,6 +185,7 @@ class DisableCSRFForAPI:
         return response
 
 MIDDLEWARE = [
+    'scribble.middleware.MetricsMiddleware',  # First, so it times the whole stack
     'django.middleware.security.SecurityMiddleware',
     'corsheaders.middleware.CorsMiddleware',  # Should be as high as possible
     'whitenoise.middleware.WhiteNoiseMiddleware',
@@ -188,11 +193,126 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',  # Keep but will be bypassed by our middleware
     'django.contrib.auth.middleware.AuthenticationMiddleware',  # Required for admin
+    'scribble.middleware.AnonymousIdMiddleware',  # Sets the chat visitor id cookie
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'scribbleintimeai.settings.DisableCSRFForAPI',  # This will disable CSRF for all requests
 ]
 
+# Metrics and tracing
+# Per-request stage breakdown (embed, search, llm, ...) in a Server-Timing header
+SERVER_TIMING_HEADER = os.getenv('SERVER_TIMING_HEADER', str(DEBUG)).lower() == 'true'
+# When set, /metrics requires "Authorization: Bearer <token>"
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
+# Knowledge base index
+# Deleted documents are hidden from searches at once; their vectors are
+# removed by a background compaction once this many deletions are pending
+VECTORSTORE_COMPACT_AFTER = int(os.getenv('VECTORSTORE_COMPACT_AFTER', '10'))
+
+# Caches
+# Retrieval results (chunk ids per normalized query and index generation) are
+# shared by all workers: in Redis when REDIS_URL is set (needs the redis
+# package), otherwise in files on local disk. 0 disables the cache.
+RETRIEVAL_CACHE_TTL = int(os.getenv('RETRIEVAL_CACHE_TTL', '3600'))
+RETRIEVAL_CACHE_MAX_ENTRIES = int(os.getenv('RETRIEVAL_CACHE_MAX_ENTRIES', '5000'))
+# Per-process LRU of query embeddings, capped in bytes (MiniLM: ~1.5 KB per
+# query). Set QUERY_EMBEDDING_SHARED_CACHE to a cache alias, e.g. retrieval,
+# to share embeddings between workers as well.
+QUERY_EMBEDDING_CACHE_BYTES = int(os.getenv('QUERY_EMBEDDING_CACHE_BYTES', str(16 * 1024 * 1024)))
+QUERY_EMBEDDING_SHARED_CACHE = os.getenv('QUERY_EMBEDDING_SHARED_CACHE', '')
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'retrieval': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.getenv('REDIS_URL'),
+        'TIMEOUT': RETRIEVAL_CACHE_TTL,
+        'KEY_PREFIX': 'scribble',
+    } if os.getenv('REDIS_URL') else {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(BASE_DIR, '.cache', 'retrieval'),
+        'TIMEOUT': RETRIEVAL_CACHE_TTL,
+        'OPTIONS': {'MAX_ENTRIES': RETRIEVAL_CACHE_MAX_ENTRIES},
+    },
+}
+
+# Boot budget: django.setup() plus the URLconf, checked by the benchmark_boot
+# command and the test suite. The ML stack must stay out of boot entirely.
+BOOT_TIME_BUDGET_SECONDS = float(os.getenv('BOOT_TIME_BUDGET_SECONDS', '2.0'))
+BOOT_RSS_BUDGET_MB = float(os.getenv('BOOT_RSS_BUDGET_MB', '100'))
+
+# Container startup (scribble/startup.py). Gunicorn workers load the embedding
+# model and FAISS index before accepting requests, and /api/health/ready/
+# returns 503 until they have. STARTUP_DB_TIMEOUT is how long docker_start.py
+# keeps retrying the database before giving up. A failing warm-up is retried
+# with backoff STARTUP_WARMUP_ATTEMPTS times, then again from the readiness
+# probe every STARTUP_WARMUP_RETRY_AFTER seconds.
+STARTUP_WARMUP = os.getenv('STARTUP_WARMUP', 'True').lower() == 'true'
+STARTUP_DB_TIMEOUT = float(os.getenv('STARTUP_DB_TIMEOUT', '60'))
+STARTUP_WARMUP_ATTEMPTS = int(os.getenv('STARTUP_WARMUP_ATTEMPTS', '5'))
+STARTUP_WARMUP_RETRY_AFTER = float(os.getenv('STARTUP_WARMUP_RETRY_AFTER', '60'))
+
+# Admission control for outbound LLM calls (scribble/llm_governor.py). At most
+# LLM_MAX_CONCURRENCY calls are in flight: across all workers when REDIS_URL
+# is set, otherwise per worker process. Up to LLM_QUEUE_MAX more requests wait
+# up to LLM_QUEUE_TIMEOUT seconds for a slot; beyond that they get 503 with
+# Retry-After. Slots held by a killed worker free up after LLM_SLOT_LEASE
+# seconds. LLM_MAX_CONCURRENCY=0 turns the limit off.
+LLM_MAX_CONCURRENCY = int(os.getenv('LLM_MAX_CONCURRENCY', '64'))
+LLM_QUEUE_MAX = int(os.getenv('LLM_QUEUE_MAX', '128'))
+LLM_QUEUE_TIMEOUT = float(os.getenv('LLM_QUEUE_TIMEOUT', '15'))
+LLM_SLOT_LEASE = float(os.getenv('LLM_SLOT_LEASE', '120'))
+LLM_GOVERNOR_CACHE = 'retrieval' if os.getenv('REDIS_URL') else 'default'
+
+# Per-client token buckets for the public chat endpoints (scribble/throttling.py).
+# Each client (user id, session and IP address) gets THROTTLE_BURSTS[scope]
+# tokens, refilled at THROTTLE_RATES[scope] ("N/s", "N/min", "N/hour");
+# 'llm' covers requests that call the model, 'history' conversation and
+# message reads. IP buckets are THROTTLE_IP_MULTIPLIER times larger. An empty
+# rate turns the scope off. Behind a proxy (Railway), set NUM_PROXIES to the
+# number of proxies in front of the app so clients are told apart by the
+# X-Forwarded-For address the proxy saw, which a client can't spoof.
+THROTTLE_RATES = {
+    'llm': os.getenv('THROTTLE_LLM_RATE', '10/min'),
+    'history': os.getenv('THROTTLE_HISTORY_RATE', '120/min'),
+}
+THROTTLE_BURSTS = {
+    'llm': int(os.getenv('THROTTLE_LLM_BURST', '5')),
+    'history': int(os.getenv('THROTTLE_HISTORY_BURST', '30')),
+}
+THROTTLE_IP_MULTIPLIER = int(os.getenv('THROTTLE_IP_MULTIPLIER', '4'))
+THROTTLE_CACHE = 'retrieval' if os.getenv('REDIS_URL') else 'default'
+
+# Retention of abandoned anonymous conversations (scribble/retention.py), run
+# by the purge_conversations command, e.g. daily from a cron job. Anonymous
+# conversations untouched for RETENTION_ANONYMOUS_DAYS are deleted with their
+# messages, RETENTION_BATCH_SIZE conversations per short transaction.
+# Conversations waiting for an admin are kept. With RETENTION_ARCHIVE_DIR set,
+# they are first appended there as gzipped JSON lines. 0 days keeps everything.
+RETENTION_ANONYMOUS_DAYS = int(os.getenv('RETENTION_ANONYMOUS_DAYS', '30'))
+RETENTION_BATCH_SIZE = int(os.getenv('RETENTION_BATCH_SIZE', '500'))
+RETENTION_ARCHIVE_DIR = os.getenv('RETENTION_ARCHIVE_DIR', '')
+
+# Bulk exports (scribble/exports.py): the admin export endpoint and the
+# export_data command stream rows from a server-side cursor, fetching
+# EXPORT_CHUNK_SIZE rows at a time. zstd output needs the zstandard package.
+EXPORT_CHUNK_SIZE = int(os.getenv('EXPORT_CHUNK_SIZE', '2000'))
+
+# Cold archive (scribble/archive.py), run by the archive_conversations command:
+# closed conversations (resolved or inactive scribble ones, closed chat ones)
+# untouched for ARCHIVE_AFTER_MONTHS are moved with their messages into
+# compressed ArchivedConversation rows, ARCHIVE_BATCH_SIZE per transaction.
+# 0 months keeps everything in the message tables.
+ARCHIVE_AFTER_MONTHS = int(os.getenv('ARCHIVE_AFTER_MONTHS', '6'))
+ARCHIVE_BATCH_SIZE = int(os.getenv('ARCHIVE_BATCH_SIZE', '100'))
+# On PostgreSQL the message tables can be partitioned by month
+# (scribble/partitions.py, partition_messages command), which keeps
+# PARTITION_MONTHS_AHEAD months of empty partitions ready
+PARTITION_MONTHS_AHEAD = int(os.getenv('PARTITION_MONTHS_AHEAD', '3'))
+
 # CORS Settings (Development)
 CORS_ALLOW_ALL_ORIGINS = True  # Allow all origins in development
 CORS_ALLOW_CREDENTIALS = True
@@ -269,9 +389,45 @@ DATABASE_URL = os.getenv('DATABASE_URL')
 if DATABASE_URL:
     # Railway PostgreSQL configuration
     import dj_database_url
+    from importlib.util import find_spec
+
+    # Connection reuse. Persistent connections (with a health check before
+    # reuse) are the default; when psycopg 3 and psycopg_pool are installed a
+    # connection pool is used instead, which also suits the ASGI stack where
+    # requests run on changing threads.
+    #   DB_POOL: auto (pool if available), true (require pool) or false
+    # Without the pool each gunicorn request thread holds its own connection
+    # for up to DB_CONN_MAX_AGE seconds, so an instance can open workers *
+    # threads of them. gunicorn.conf.py sizes its default thread count to
+    # DB_MAX_CONNECTIONS (default 80, under PostgreSQL's max_connections=100);
+    # lower it when several instances share one database.
+    DB_CONN_MAX_AGE = int(os.getenv('DB_CONN_MAX_AGE', '60'))
+    DB_CONN_HEALTH_CHECKS = os.getenv('DB_CONN_HEALTH_CHECKS', 'True').lower() == 'true'
+    DB_POOL = os.getenv('DB_POOL', 'auto').lower()
+    DB_POOL_AVAILABLE = find_spec('psycopg') is not None and find_spec('psycopg_pool') is not None
+
     DATABASES = {
-        'default': dj_database_url.parse(DATABASE_URL)
+        'default': dj_database_url.parse(
+            DATABASE_URL,
+            conn_max_age=DB_CONN_MAX_AGE,
+            conn_health_checks=DB_CONN_HEALTH_CHECKS,
+        )
     }
+
+    if DB_POOL == 'true' or (DB_POOL == 'auto' and DB_POOL_AVAILABLE):
+        # Django manages pooled connections itself and refuses persistent ones
+        DATABASES['default']['CONN_MAX_AGE'] = 0
+        DATABASES['default'].setdefault('OPTIONS', {})['pool'] = {
+            'min_size': int(os.getenv('DB_POOL_MIN_SIZE', '2')),
+            'max_size': int(os.getenv('DB_POOL_MAX_SIZE', '10')),
+            'timeout': float(os.getenv('DB_POOL_TIMEOUT', '10')),
+            'max_idle': float(os.getenv('DB_POOL_MAX_IDLE', '300')),
+        }
+        if DB_CONN_HEALTH_CHECKS and DB_POOL_AVAILABLE:
+            from psycopg_pool import ConnectionPool
+            # psycopg_pool >= 3.2 can verify a connection before handing it out
+            if hasattr(ConnectionPool, 'check_connection'):
+                DATABASES['default']['OPTIONS']['pool']['check'] = ConnectionPool.check_connection
 else:
     # Local SQLite configuration
     DATABASES = {
@@ -342,12 +498,20 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.AllowAny',
     ],
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
+    # Cursor pages: no COUNT(*) or OFFSET per page (see scribble/pagination.py)
+    'DEFAULT_PAGINATION_CLASS': 'scribble.pagination.CursorPagination',
     'PAGE_SIZE': 20,
     'UNAUTHENTICATED_USER': None,  # No user authentication
-    'UNAUTHENTICATED_TOKEN': None  # No token authentication
+    'UNAUTHENTICATED_TOKEN': None,  # No token authentication
+    # Proxies in front of the app, for the client IP used by throttling
+    'NUM_PROXIES': int(os.getenv('NUM_PROXIES')) if os.getenv('NUM_PROXIES') else None,
 }
 
+# List endpoints return an estimated total only when asked (?count=1). On
+# PostgreSQL a whole table is estimated from the planner statistics; other
+# totals come from a COUNT cached for this many seconds.
+PAGINATION_COUNT_CACHE_SECONDS = int(os.getenv('PAGINATION_COUNT_CACHE_SECONDS', '60'))
+
 # CSRF settings
 CSRF_TRUSTED_ORIGINS = [
     'http://localhost:5173',
@@ -356,9 +520,13 @@ CSRF_TRUSTED_ORIGINS = [
     'http://127.0.0.1:8000',
 ]
 
-# Session settings
+# Session settings. Sessions (database-backed) are only for signed-in admin
+# users; chat visitors get a signed anonymous id cookie instead (see
+# scribble/anonymous.py), so a chat turn writes no django_session rows.
+# Expired sessions are deleted in batches by the purge_sessions command.
 SESSION_COOKIE_AGE = 1209600  # 2 weeks in seconds
-SESSION_SAVE_EVERY_REQUEST = True
+ANONYMOUS_ID_COOKIE = 'scribble_anon'
+ANONYMOUS_ID_MAX_AGE = 31536000  # 1 year in seconds
 
 # Email settings (update with your email configuration)
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'  # For development
@@ -367,6 +535,7 @@ EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'  # For developm
 # EMAIL_HOST = 'smtp.your-email-provider.com'
 SESSION_COOKIE_SECURE = False
 SESSION_COOKIE_SAMESITE = None
+# Saving every request would rewrite the session row on each admin page load
 SESSION_SAVE_EVERY_REQUEST = False
 
 # Admin site header and title
@@ -375,6 +544,8 @@ ADMIN_SITE_TITLE = 'Scribble AI Admin Portal'
 ADMIN_INDEX_TITLE = 'Welcome to Scribble AI Admin'
 if not DEBUG:
     SECURE_SSL_REDIRECT = True
+    # Platform health checks and Prometheus scrape the container over plain HTTP
+    SECURE_REDIRECT_EXEMPT = [r'^api/health/', r'^metrics$']
     SESSION_COOKIE_SECURE = True
     CSRF_COOKIE_SECURE = True
     SECURE_BROWSER_XSS_FILTER = True
@@ -9,6 +9,7 @@ from django.urls import path, include, re_path
 from django.conf import settings
 from django.conf.urls.static import static
 from django.views.generic import TemplateView, RedirectView
+from scribble.api_views import MetricsView
 
 urlpatterns = [
     # API endpoints
@@ -17,6 +18,9 @@ urlpatterns = [
     # Chat endpoints - handle with/without trailing slash
     path('api/chat/', include('chat.urls')),
     
+    # Prometheus scrape endpoint
+    path('metrics', MetricsView.as_view(), name='metrics'),
+    
     # Authentication
     path('api/auth/', include('rest_framework.urls')),
     